@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Test, Question, Submission, Payment, Announcement, PaymentReceipt, BroadcastHistory
+from .models import User, Test, Question, Submission, Payment, Announcement, PaymentReceipt, BroadcastHistory, NotificationOutbox, SubmissionIntake
 
 
 @admin.register(User)
@@ -15,11 +15,18 @@ class TestAdmin(admin.ModelAdmin):
     list_display = ['title', 'subject', 'access_code', 'creator', 'creator_name', 'is_active', 'expires_at', 'created_at']
     list_filter = ['subject', 'is_active', 'created_at', 'expires_at']
     search_fields = ['title', 'access_code', 'creator__full_name', 'creator_name']
-    readonly_fields = ['access_code', 'created_at', 'finished_at']
+    readonly_fields = ['access_code', 'created_at', 'finished_at', *Test.STATS_FIELDS]
     
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('creator')
 
+    def save_model(self, request, obj, form, change):
+        # Statistika parallel yangilanadi - faqat formada o'zgargan maydonlar yoziladi
+        if change:
+            obj.save(update_fields=form.changed_data)
+        else:
+            obj.save()
+
 
 @admin.register(Question)
 class QuestionAdmin(admin.ModelAdmin):
@@ -80,3 +87,19 @@ class BroadcastHistoryAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('admin')
+
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ['chat_id', 'kind', 'status', 'attempts', 'created_at', 'sent_at']
+    list_filter = ['status', 'kind', 'created_at']
+    search_fields = ['chat_id', 'text']
+    readonly_fields = ['created_at', 'sent_at', 'claimed_at']
+
+
+@admin.register(SubmissionIntake)
+class SubmissionIntakeAdmin(admin.ModelAdmin):
+    list_display = ['id', 'test', 'student_name', 'status', 'created_at', 'processed_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['student_name', 'student_telegram_id']
+    readonly_fields = ['created_at', 'claimed_at', 'processed_at']
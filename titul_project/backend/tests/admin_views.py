@@ -1,15 +1,21 @@
 from rest_framework import views, status, generics, parsers
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
 from decimal import Decimal
 from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.db.models import Sum, Count
 import json
 from .models import User, Test, Submission, Payment, PaymentReceipt, ActivityLog, BroadcastHistory
-from .tasks import send_broadcast_task, update_broadcast_task
+from .tasks import send_broadcast_task, update_broadcast_task, recall_broadcast_task
 from .serializers import UserSerializer
 from .admin_serializers import AdminUserUpdateSerializer, AdminStatsSerializer, ActivityLogSerializer
 from .permissions import IsAdminUser
+from .progress import COUNTER_FIELDS, mark_pending, stream_progress
+from .renderers import EventStreamRenderer
+from .audience import clean_segment, materialize_audience
 
 class AdminStatsView(views.APIView):
     permission_classes = [IsAdminUser]
@@ -126,6 +132,28 @@ class AdminBroadcastView(views.APIView):
             except:
                 target_roles = ['all']
 
+        segment = request.data.get('segment') or {}
+        if isinstance(segment, str):
+            try:
+                segment = json.loads(segment)
+            except ValueError:
+                return Response({'error': 'Segment noto\'g\'ri formatda'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            segment = clean_segment(segment)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Rejalashtirilgan vaqt (ISO format). O'tgan vaqt berilsa darhol yuboriladi
+        scheduled_at = request.data.get('scheduled_at') or None
+        if scheduled_at:
+            scheduled_at = parse_datetime(scheduled_at)
+            if scheduled_at is None:
+                return Response({'error': 'Vaqt noto\'g\'ri formatda'}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(scheduled_at):
+                scheduled_at = timezone.make_aware(scheduled_at)
+            if scheduled_at <= timezone.now():
+                scheduled_at = None
+
         image = request.FILES.get('image')
         file = request.FILES.get('file')
         
@@ -138,23 +166,35 @@ class AdminBroadcastView(views.APIView):
         except User.DoesNotExist:
             return Response({'error': 'Admin topilmadi'}, status=status.HTTP_404_NOT_FOUND)
 
-        # Broadcast record yaratish
-        broadcast = BroadcastHistory.objects.create(
-            admin=admin_user,
-            message=message,
-            target_roles=target_roles,
-            image=image,
-            file=file,
-            status='pending'
-        )
-        
-        # Celery taskni ishga tushirish
-        send_broadcast_task.delay(broadcast.id)
+        with transaction.atomic():
+            # Broadcast record yaratish
+            broadcast = BroadcastHistory.objects.create(
+                admin=admin_user,
+                message=message,
+                target_roles=target_roles,
+                segment=segment,
+                scheduled_at=scheduled_at,
+                image=image,
+                file=file,
+                status='scheduled' if scheduled_at else 'pending'
+            )
+            # Auditoriya hozirning o'zida saqlanadi - yuborish vaqtida filtrlar qayta hisoblanmaydi
+            broadcast.total_users = materialize_audience(broadcast)
+            broadcast.save(update_fields=['total_users'])
+
+            # Celery taskni ishga tushirish (tranzaksiya yakunlangach)
+            if scheduled_at:
+                transaction.on_commit(lambda: send_broadcast_task.apply_async((broadcast.id,), eta=scheduled_at))
+            else:
+                mark_pending(broadcast.id, 'send', broadcast.total_users)
+                transaction.on_commit(lambda: send_broadcast_task.delay(broadcast.id))
         
         return Response({
             'success': True,
             'broadcast_id': broadcast.id,
-            'message': 'Xabar yuborish navbatga qo\'shildi'
+            'total_users': broadcast.total_users,
+            'scheduled_at': scheduled_at,
+            'message': 'Xabar rejalashtirildi' if scheduled_at else 'Xabar yuborish navbatga qo\'shildi'
         })
 
     def patch(self, request, pk=None):
@@ -172,14 +212,32 @@ class AdminBroadcastView(views.APIView):
         image = request.FILES.get('image')
         file = request.FILES.get('file')
 
+        # Yuborish tugagan va boshqa tahrir/qaytarib olish ketmayotgan bo'lsagina tahrir band qilinadi
+        # (shartli UPDATE - ikki parallel so'rovdan faqat bittasi o'tadi)
+        busy = ['scheduled', 'pending', 'processing']
+        claimed = BroadcastHistory.objects.filter(pk=pk).exclude(status__in=busy).exclude(
+            edit_status__in=['pending', 'processing']
+        ).exclude(recall_status__in=['pending', 'processing']).update(edit_status='pending')
+        if not claimed:
+            return Response(
+                {'error': 'Xabar hali yuborilmoqda yoki tahrirlash/qaytarib olish jarayoni ketmoqda'},
+                status=status.HTTP_409_CONFLICT
+            )
+
         broadcast.message = message
         if image:
             broadcast.image = image
         if file:
             broadcast.file = file
+        if image or file:
+            # Yangi media tahrirlash vaqtida bir marta qayta yuklanadi
+            broadcast.media_file_id = None
         
-        broadcast.save()
+        broadcast.edit_status = 'pending'
+        # Faqat tahrir maydonlari - ishchi yozayotgan status va hisoblagichlar ustidan yozilmaydi
+        broadcast.save(update_fields=['message', 'image', 'file', 'media_file_id', 'edit_status'])
 
+        mark_pending(broadcast.id, 'edit')
         update_broadcast_task.delay(broadcast.id)
 
         return Response({'success': True, 'message': 'Tahrirlash jarayoni boshlandi'})
@@ -198,8 +256,16 @@ class AdminBroadcastListView(views.APIView):
             'success_count': b.success_count,
             'fail_count': b.fail_count,
             'target_roles': b.target_roles,
+            'segment': b.segment,
+            'scheduled_at': b.scheduled_at,
             'has_image': bool(b.image),
             'has_file': bool(b.file),
+            'edit_status': b.edit_status,
+            'edit_success_count': b.edit_success_count,
+            'edit_fail_count': b.edit_fail_count,
+            'recall_status': b.recall_status,
+            'recall_success_count': b.recall_success_count,
+            'recall_fail_count': b.recall_fail_count,
             'created_at': b.created_at
         } for b in broadcasts]
         return Response(data)
@@ -221,6 +287,51 @@ class AdminBroadcastDestroyView(views.APIView):
         except BroadcastHistory.DoesNotExist:
             return Response({'error': 'Topilmadi'}, status=status.HTTP_404_NOT_FOUND)
 
+class AdminBroadcastRecallView(views.APIView):
+    """Yuborilgan xabarni barcha foydalanuvchilar chatidan o'chirish (qaytarib olish)"""
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, pk):
+        try:
+            broadcast = BroadcastHistory.objects.get(pk=pk)
+        except BroadcastHistory.DoesNotExist:
+            return Response({'error': 'Topilmadi'}, status=status.HTTP_404_NOT_FOUND)
+
+        if broadcast.status in ['scheduled', 'pending', 'processing']:
+            return Response({'error': 'Xabar hali yuborilmoqda'}, status=status.HTTP_400_BAD_REQUEST)
+        if broadcast.recall_status in ['pending', 'processing']:
+            return Response({'error': 'Qaytarib olish jarayoni allaqachon boshlangan'}, status=status.HTTP_400_BAD_REQUEST)
+
+        broadcast.recall_status = 'pending'
+        broadcast.save(update_fields=['recall_status'])
+        mark_pending(broadcast.id, 'recall')
+        recall_broadcast_task.delay(broadcast.id)
+
+        return Response({'success': True, 'message': 'Qaytarib olish jarayoni boshlandi'})
+
+class AdminBroadcastStreamView(views.APIView):
+    """
+    Broadcast progressini real vaqtda uzatish (Server-Sent Events).
+    EventSource header yubora olmagani uchun ?telegram_id= orqali autentifikatsiya qilinadi.
+    """
+    permission_classes = [IsAdminUser]
+    renderer_classes = [EventStreamRenderer, JSONRenderer]
+
+    def get(self, request, pk):
+        operation = request.query_params.get('operation', 'send')
+        if operation not in COUNTER_FIELDS:
+            return Response({'error': 'Noto\'g\'ri operatsiya'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            broadcast = BroadcastHistory.objects.get(pk=pk)
+        except BroadcastHistory.DoesNotExist:
+            return Response({'error': 'Topilmadi'}, status=status.HTTP_404_NOT_FOUND)
+
+        response = StreamingHttpResponse(stream_progress(broadcast, operation), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Nginx buferlamasligi uchun
+        return response
+
 class AdminBroadcastStatusView(views.APIView):
     permission_classes = [IsAdminUser]
 
@@ -234,6 +345,18 @@ class AdminBroadcastStatusView(views.APIView):
                 'total_users': broadcast.total_users,
                 'success_count': broadcast.success_count,
                 'fail_count': broadcast.fail_count,
+                'scheduled_at': broadcast.scheduled_at,
+                'edit_status': broadcast.edit_status,
+                'edit_total': broadcast.edit_total,
+                'edit_success_count': broadcast.edit_success_count,
+                'edit_fail_count': broadcast.edit_fail_count,
+                'edited_at': broadcast.edited_at,
+                'recall_status': broadcast.recall_status,
+                'recall_total': broadcast.recall_total,
+                'recall_success_count': broadcast.recall_success_count,
+                'recall_fail_count': broadcast.recall_fail_count,
+                'recalled_at': broadcast.recalled_at,
+                'last_error': broadcast.last_error,
                 'created_at': broadcast.created_at,
                 'completed_at': broadcast.completed_at
             })
@@ -250,11 +373,13 @@ class SystemSettingsView(views.APIView):
     def get(self, request):
         from .models import SystemSettings
         from .serializers import SystemSettingsSerializer
+        from .etags import conditional_response, make_etag
         settings = SystemSettings.objects.first()
         if not settings:
             settings = SystemSettings.objects.create()
-        serializer = SystemSettingsSerializer(settings)
-        return Response(serializer.data)
+        # Bot deyarli har bir amalda so'raydi - o'zgarmagan bo'lsa 304
+        etag = make_etag('settings', settings.id, settings.updated_at)
+        return conditional_response(request, etag, lambda: Response(SystemSettingsSerializer(settings).data))
 
     def patch(self, request):
         from .models import SystemSettings
@@ -371,7 +496,7 @@ class PaymentReceiptVerifyView(views.APIView):
                     total_amount = total_stats['total_amount'] or 0
                     total_count = total_stats['total_count'] or 0
 
-                    # Bildirishnoma yuborish (Celery yo'qligi sababli sinxron)
+                    # Bildirishnoma (outbox orqali, tranzaksiya yakunlangach yuboriladi)
                     msg = f"✅ <b>To'lov tasdiqlandi!</b>\n\n"
                     msg += f"Sizning hisobingizga {amount} so'm qo'shildi.\n"
                     msg += f"Joriy balans: <b>{user.balance} so'm</b>\n\n"
@@ -379,11 +504,8 @@ class PaymentReceiptVerifyView(views.APIView):
                     msg += f"• Jami to'lovlar soni: {total_count} ta\n"
                     msg += f"• Jami to'langan summa: {total_amount} so'm"
                     
-                    try:
-                         from .tasks import send_payment_notification_task
-                         send_payment_notification_task.delay(user.telegram_id, msg)
-                    except:
-                         pass
+                    from .outbox import queue_notification
+                    queue_notification(user.telegram_id, msg, kind='payment')
 
                     ActivityLog.objects.create(
                         event_type='payment_verified',
@@ -407,13 +529,10 @@ class PaymentReceiptVerifyView(views.APIView):
                     receipt.admin_comment = comment
                     receipt.save()
 
-                    # Bildirishnoma yuborish (Sinxron)
+                    # Bildirishnoma (outbox orqali)
                     msg = f"❌ <b>To'lov rad etildi.</b>\n\nSababi: {comment}"
-                    try:
-                         from .tasks import send_payment_notification_task
-                         send_payment_notification_task.delay(receipt.user.telegram_id, msg)
-                    except:
-                         pass
+                    from .outbox import queue_notification
+                    queue_notification(receipt.user.telegram_id, msg, kind='payment')
 
                     return Response({
                         'success': True, 
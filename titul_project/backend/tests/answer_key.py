@@ -0,0 +1,44 @@
+"""
+Natija qabul qilish uchun test kaliti keshi: Test (creator bilan) va savollar ro'yxati.
+Javob yuborishda test va savollar bazadan qayta o'qilmaydi - baholash xotirada bajariladi.
+Test yoki savollar o'zgarganda signals.py orqali tozalanadi.
+"""
+import logging
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+def answer_key_key(test_id):
+    return f"test:answer_key:{test_id}"
+
+
+def get_answer_key(test_id):
+    """(test, savollar) yoki test topilmasa None. Test statistikasi maydonlari eskirgan bo'lishi mumkin"""
+    from .models import Test
+
+    key = answer_key_key(test_id)
+    try:
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    except Exception as e:
+        logger.warning(f"Answer key cache read error: {e}")
+
+    test = Test.objects.filter(id=test_id).select_related('creator').first()
+    if test is None:
+        return None
+    entry = (test, list(test.questions.order_by('question_number')))
+    try:
+        cache.set(key, entry, timeout=settings.TEST_ANSWER_KEY_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Answer key cache write error: {e}")
+    return entry
+
+
+def invalidate_answer_key(test_id):
+    try:
+        cache.delete(answer_key_key(test_id))
+    except Exception as e:
+        logger.warning(f"Answer key cache delete error: {e}")
@@ -0,0 +1,88 @@
+"""
+Broadcast auditoriyasi: segment filtrlari va auditoriyani oldindan saqlash (snapshot)
+"""
+from datetime import timedelta
+from django.db import connection
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from .models import User, Test, Submission, BroadcastRecipient
+
+# Qo'llab-quvvatlanadigan segment filtrlari va ularning turlari
+SEGMENT_FIELDS = {
+    'active_days': int,      # oxirgi N kunda faol (ro'yxatdan o'tgan, test yaratgan yoki topshirgan)
+    'has_tests': bool,       # kamida bitta test yaratgan
+    'has_balance': bool,     # balansi 0 dan katta
+    'reachable_only': bool,  # botni bloklamaganlar
+}
+
+
+def clean_segment(segment):
+    """Segmentni tekshirish va tozalash. Noto'g'ri qiymatda ValueError"""
+    if not segment:
+        return {}
+    if not isinstance(segment, dict):
+        raise ValueError("Segment noto'g'ri formatda")
+
+    cleaned = {}
+    for key, value in segment.items():
+        if key not in SEGMENT_FIELDS:
+            raise ValueError(f"Noma'lum segment filtri: {key}")
+        if value in (None, '', False):
+            continue
+        if SEGMENT_FIELDS[key] is int:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{key} butun son bo'lishi kerak")
+            if value <= 0:
+                raise ValueError(f"{key} musbat bo'lishi kerak")
+        else:
+            value = value in (True, 'true', '1', 1)
+            if not value:
+                continue
+        cleaned[key] = value
+    return cleaned
+
+
+def build_audience_query(target_roles, segment=None):
+    """Broadcast auditoriyasi uchun User queryset (faqat filtrlar, hali bajarilmaydi)"""
+    segment = segment or {}
+    query = User.objects.filter(telegram_id__isnull=False).exclude(telegram_id=0)
+    if 'all' not in target_roles:
+        query = query.filter(role__in=target_roles)
+
+    if segment.get('active_days'):
+        since = timezone.now() - timedelta(days=segment['active_days'])
+        created_test = Test.objects.filter(creator=OuterRef('pk'), created_at__gte=since)
+        submitted = Submission.objects.filter(student_telegram_id=OuterRef('telegram_id'), submitted_at__gte=since)
+        query = query.filter(Q(created_at__gte=since) | Exists(created_test) | Exists(submitted))
+
+    if segment.get('has_tests'):
+        query = query.filter(Exists(Test.objects.filter(creator=OuterRef('pk'))))
+
+    if segment.get('has_balance'):
+        query = query.filter(balance__gt=0)
+
+    if segment.get('reachable_only'):
+        query = query.filter(is_reachable=True)
+
+    return query
+
+
+def materialize_audience(broadcast):
+    """
+    Auditoriyani broadcast_recipients jadvaliga 'queued' holatida bitta INSERT ... SELECT
+    bilan yozish. Yuborish vaqtida filtrlar qayta hisoblanmaydi va User obyektlari yuklanmaydi.
+    Yozilgan qatorlar sonini qaytaradi.
+    """
+    query = build_audience_query(broadcast.target_roles, broadcast.segment)
+    select_sql, params = query.values('telegram_id').query.sql_with_params()
+    table = connection.ops.quote_name(BroadcastRecipient._meta.db_table)
+
+    sql = (
+        f"INSERT INTO {table} (broadcast_id, telegram_id, status, created_at) "
+        f"SELECT %s, sub.telegram_id, %s, %s FROM ({select_sql}) sub"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [broadcast.id, 'queued', timezone.now(), *params])
+        return cursor.rowcount
@@ -0,0 +1,331 @@
+"""
+Broadcast xabarlarini parallel yuborish va tahrirlash (umumiy rate limiter bilan)
+"""
+import json
+import os
+import threading
+import time
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from django.conf import settings
+from django.core.cache import cache
+
+from . import telegram_client
+
+logger = logging.getLogger(__name__)
+
+# Telegram javobi: ok, result (Message yoki True), HTTP status, xatolik matni
+TelegramResult = namedtuple('TelegramResult', ['ok', 'result', 'status_code', 'description'])
+
+
+class RateLimiter:
+    """
+    Token bucket: soniyasiga `rate` tadan ortiq so'rov yuborilmasligini ta'minlaydi.
+    Bir nechta oqim (thread) tomonidan bir vaqtda ishlatilishi mumkin.
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, priority=None):
+        """Navbatdagi so'rov uchun ruxsat olish (kerak bo'lsa kutadi)"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait_time = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                    self.updated_at = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+    def pause(self, seconds):
+        """429 (Too Many Requests) kelganda barcha oqimlarni retry_after davomida to'xtatish"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.updated_at = self.paused_until
+            self.tokens = 0
+
+
+# Navbat ustuvorligi: tranzaksion xabarlar > hisobotlar > broadcastlar
+PRIORITY_TRANSACTIONAL = 0
+PRIORITY_REPORT = 1
+PRIORITY_BROADCAST = 2
+
+
+class SharedRateLimiter:
+    """
+    Backend jarayonlari (veb, Celery ishchilari) uchun umumiy limit - Redis kesh orqali.
+    Bot faqat chek haqidagi admin xabarlarini gateway orqali shu limitga kiritadi, suhbatdagi
+    javoblari (reply_text, tugmalar) bu hisoblagichga kirmaydi (README, "Telegram gateway").
+    Har soniya uchun bitta hisoblagich: past ustuvorlikdagi so'rovlar limitning bir qismini
+    (TELEGRAM_PRIORITY_RESERVE) tranzaksion xabarlar uchun qoldiradi.
+    Kesh ishlamasa jarayon ichidagi RateLimiter ishlatiladi.
+    """
+    PAUSE_KEY = 'telegram:paused_until'
+
+    def __init__(self, rate, reserve, fallback):
+        self.rate = rate
+        self.reserve = reserve
+        self.fallback = fallback
+
+    def limit_for(self, priority):
+        if priority <= PRIORITY_TRANSACTIONAL:
+            return self.rate
+        if priority == PRIORITY_REPORT:
+            return max(self.rate - self.reserve // 2, 1)
+        return max(self.rate - self.reserve, 1)
+
+    def acquire(self, priority=PRIORITY_TRANSACTIONAL):
+        limit = self.limit_for(priority)
+        while True:
+            now = time.time()
+            try:
+                paused_until = cache.get(self.PAUSE_KEY)
+                if paused_until and paused_until > now:
+                    time.sleep(paused_until - now)
+                    continue
+
+                window = int(now)
+                key = f"telegram:rate:{window}"
+                cache.add(key, 0, timeout=5)
+                if cache.incr(key) <= limit:
+                    return
+            except Exception as e:
+                logger.warning(f"Shared rate limiter error, using local limiter: {e}")
+                return self.fallback.acquire()
+            # Joriy soniya limiti tugadi - keyingi soniyani kutamiz
+            time.sleep(window + 1 - now)
+
+    def pause(self, seconds):
+        """429 kelganda barcha jarayonlarni retry_after davomida to'xtatish"""
+        self.fallback.pause(seconds)
+        try:
+            cache.set(self.PAUSE_KEY, time.time() + seconds, timeout=int(seconds) + 1)
+        except Exception as e:
+            logger.warning(f"Shared rate limiter pause error: {e}")
+
+
+_limiter = None
+_init_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Jarayon (process) uchun yagona rate limiter (barcha Telegram so'rovlari uchun umumiy)"""
+    global _limiter
+    with _init_lock:
+        if _limiter is None:
+            local = RateLimiter(settings.TELEGRAM_BROADCAST_RATE)
+            if settings.TELEGRAM_SHARED_LIMITER:
+                _limiter = SharedRateLimiter(settings.TELEGRAM_GLOBAL_RATE, settings.TELEGRAM_PRIORITY_RESERVE, local)
+            else:
+                _limiter = local
+    return _limiter
+
+
+# Qayta chaqirilsa natija o'zgarmaydigan metodlar - 5xx javobida qayta yuboriladi
+IDEMPOTENT_METHODS = frozenset({
+    'editMessageText', 'editMessageCaption', 'editMessageMedia', 'editMessageReplyMarkup', 'deleteMessage',
+})
+RETRY_STATUSES = (502, 503, 504)
+
+
+def is_idempotent(method):
+    return method in IDEMPOTENT_METHODS or method.startswith('get')
+
+
+def is_connect_failure(error):
+    """Ulanish umuman o'rnatilmagan (so'rov Telegramga yetmagani aniq) - qayta yuborish xavfsiz"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+def telegram_request(method, data, files=None, timeout=None, max_retries=3, priority=PRIORITY_TRANSACTIONAL):
+    """
+    Telegram Bot API metodini rate limiter orqali chaqirish (yagona qayta yuborish qatlami).
+    429 javobida barcha oqimlar retry_after davomida to'xtatiladi va so'rov qayta yuboriladi.
+    Ulanish o'rnatilmagan bo'lsa qayta yuboriladi; 502/503/504 faqat idempotent metodlar uchun.
+    Uzilgan ulanish va javob timeoutida Telegram xabarni yetkazgan bo'lishi mumkin - qayta yuborilmaydi.
+    """
+    limiter = get_rate_limiter()
+    result = TelegramResult(False, None, None, 'Not sent')
+
+    for attempt in range(max_retries):
+        limiter.acquire(priority)
+        try:
+            resp = telegram_client.post(method, data, files=files, timeout=timeout)
+        except requests.RequestException as e:
+            result = TelegramResult(False, None, None, str(e))
+            if is_connect_failure(e):
+                continue
+            return result
+
+        try:
+            body = resp.json()
+        except ValueError:
+            body = {}
+
+        if resp.status_code == 200 and body.get('ok'):
+            return TelegramResult(True, body.get('result'), 200, None)
+
+        result = TelegramResult(False, None, resp.status_code, body.get('description') or f"HTTP {resp.status_code}")
+        if resp.status_code == 429:
+            retry_after = (body.get('parameters') or {}).get('retry_after', 1)
+            limiter.pause(retry_after)
+            continue
+        if resp.status_code in RETRY_STATUSES and is_idempotent(method):
+            time.sleep(0.3 * 2 ** attempt)
+            continue
+        break
+
+    return result
+
+
+def fan_out(items, func, max_workers=None):
+    """
+    items ustida func ni parallel bajarish va (item, natija) juftliklarini tugash tartibida qaytarish.
+    Bir vaqtda faqat cheklangan miqdordagi vazifa navbatda turadi, shuning uchun
+    items katta iterator (masalan, queryset.iterator()) bo'lishi mumkin.
+    """
+    max_workers = max_workers or settings.TELEGRAM_BROADCAST_WORKERS
+    iterator = iter(items)
+    pending = {}
+    exhausted = False
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            while not exhausted and len(pending) < max_workers * 2:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(func, item)] = item
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                try:
+                    yield item, future.result()
+                except Exception as e:
+                    logger.error(f"Broadcast worker error for {item}: {e}")
+                    yield item, TelegramResult(False, None, None, str(e))
+
+
+def get_media_kind(broadcast):
+    """Broadcast media turi: 'photo', 'document' yoki None (faqat matn)"""
+    if broadcast.image:
+        return 'photo'
+    if broadcast.file:
+        return 'document'
+    return None
+
+
+def read_media(broadcast):
+    """Media faylni diskdan bir marta o'qib olish: (fayl nomi, baytlar)"""
+    field = broadcast.image if broadcast.image else broadcast.file
+    if not field:
+        return None
+    with open(field.path, 'rb') as f:
+        return (os.path.basename(field.name), f.read())
+
+
+def extract_file_id(message, kind):
+    """Telegram Message obyektidan yuklangan media file_id sini olish"""
+    if not isinstance(message, dict):
+        return None
+    if kind == 'photo':
+        photos = message.get('photo') or []
+        return photos[-1].get('file_id') if photos else None
+    if kind == 'document':
+        return (message.get('document') or {}).get('file_id')
+    return None
+
+
+def send_broadcast_message(broadcast, chat_id, kind, file_id=None, upload=None):
+    """Bitta foydalanuvchiga broadcast xabarini yuborish"""
+    if not kind:
+        payload = {'chat_id': chat_id, 'text': broadcast.message, 'parse_mode': 'HTML'}
+        return telegram_request('sendMessage', payload, priority=PRIORITY_BROADCAST)
+
+    method = 'sendPhoto' if kind == 'photo' else 'sendDocument'
+    payload = {'chat_id': chat_id, 'caption': broadcast.message, 'parse_mode': 'HTML'}
+    if file_id:
+        payload[kind] = file_id
+        return telegram_request(method, payload, priority=PRIORITY_BROADCAST)
+    return telegram_request(method, payload, files={kind: upload}, priority=PRIORITY_BROADCAST)
+
+
+def edit_broadcast_message(broadcast, chat_id, message_id, kind, file_id=None, upload=None):
+    """Yuborilgan broadcast xabarini tahrirlash (matn yoki media)"""
+    if not kind:
+        payload = {
+            'chat_id': chat_id,
+            'message_id': message_id,
+            'text': broadcast.message,
+            'parse_mode': 'HTML'
+        }
+        result = telegram_request('editMessageText', payload, priority=PRIORITY_BROADCAST)
+    else:
+        media = {
+            'type': kind,
+            'media': file_id or 'attach://media',
+            'caption': broadcast.message,
+            'parse_mode': 'HTML'
+        }
+        payload = {'chat_id': chat_id, 'message_id': message_id, 'media': json.dumps(media)}
+        files = None if file_id else {'media': upload}
+        result = telegram_request('editMessageMedia', payload, files=files, priority=PRIORITY_BROADCAST)
+
+    # Kontent o'zgarmagan bo'lsa Telegram 400 qaytaradi - bu xatolik emas
+    if not result.ok and result.description and 'message is not modified' in result.description:
+        return TelegramResult(True, None, result.status_code, result.description)
+    return result
+
+
+def delete_broadcast_message(chat_id, message_id):
+    """Yuborilgan broadcast xabarini foydalanuvchi chatidan o'chirish"""
+    result = telegram_request('deleteMessage', {'chat_id': chat_id, 'message_id': message_id}, priority=PRIORITY_BROADCAST)
+    # Xabar allaqachon o'chirilgan bo'lsa - maqsadga erishilgan
+    if not result.ok and result.description and 'message to delete not found' in result.description:
+        return TelegramResult(True, None, result.status_code, result.description)
+    return result
+
+
+def deliver(items, call, kind=None, file_id=None, upload=None, on_file_id=None):
+    """
+    items bo'yicha call(item, file_id, upload) ni bajarish.
+    Media hali Telegramga yuklanmagan bo'lsa, birinchi muvaffaqiyatli so'rovgacha ketma-ket
+    yuboriladi (fayl faqat bir marta yuklanadi), qolganlari file_id bilan parallel yuboriladi.
+    """
+    iterator = iter(items)
+
+    if kind and not file_id:
+        for item in iterator:
+            result = call(item, None, upload)
+            yield item, result
+            if result.ok:
+                file_id = extract_file_id(result.result, kind)
+                if file_id:
+                    if on_file_id:
+                        on_file_id(file_id)
+                    break
+
+    yield from fan_out(iterator, lambda item: call(item, file_id, None))
@@ -0,0 +1,97 @@
+"""
+Yangi natijalar haqida o'qituvchiga jamlanma (digest) bildirishnoma yuborish.
+Ko'p talaba bir vaqtda topshirganda har bir natija uchun alohida xabar yuborilmaydi.
+"""
+import html
+import logging
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from .models import Test
+from .outbox import queue_notification
+from .broadcast_service import PRIORITY_REPORT
+
+logger = logging.getLogger(__name__)
+
+# Digestda ko'rsatiladigan oxirgi talabalar soni
+LATEST_NAMES = 5
+
+
+def counter_key(test_id):
+    return f"test:{test_id}:digest:pending"
+
+
+def scheduled_key(test_id):
+    return f"test:{test_id}:digest:scheduled"
+
+
+def notify_submission(submission):
+    """Yangi natija: testning notify_mode sozlamasiga qarab xabar yuborish yoki digestga qo'shish"""
+    test = submission.test
+    if test.notify_mode == 'off':
+        return
+    if test.notify_mode == 'each':
+        msg = f"Natija yuborildi!\n\nTest: {test.title}\nTalaba: {submission.student_name}\nBall: {submission.score}\nDaraja: {submission.grade}"
+        queue_notification(test.creator.telegram_id, msg, kind='submission', parse_mode='')
+        return
+
+    from .tasks import send_submission_digest_task
+    try:
+        # Hisoblagich faqat yuborish vaqtini aniqlash uchun - digest tarkibi bazadan olinadi
+        cache.add(counter_key(test.id), 0, timeout=None)
+        pending = cache.incr(counter_key(test.id))
+        if pending >= test.digest_batch_size:
+            send_submission_digest_task.delay(test.id)
+        elif cache.add(scheduled_key(test.id), 1, timeout=test.digest_interval):
+            send_submission_digest_task.apply_async((test.id,), countdown=test.digest_interval)
+    except Exception as e:
+        # Kesh ishlamasa ham natija yo'qolmaydi - keyingi digestga kiradi
+        logger.error(f"Digest scheduling error for test {test.id}: {e}")
+
+
+def build_digest(test, new_count, latest_names):
+    # Xabar HTML rejimida yuboriladi - foydalanuvchi kiritgan matnlar ekranlanadi
+    names = ", ".join(html.escape(name) for name in latest_names)
+    if new_count > len(latest_names):
+        names += f" va yana {new_count - len(latest_names)} kishi"
+    return (
+        f"📥 <b>Yangi natijalar</b>\n\n"
+        f"📝 Test: <b>{html.escape(test.title)}</b> ({html.escape(test.access_code)})\n"
+        f"➕ Yangi: <b>{new_count} ta</b>\n"
+        f"👤 Oxirgilar: {names}\n"
+        # Statistika Test qatorida saqlanadi (stats.py) - natijalar qayta sanalmaydi
+        f"👥 Jami ishtirokchilar: <b>{test.submissions_count} ta</b>\n"
+        f"📈 O'rtacha ball: <b>{test.average_score}</b>"
+    )
+
+
+def send_digest(test_id):
+    """Oxirgi digestdan keyin kelgan natijalar bo'yicha bitta xabar yuborish. Qo'shilgan natijalar sonini qaytaradi"""
+    try:
+        # Shu paytdan keyingi natijalar yangi digest oynasini ochadi
+        cache.set(counter_key(test_id), 0, timeout=None)
+        cache.delete(scheduled_key(test_id))
+    except Exception as e:
+        logger.warning(f"Digest cache error: {e}")
+
+    with transaction.atomic():
+        # Bir test uchun digestlar ketma-ket tuziladi (bir natija ikki marta kirmaydi)
+        test = Test.objects.select_for_update(of=('self',)).select_related('creator').filter(id=test_id).first()
+        if not test or test.notify_mode != 'digest':
+            return 0
+
+        last_id = test.submissions.filter(id__gt=test.digest_last_submission_id).aggregate(last_id=Max('id'))['last_id']
+        if not last_id:
+            return 0
+
+        new_submissions = test.submissions.filter(id__gt=test.digest_last_submission_id, id__lte=last_id)
+
+        new_count = new_submissions.count()
+        latest_names = list(
+            new_submissions.order_by('-id').values_list('student_name', flat=True)[:LATEST_NAMES]
+        )
+
+        test.digest_last_submission_id = last_id
+        test.save(update_fields=['digest_last_submission_id'])
+        queue_notification(test.creator.telegram_id, build_digest(test, new_count, latest_names), kind='submission_digest', priority=PRIORITY_REPORT)
+    return new_count
@@ -0,0 +1,29 @@
+"""
+Conditional GET (ETag / If-None-Match): ETag javob tanasidan emas, versiya qiymatlaridan
+(updated_at, results_version) hisoblanadi - o'zgarmagan bo'lsa serializatsiya qilinmaydi.
+"""
+import hashlib
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def etag_matches(request, etag):
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    # Proksilar (gzip) ETag ni zaif (W/) ko'rinishga o'tkazishi mumkin
+    return '*' in etags or etag in [e.removeprefix('W/') for e in etags]
+
+
+def conditional_response(request, etag, build):
+    """build() faqat ETag mos kelmaganda chaqiriladi va Response qaytaradi"""
+    if etag_matches(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+    response = build()
+    if response.status_code == status.HTTP_200_OK:
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+    return response
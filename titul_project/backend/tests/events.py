@@ -0,0 +1,35 @@
+"""
+Bot jarayonlariga hodisalarni yetkazish (Redis pub/sub).
+Bot foydalanuvchi profilini keshlaydi - ma'lumot o'zgarganda shu kanal orqali kesh tozalanadi.
+"""
+import json
+import logging
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        import redis
+        _client = redis.Redis.from_url(settings.USER_EVENTS_REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+    return _client
+
+
+def publish(event):
+    try:
+        get_client().publish(settings.USER_EVENTS_CHANNEL, json.dumps(event))
+    except Exception as e:
+        # Hodisa yetmasa bot keshi TTL tugashi bilan yangilanadi
+        logger.warning(f"User event publish error: {e}")
+
+
+def user_changed(telegram_id):
+    """Foydalanuvchi profili (balans, rol, testlar, to'lovlar) o'zgardi - tranzaksiya yakunlangach yuboriladi"""
+    if not telegram_id:
+        return
+    transaction.on_commit(lambda: publish({'type': 'user_changed', 'telegram_id': telegram_id}))
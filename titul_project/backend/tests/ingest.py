@@ -0,0 +1,294 @@
+"""
+Javoblarni qabul qilish: darhol (so'rov ichida baholash) yoki navbat orqali.
+Imtihon oxirida yuzlab talaba bir necha soniyada topshiradi - navbat rejimida so'rov faqat
+javoblar varaqasini SubmissionIntake ga yozadi (202 + qabul raqami), baholash va yozish
+Celery'da partiyalab (bulk_create) bajariladi. Holatni /submissions/intake/{id}/ orqali kuzatiladi.
+Urinish raqami va bir martalik rejim baza cheklovlari bilan himoyalangan (save_submission) - test
+bo'yicha umumiy qulf yo'q, faqat bir o'quvchining bir vaqtdagi so'rovlari to'qnashadi.
+"""
+import time
+import logging
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import Submission, SubmissionIntake, normalize_student_name
+
+logger = logging.getLogger(__name__)
+
+
+def build_submission(test, questions, student_telegram_id, student_name, answers, attempt_number):
+    """Xotirada baholangan (hali saqlanmagan) Submission. Yangi natijada Rasch bali yo'q - xom ball foizi"""
+    from .scoring import grade_answers, grade_for_percentage
+
+    score, total_points, correct_count, wrong_count = grade_answers(questions, answers)
+    percentage = float(score / total_points * 100) if total_points > Decimal('0') else 0
+    student_key = normalize_student_name(student_name)
+    return Submission(
+        test=test,
+        student_telegram_id=student_telegram_id,
+        student_name=student_name,
+        student_key=student_key,
+        single_key=single_key(test, student_telegram_id, student_key),
+        answers=answers,
+        attempt_number=attempt_number,
+        score=score,
+        grade=grade_for_percentage(percentage),
+        correct_count=correct_count,
+        wrong_count=wrong_count,
+    )
+
+
+def single_key(test, student_telegram_id, student_key):
+    """Bir martalik rejim kaliti: Telegram foydalanuvchisi ID bo'yicha, veb foydalanuvchisi (ID=0) ism bo'yicha"""
+    if test.submission_mode != 'single':
+        return None
+    return f"id:{student_telegram_id}" if student_telegram_id else f"name:{student_key}"
+
+
+def single_mode_filter(student_telegram_id, student_name, prefix=''):
+    """
+    Bir martalik rejimda o'quvchining avvalgi natijalari (single_key bilan bir xil qoida).
+    Topshirish sahifasi (check_attempt_status) va javob qabul qilish shu shartdan foydalanadi.
+    """
+    if student_telegram_id:
+        return Q(**{f'{prefix}student_telegram_id': student_telegram_id})
+    return Q(**{f'{prefix}student_telegram_id': 0, f'{prefix}student_key': normalize_student_name(student_name)})
+
+
+class AlreadySubmitted(Exception):
+    """Bir martalik rejimda o'quvchi testni allaqachon topshirgan"""
+
+
+def previous_attempt(submission):
+    """O'quvchining oxirgi urinishi: raqami va bali (None - birinchi urinish)"""
+    return Submission.objects.filter(
+        test_id=submission.test_id,
+        student_telegram_id=submission.student_telegram_id,
+        student_key=submission.student_key,
+    ).order_by('-attempt_number').values('attempt_number', 'score').first()
+
+
+_LOOKUP = object()
+
+
+def save_submission(submission, previous=_LOOKUP):
+    """
+    Urinish raqamini band qilib natijani yozish (optimistik): raqam oxirgi urinish + 1, INSERT
+    unique cheklov bilan himoyalangan. Parallel so'rov shu raqamni olgan bo'lsa oxirgi urinish
+    qayta o'qilib yana yoziladi. previous - oldindan o'qilgan oxirgi urinish (berilmasa bazadan olinadi).
+    Yozilgan urinishdan oldingi urinishni qaytaradi (statistika uchun).
+    """
+    if previous is _LOOKUP:
+        previous = previous_attempt(submission)
+    for retry in range(settings.SUBMISSION_ATTEMPT_RETRIES):
+        submission.attempt_number = previous['attempt_number'] + 1 if previous else 1
+        try:
+            # Savepoint: to'qnashuvdan keyin tashqi tranzaksiya davom etadi
+            with transaction.atomic():
+                submission.save()
+            return previous
+        except IntegrityError:
+            if submission.idempotency_key and Submission.objects.filter(idempotency_key=submission.idempotency_key).exists():
+                raise
+            if submission.single_key and Submission.objects.filter(
+                test_id=submission.test_id, single_key=submission.single_key
+            ).exists():
+                raise AlreadySubmitted()
+            if retry == settings.SUBMISSION_ATTEMPT_RETRIES - 1:
+                raise
+            logger.info(f"Attempt number conflict for test {submission.test_id}, retrying")
+            previous = previous_attempt(submission)
+
+
+def should_queue(test):
+    """
+    Navbat rejimi: 'async' - doim, 'sync' - hech qachon, 'auto' - test bo'yicha oxirgi
+    SUBMISSION_ASYNC_WINDOW soniyadagi so'rovlar SUBMISSION_ASYNC_THRESHOLD dan oshsa
+    """
+    if test.ingest_mode != 'auto':
+        return test.ingest_mode == 'async'
+    window = settings.SUBMISSION_ASYNC_WINDOW
+    key = f"test:{test.id}:ingest:{int(time.time() // window)}"
+    try:
+        cache.add(key, 0, timeout=window * 2)
+        return cache.incr(key) > settings.SUBMISSION_ASYNC_THRESHOLD
+    except Exception as e:
+        # Kesh ishlamasa darhol baholaymiz
+        logger.warning(f"Ingest load counter error: {e}")
+        return False
+
+
+def queue_submission(test, data, idempotency_key=None):
+    """Javoblar varaqasini navbatga yozish. Baholash tranzaksiya yakunlangach boshlanadi"""
+    intake = SubmissionIntake.objects.create(
+        test=test,
+        student_telegram_id=data['student_telegram_id'],
+        student_name=data['student_name'],
+        answers=data['answers'],
+        idempotency_key=idempotency_key,
+    )
+    transaction.on_commit(schedule_processing)
+    return intake
+
+
+def schedule_processing():
+    """Navbatni qayta ishlovchi taskni qisqa kechikish bilan qo'yish - shu oraliqdagi varaqlar bitta partiyaga tushadi"""
+    try:
+        if not cache.add('submission_intake:scheduled', 1, timeout=settings.SUBMISSION_INGEST_DELAY):
+            return
+    except Exception as e:
+        logger.warning(f"Intake schedule flag error: {e}")
+
+    try:
+        from .tasks import process_submission_intakes_task
+        process_submission_intakes_task.apply_async(countdown=settings.SUBMISSION_INGEST_DELAY)
+    except Exception as e:
+        # Broker ishlamasa ham varaq yo'qolmaydi - davriy task qayta ishlaydi
+        logger.error(f"Error scheduling intake processing: {e}")
+
+
+def claim_batch(limit):
+    """Navbatdagi varaqlarni band qilish (bir nechta ishchi bir xil varaqni olmaydi)"""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            SubmissionIntake.objects.select_for_update(skip_locked=True)
+            .filter(status='pending')
+            .order_by('created_at')
+            .values_list('id', flat=True)[:limit]
+        )
+        if ids:
+            SubmissionIntake.objects.filter(id__in=ids).update(status='processing', claimed_at=now)
+    return list(SubmissionIntake.objects.filter(id__in=ids).order_by('created_at'))
+
+
+def release_stale_claims():
+    """Ishchi to'xtab qolgan varaqlarni navbatga qaytarish"""
+    stale_before = timezone.now() - timedelta(seconds=settings.SUBMISSION_INGEST_CLAIM_TIMEOUT)
+    return SubmissionIntake.objects.filter(status='processing', claimed_at__lt=stale_before).update(status='pending', claimed_at=None)
+
+
+def process_test_batch(test_id, intakes):
+    """Bitta testning varaqlarini baholash va bitta bulk_create bilan yozish"""
+    from .answer_key import get_answer_key
+    from .stats import recompute_stats
+    from .digest import notify_submission
+
+    now = timezone.now()
+    answer_key = get_answer_key(test_id)
+    if answer_key is None:
+        SubmissionIntake.objects.filter(id__in=[i.id for i in intakes]).update(
+            status='rejected', error='Test topilmadi!', processed_at=now
+        )
+        return 0
+    test, questions = answer_key
+
+    # Partiyadagi o'quvchilarning mavjud urinishlari bitta so'rovda
+    ids = {i.student_telegram_id for i in intakes if i.student_telegram_id}
+    web_names = {normalize_student_name(i.student_name) for i in intakes if not i.student_telegram_id}
+    existing = Submission.objects.filter(test_id=test_id).filter(
+        Q(student_telegram_id__in=ids) | Q(student_telegram_id=0, student_key__in=web_names)
+    ).values_list('student_telegram_id', 'student_key', 'attempt_number')
+    last_attempts = {}
+    for telegram_id, name_key, attempt_number in existing:
+        key = (telegram_id, name_key)
+        last_attempts[key] = max(last_attempts.get(key, 0), attempt_number)
+    submitted_ids = {telegram_id for telegram_id, _ in last_attempts if telegram_id}
+
+    accepted = []
+    for intake in intakes:
+        key = (intake.student_telegram_id, normalize_student_name(intake.student_name))
+        if test.submission_mode == 'single':
+            # Telegram foydalanuvchisi ID bo'yicha, veb foydalanuvchisi (ID=0) ism bo'yicha
+            already = intake.student_telegram_id in submitted_ids if intake.student_telegram_id else key in last_attempts
+            if already:
+                intake.status, intake.error = 'rejected', "Siz ushbu testni yechib bo'lgansiz!"
+                continue
+            submitted_ids.add(intake.student_telegram_id)
+        last_attempts[key] = last_attempts.get(key, 0) + 1
+        submission = build_submission(
+            test, questions, intake.student_telegram_id, intake.student_name, intake.answers, last_attempts[key]
+        )
+        accepted.append((intake, submission))
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                Submission.objects.bulk_create([submission for _, submission in accepted])
+        except IntegrityError:
+            # Partiya o'qilgandan keyin shu o'quvchilarning natijasi (sinxron so'rov) yozilgan -
+            # varaqlar birma-bir, urinish raqami qayta o'qilib yoziladi
+            logger.info(f"Intake batch conflict for test {test_id}, saving one by one")
+            save_individually(accepted)
+        submissions = []
+        for intake, submission in accepted:
+            if submission.pk:
+                intake.submission, intake.status = submission, 'done'
+                submissions.append(submission)
+        for intake in intakes:
+            intake.processed_at = now
+        SubmissionIntake.objects.bulk_update(intakes, ['status', 'submission', 'error', 'processed_at'])
+        if submissions:
+            # Partiyadan keyin statistika bir marta to'liq hisoblanadi
+            recompute_stats(test)
+            for submission in submissions:
+                notify_submission(submission)
+    return len(submissions)
+
+
+def save_individually(accepted):
+    for intake, submission in accepted:
+        submission.pk = None
+        try:
+            save_submission(submission)
+        except AlreadySubmitted:
+            intake.status, intake.error = 'rejected', "Siz ushbu testni yechib bo'lgansiz!"
+
+
+def requeue_failed(intakes, error):
+    """
+    Xato bilan tugagan varaqlarni navbatga qaytarish. SUBMISSION_INGEST_MAX_ATTEMPTS marta
+    muvaffaqiyatsiz bo'lganlari rad etiladi - boshqa testlarning varaqlarini to'sib qo'ymaydi.
+    """
+    failed = SubmissionIntake.objects.filter(id__in=[i.id for i in intakes], status='processing')
+    failed.update(attempts=F('attempts') + 1)
+    rejected = failed.filter(attempts__gte=settings.SUBMISSION_INGEST_MAX_ATTEMPTS).update(
+        status='rejected', error=f"Javobni qayta ishlab bo'lmadi: {error}"[:1000], processed_at=timezone.now()
+    )
+    failed.update(status='pending', claimed_at=None)
+    return rejected
+
+
+def process_intakes():
+    """Navbat bo'sh qolguncha varaqlarni partiyalab qayta ishlash. Yaratilgan natijalar sonini qaytaradi"""
+    created = 0
+    while True:
+        batch = claim_batch(settings.SUBMISSION_INGEST_BATCH_SIZE)
+        if not batch:
+            return created
+        by_test = {}
+        for intake in batch:
+            by_test.setdefault(intake.test_id, []).append(intake)
+        failed = False
+        for test_id, intakes in by_test.items():
+            try:
+                created += process_test_batch(test_id, intakes)
+            except Exception as e:
+                # Faqat shu testning varaqlari navbatga qaytariladi, qolgan testlar qayta ishlanadi
+                logger.error(f"Intake batch error for test {test_id}: {e}")
+                requeue_failed(intakes, e)
+                failed = True
+        if failed:
+            # Qaytarilgan varaqlar darhol qayta olinmaydi - keyingi (davriy) urinishda
+            return created
+
+
+def cleanup_intakes():
+    """Qayta ishlangan (done/rejected) eski varaqlarni o'chirish"""
+    cutoff = timezone.now() - timedelta(days=settings.SUBMISSION_INTAKE_RETENTION_DAYS)
+    deleted, _ = SubmissionIntake.objects.filter(status__in=['done', 'rejected'], processed_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,99 @@
+"""
+Access code bo'yicha test manifesti keshi (imtihon kuni eng ko'p chaqiriladigan endpoint uchun).
+Ikki daraja: jarayon ichida (bir necha soniya) va umumiy kesh (Redis).
+Test yoki savollar o'zgarganda signals.py orqali tozalanadi.
+Har bir yozuv bilan birga uning ETag qiymati saqlanadi (conditional GET uchun).
+"""
+import json
+import time
+import logging
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+_local = {}  # access_code -> ((data, etag), expires_at)
+_local_lock = threading.Lock()
+
+
+def manifest_key(access_code):
+    return f"test:manifest:v2:{access_code}"
+
+
+def _get_local(access_code):
+    item = _local.get(access_code)
+    if item and item[1] > time.monotonic():
+        return item[0]
+    return None
+
+
+def _set_local(access_code, entry):
+    with _local_lock:
+        if len(_local) >= settings.TEST_MANIFEST_LOCAL_SIZE:
+            _local.clear()
+        _local[access_code] = (entry, time.monotonic() + settings.TEST_MANIFEST_LOCAL_TTL)
+
+
+def load_manifest(access_code):
+    """Bazadan o'qish va keshga yozish. (data, etag) yoki test topilmasa None"""
+    from .models import Test
+    from .serializers import TestSerializer
+    from .etags import make_etag
+
+    test = Test.objects.filter(access_code=access_code).select_related('creator').prefetch_related('questions').first()
+    if test is None:
+        return None
+    test.is_expired()  # Muddati o'tgan bo'lsa shu yerda yakunlanadi
+    data = TestSerializer(test).data
+    # ETag keshga yozishda bir marta hisoblanadi
+    entry = (data, make_etag(json.dumps(data, sort_keys=True, default=str)))
+    try:
+        cache.set(manifest_key(access_code), entry, timeout=settings.TEST_MANIFEST_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Manifest cache write error: {e}")
+    return entry
+
+
+def get_manifest_entry(access_code):
+    """
+    Test manifesti (TestSerializer ma'lumotlari) va uning ETag qiymati. Statistika maydonlari
+    kesh muddati davomida eskirgan bo'lishi mumkin. Muddat keshdagi expires_at bo'yicha
+    bazaga murojaatsiz tekshiriladi.
+    """
+    entry = _get_local(access_code)
+    if entry is None:
+        try:
+            entry = cache.get(manifest_key(access_code))
+        except Exception as e:
+            logger.warning(f"Manifest cache read error: {e}")
+        if entry is None:
+            entry = load_manifest(access_code)
+            if entry is None:
+                return None
+        _set_local(access_code, entry)
+
+    data, etag = entry
+    if data.get('is_active') and data.get('expires_at'):
+        expires_at = parse_datetime(data['expires_at'])
+        if expires_at and expires_at <= timezone.now():
+            # Bazadagi yakunlashni check_expired_tests_task bajaradi
+            from .etags import make_etag
+            data, etag = {**data, 'is_active': False}, make_etag(etag, 'expired')
+    return data, etag
+
+
+def get_manifest(access_code):
+    entry = get_manifest_entry(access_code)
+    return entry[0] if entry else None
+
+
+def invalidate_manifest(access_code):
+    with _local_lock:
+        _local.pop(access_code, None)
+    try:
+        cache.delete(manifest_key(access_code))
+    except Exception as e:
+        logger.warning(f"Manifest cache delete error: {e}")
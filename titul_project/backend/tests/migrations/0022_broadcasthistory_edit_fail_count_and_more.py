@@ -0,0 +1,43 @@
+# Generated by Django 4.2.9 on 2026-10-19 15:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0021_systemsettings_support_link'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='broadcasthistory',
+            name='edit_fail_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='broadcasthistory',
+            name='edit_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Kutilmoqda'), ('processing', 'Yuborilmoqda'), ('completed', 'Tugallandi'), ('failed', 'Xatolik')], max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='broadcasthistory',
+            name='edit_success_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='broadcasthistory',
+            name='edit_total',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='broadcasthistory',
+            name='edited_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='broadcasthistory',
+            name='media_file_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
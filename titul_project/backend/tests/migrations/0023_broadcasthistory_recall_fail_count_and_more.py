@@ -0,0 +1,38 @@
+# Generated by Django 4.2.9 on 2026-10-19 15:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0022_broadcasthistory_edit_fail_count_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='broadcasthistory',
+            name='recall_fail_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='broadcasthistory',
+            name='recall_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Kutilmoqda'), ('processing', 'Yuborilmoqda'), ('completed', 'Tugallandi'), ('failed', 'Xatolik')], max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='broadcasthistory',
+            name='recall_success_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='broadcasthistory',
+            name='recall_total',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='broadcasthistory',
+            name='recalled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
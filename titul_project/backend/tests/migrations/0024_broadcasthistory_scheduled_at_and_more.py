@@ -0,0 +1,47 @@
+# Generated by Django 4.2.9 on 2026-10-19 15:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0023_broadcasthistory_recall_fail_count_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='broadcasthistory',
+            name='scheduled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='broadcasthistory',
+            name='segment',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='is_reachable',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AlterField(
+            model_name='broadcasthistory',
+            name='edit_status',
+            field=models.CharField(blank=True, choices=[('scheduled', 'Rejalashtirilgan'), ('pending', 'Kutilmoqda'), ('processing', 'Yuborilmoqda'), ('completed', 'Tugallandi'), ('failed', 'Xatolik')], max_length=20, null=True),
+        ),
+        migrations.AlterField(
+            model_name='broadcasthistory',
+            name='recall_status',
+            field=models.CharField(blank=True, choices=[('scheduled', 'Rejalashtirilgan'), ('pending', 'Kutilmoqda'), ('processing', 'Yuborilmoqda'), ('completed', 'Tugallandi'), ('failed', 'Xatolik')], max_length=20, null=True),
+        ),
+        migrations.AlterField(
+            model_name='broadcasthistory',
+            name='status',
+            field=models.CharField(choices=[('scheduled', 'Rejalashtirilgan'), ('pending', 'Kutilmoqda'), ('processing', 'Yuborilmoqda'), ('completed', 'Tugallandi'), ('failed', 'Xatolik')], default='pending', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='broadcastrecipient',
+            index=models.Index(fields=['broadcast', 'status'], name='broadcast_r_broadca_4c2f76_idx'),
+        ),
+    ]
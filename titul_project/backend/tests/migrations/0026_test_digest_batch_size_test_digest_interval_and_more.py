@@ -0,0 +1,43 @@
+# Generated by Django 4.2.9 on 2026-10-19 15:29
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def skip_existing_submissions(apps, schema_editor):
+    """Mavjud natijalar birinchi digestga kirmasligi uchun"""
+    Test = apps.get_model('tests', 'Test')
+    Submission = apps.get_model('tests', 'Submission')
+    last_ids = Submission.objects.filter(test=OuterRef('pk')).values('test').annotate(last_id=Max('id')).values('last_id')
+    Test.objects.filter(submissions__isnull=False).distinct().update(digest_last_submission_id=Subquery(last_ids))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0025_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='test',
+            name='digest_batch_size',
+            field=models.PositiveIntegerField(default=50),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='digest_interval',
+            field=models.PositiveIntegerField(default=60),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='digest_last_submission_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='notify_mode',
+            field=models.CharField(choices=[('digest', 'Jamlanma (digest)'), ('each', 'Har bir natija'), ('off', "O'chirilgan")], default='digest', max_length=10),
+        ),
+        migrations.RunPython(skip_existing_submissions, migrations.RunPython.noop),
+    ]
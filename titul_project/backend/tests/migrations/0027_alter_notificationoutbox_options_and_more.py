@@ -0,0 +1,36 @@
+# Generated by Django 4.2.9 on 2026-10-19 15:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0026_test_digest_batch_size_test_digest_interval_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='notificationoutbox',
+            options={'ordering': ['priority', 'id']},
+        ),
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='extra',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='method',
+            field=models.CharField(default='sendMessage', max_length=30),
+        ),
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='priority',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='notificationoutbox',
+            index=models.Index(fields=['status', 'priority', 'id'], name='notificatio_status_f707fb_idx'),
+        ),
+    ]
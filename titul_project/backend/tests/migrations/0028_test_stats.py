@@ -0,0 +1,64 @@
+# Generated by Django 4.2.9 on 2026-10-19 15:44
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Q, Sum
+
+
+def backfill_stats(apps, schema_editor):
+    """Mavjud testlar uchun statistikani hisoblash (stats.py dagi qoidalar bilan)"""
+    Test = apps.get_model('tests', 'Test')
+    Question = apps.get_model('tests', 'Question')
+    Submission = apps.get_model('tests', 'Submission')
+
+    for test in Test.objects.all().only('id').iterator():
+        questions = Question.objects.filter(test_id=test.id)
+        latest = {}
+        for telegram_id, name, score in Submission.objects.filter(test_id=test.id).order_by('submitted_at', 'id').values_list(
+            'student_telegram_id', 'student_name', 'score'
+        ):
+            latest[(telegram_id, name.strip().lower())] = score
+        scores = list(latest.values())
+        Test.objects.filter(id=test.id).update(
+            submissions_count=len(scores),
+            score_sum=sum(scores, Decimal('0')),
+            max_score=max(scores, default=Decimal('0')),
+            total_points=questions.aggregate(total=Sum('points'))['total'] or Decimal('0'),
+            is_points_based=questions.filter(Q(question_type__in=['manual', 'writing']) | ~Q(points=1)).exists(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0027_alter_notificationoutbox_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='test',
+            name='is_points_based',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='max_score',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='score_sum',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='submissions_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='total_points',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
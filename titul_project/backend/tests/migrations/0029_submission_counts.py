@@ -0,0 +1,90 @@
+# Generated by Django 4.2.9 on 2026-10-19 15:46
+
+import json
+
+from django.db import migrations, models
+
+
+# Migratsiya yozilgan paytdagi tekshirish qoidalari (tests.scoring dan nusxa) - keyingi
+# o'zgarishlar tarixiy migratsiyaga ta'sir qilmasligi uchun
+def is_choice_correct(student_answer, correct_answer):
+    return str(student_answer).strip().upper() == str(correct_answer).strip().upper()
+
+
+def is_writing_correct(student_answer, correct_answer):
+    try:
+        correct_parts = json.loads(correct_answer)
+    except (TypeError, ValueError):
+        correct_parts = None
+    if not isinstance(correct_parts, list):
+        return str(student_answer).strip().lower() == str(correct_answer).strip().lower()
+
+    if isinstance(student_answer, list):
+        student_parts = student_answer
+    elif isinstance(student_answer, str) and student_answer.startswith('['):
+        try:
+            student_parts = json.loads(student_answer)
+        except ValueError:
+            student_parts = [student_answer]
+    else:
+        student_parts = [student_answer]
+
+    try:
+        for i, alternatives in enumerate(correct_parts):
+            part_answer = str(student_parts[i]).strip().lower() if i < len(student_parts) else ""
+            if not any(str(alt).strip().lower() == part_answer for alt in alternatives):
+                return False
+        return True
+    except Exception:
+        return str(student_answer).strip().lower() == str(correct_answer).strip().lower()
+
+
+def backfill_counts(apps, schema_editor):
+    """Mavjud natijalar uchun to'g'ri/xato javoblar sonini hisoblash"""
+    Question = apps.get_model('tests', 'Question')
+    Submission = apps.get_model('tests', 'Submission')
+
+    checks = {'choice': is_choice_correct, 'writing': is_writing_correct}
+    questions_by_test = {}
+    for question in Question.objects.filter(question_type__in=checks).only(
+        'test_id', 'question_number', 'question_type', 'correct_answer'
+    ).iterator():
+        questions_by_test.setdefault(question.test_id, []).append(question)
+
+    batch = []
+    for submission in Submission.objects.only('id', 'test_id', 'answers').iterator():
+        answers = submission.answers or {}
+        questions = questions_by_test.get(submission.test_id, [])
+        correct = sum(
+            1 for q in questions
+            if checks[q.question_type](answers.get(str(q.question_number), ''), q.correct_answer)
+        )
+        submission.correct_count = correct
+        submission.wrong_count = len(questions) - correct
+        batch.append(submission)
+        if len(batch) >= 500:
+            Submission.objects.bulk_update(batch, ['correct_count', 'wrong_count'])
+            batch = []
+    if batch:
+        Submission.objects.bulk_update(batch, ['correct_count', 'wrong_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0028_test_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='correct_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='wrong_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
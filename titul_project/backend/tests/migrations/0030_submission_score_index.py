@@ -0,0 +1,17 @@
+# Generated by Django 4.2.9 on 2026-10-19 15:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0029_submission_counts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['test', '-score', '-id'], name='submission_test_score_idx'),
+        ),
+    ]
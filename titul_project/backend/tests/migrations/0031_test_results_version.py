@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-19 15:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0030_submission_score_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='test',
+            name='results_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
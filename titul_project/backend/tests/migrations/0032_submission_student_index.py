@@ -0,0 +1,17 @@
+# Generated by Django 4.2.9 on 2026-10-19 15:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0031_test_results_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['test', 'student_telegram_id', 'attempt_number'], name='submission_student_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.9 on 2026-10-19 15:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0032_submission_student_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='test',
+            name='ingest_mode',
+            field=models.CharField(choices=[('auto', 'Yuklamaga qarab'), ('sync', 'Darhol baholash'), ('async', 'Navbat orqali')], default='auto', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='SubmissionIntake',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('student_telegram_id', models.BigIntegerField()),
+                ('student_name', models.CharField(max_length=255)),
+                ('answers', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'Kutilmoqda'), ('processing', 'Baholanmoqda'), ('done', 'Baholandi'), ('rejected', 'Rad etildi')], default='pending', max_length=10)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('submission', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='intake', to='tests.submission')),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='intakes', to='tests.test')),
+            ],
+            options={
+                'db_table': 'submission_intakes',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='submission__status_4bbb2c_idx')],
+            },
+        ),
+    ]
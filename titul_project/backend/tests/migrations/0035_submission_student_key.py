@@ -0,0 +1,23 @@
+# Generated by Django 4.2.9 on 2026-10-19 16:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0034_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='single_key',
+            field=models.CharField(blank=True, editable=False, max_length=264, null=True),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='student_key',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.9 on 2026-10-19 16:04
+
+from django.db import migrations
+
+
+# tests.models.normalize_student_name nusxasi - keyingi o'zgarishlar tarixiy migratsiyaga ta'sir qilmasligi uchun
+def normalize_student_name(name):
+    return name.strip().lower()
+
+
+def backfill_student_key(apps, schema_editor):
+    """
+    Mavjud natijalar uchun student_key. Parallel yuborishlar natijasida takrorlangan urinish
+    raqamlari bo'lsa, o'quvchining urinishlari yuborilgan vaqti bo'yicha qayta raqamlanadi
+    """
+    Submission = apps.get_model('tests', 'Submission')
+
+    def flush(groups):
+        changed = []
+        for rows in groups.values():
+            duplicated = len({row.attempt_number for row in rows}) < len(rows)
+            for number, row in enumerate(rows, start=1):
+                if duplicated:
+                    row.attempt_number = number
+                changed.append(row)
+        Submission.objects.bulk_update(changed, ['student_key', 'attempt_number'], batch_size=500)
+
+    groups, current_test = {}, None
+    for submission in Submission.objects.only(
+        'id', 'test_id', 'student_telegram_id', 'student_name', 'attempt_number', 'submitted_at'
+    ).order_by('test_id', 'submitted_at', 'id').iterator():
+        if submission.test_id != current_test:
+            flush(groups)
+            groups, current_test = {}, submission.test_id
+        submission.student_key = normalize_student_name(submission.student_name)
+        groups.setdefault((submission.student_telegram_id, submission.student_key), []).append(submission)
+    flush(groups)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0035_submission_student_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_student_key, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.9 on 2026-10-19 16:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0036_backfill_student_key'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='submission',
+            constraint=models.UniqueConstraint(fields=('test', 'student_telegram_id', 'student_key', 'attempt_number'), name='submission_attempt_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='submission',
+            constraint=models.UniqueConstraint(fields=('test', 'single_key'), name='submission_single_unique'),
+        ),
+    ]
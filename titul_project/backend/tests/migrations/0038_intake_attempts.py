@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-19 16:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0037_submission_attempt_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submissionintake',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-19 16:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0038_intake_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='broadcasthistory',
+            name='last_error',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-19 16:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0039_broadcast_last_error'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='broadcasthistory',
+            name='resume_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
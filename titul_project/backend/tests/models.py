@@ -2,6 +2,7 @@ from django.db import models
 from django.utils import timezone
 import string
 import random
+import uuid
 import logging
 
 logger = logging.getLogger(__name__)
@@ -27,6 +28,8 @@ class User(models.Model):
     role = models.CharField(max_length=15, choices=ROLE_CHOICES, default='user')
     balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     free_tests_used = models.IntegerField(default=0)
+    # Botni bloklagan foydalanuvchilar broadcast paytida False qilinadi
+    is_reachable = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -77,6 +80,18 @@ class Test(models.Model):
         ('single', 'Faqat 1 marta'),
         ('multiple', 'Ko\'p marta (Cheksiz)'),
     ]
+
+    NOTIFY_CHOICES = [
+        ('digest', 'Jamlanma (digest)'),
+        ('each', 'Har bir natija'),
+        ('off', 'O\'chirilgan'),
+    ]
+
+    INGEST_CHOICES = [
+        ('auto', 'Yuklamaga qarab'),
+        ('sync', 'Darhol baholash'),
+        ('async', 'Navbat orqali'),
+    ]
     
     creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_tests')
     creator_name = models.CharField(max_length=255, null=True, blank=True)
@@ -90,6 +105,24 @@ class Test(models.Model):
     expires_at = models.DateTimeField(null=True, blank=True)
     finished_at = models.DateTimeField(null=True, blank=True)
     is_calibrated = models.BooleanField(default=False)
+    # Yangi natijalar haqida o'qituvchini xabardor qilish (digest.py ga qarang)
+    notify_mode = models.CharField(max_length=10, choices=NOTIFY_CHOICES, default='digest')
+    digest_interval = models.PositiveIntegerField(default=60)  # soniya
+    digest_batch_size = models.PositiveIntegerField(default=50)  # shuncha natija yig'ilsa darhol yuboriladi
+    digest_last_submission_id = models.BigIntegerField(default=0)  # oxirgi digestga kirgan natija
+    # Javoblarni qabul qilish: darhol yoki navbat orqali (ingest.py ga qarang)
+    ingest_mode = models.CharField(max_length=10, choices=INGEST_CHOICES, default='auto')
+    # Statistika (har bir o'quvchining oxirgi urinishi bo'yicha) - stats.py orqali yangilanadi
+    submissions_count = models.PositiveIntegerField(default=0)  # unikal o'quvchilar
+    score_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    max_score = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    total_points = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    is_points_based = models.BooleanField(default=False)  # manual/yozma savollar yoki 1 dan farqli ballar
+    results_version = models.PositiveIntegerField(default=0)  # natijalar har o'zgarganda oshadi (ETag uchun)
+
+    # Bu maydonlar faqat stats.py orqali (F() bilan) yoziladi - mavjud testni
+    # saqlashda doim update_fields ko'rsatiladi, aks holda eskirgan qiymatlar yozilib qoladi
+    STATS_FIELDS = ('submissions_count', 'score_sum', 'max_score', 'total_points', 'is_points_based', 'results_version')
     
     class Meta:
         db_table = 'tests'
@@ -111,7 +144,7 @@ class Test(models.Model):
         self.is_active = True
         self.expires_at = new_expiry
         self.finished_at = None
-        self.save()
+        self.save(update_fields=['is_active', 'expires_at', 'finished_at'])
 
     def finish(self, send_notify=True):
         """Testni yakunlash"""
@@ -120,7 +153,7 @@ class Test(models.Model):
             
         self.is_active = False
         self.finished_at = timezone.now()
-        self.save()
+        self.save(update_fields=['is_active', 'finished_at'])
         
         # 1. Darhol "Natijalar tayyorlanmoqda" xabarini yuborish
         if send_notify:
@@ -138,57 +171,12 @@ class Test(models.Model):
             except Exception as e:
                 logger.error(f"Error triggering background task: {e}")
 
-    @property
-    def is_points_based(self):
-        """Test ballik tizimdami (manual grading yoki maxsus ballar)"""
-        # Manual yoki writing savollar bo'lsa
-        if self.questions.filter(question_type__in=['manual', 'writing']).exists():
-            return True
-        # Har bir savol balli 1.0 dan farqli bo'lsa
-        if self.questions.exclude(points=1.0).exists():
-            return True
-        return False
-
-    @property
-    def submissions_count(self):
-        """Unikal o'quvchilar soni (ID + Ism bo'yicha)"""
-        # Har bir unikal (ID, Ism) juftligi bitta o'quvchi deb hisoblanadi
-        return self.submissions.values('student_telegram_id', 'student_name').distinct().count()
-
     @property
     def average_score(self):
-        """O'rtacha ball (har bir o'quvchining faqat oxirgi urinishini hisobga oladi)"""
-        from django.db.models import Avg
-        from .rasch_service import get_latest_submissions_queryset
-        
-        latest_subs = get_latest_submissions_queryset(self)
-        avg = latest_subs.aggregate(Avg('score'))['score__avg']
-        return round(float(avg or 0), 1)
-
-    @property
-    def max_score(self):
-        """Har bir o'quvchining faqat oxirgi urinishi bo'yicha maksimal ball"""
-        from django.db.models import OuterRef, Subquery, Max
-        latest_submissions = Submission.objects.filter(
-            test=self,
-            student_telegram_id=OuterRef('student_telegram_id')
-        ).order_by('-submitted_at').values('id')[:1]
-        
-        max_v = Submission.objects.filter(
-            id__in=Subquery(
-                Submission.objects.filter(test=self)
-                .values('student_telegram_id')
-                .annotate(latest_id=Subquery(latest_submissions))
-                .values('latest_id')
-            )
-        ).aggregate(Max('score'))['score__max']
-        
-        return max_v if max_v is not None else 0
-
-    @property
-    def total_points(self):
-        points = self.questions.aggregate(models.Sum('points'))['points__sum']
-        return points if points is not None else 0
+        """O'rtacha ball (har bir o'quvchining faqat oxirgi urinishi)"""
+        if not self.submissions_count:
+            return 0.0
+        return round(float(self.score_sum) / self.submissions_count, 1)
 
 
 class Question(models.Model):
@@ -216,6 +204,11 @@ class Question(models.Model):
         return f"Test {self.test.access_code} - Savol {self.question_number}"
 
 
+def normalize_student_name(name):
+    """Urinishlar guruhlanadigan ism kaliti: bo'shliqlarsiz, kichik harflarda"""
+    return name.strip().lower()
+
+
 class Submission(models.Model):
     """Talaba javoblari"""
     GRADE_CHOICES = [
@@ -237,36 +230,51 @@ class Submission(models.Model):
     ability_logit = models.DecimalField(max_digits=10, decimal_places=4, default=0.0000)
     scaled_score = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     grade = models.CharField(max_length=2, choices=GRADE_CHOICES, null=True, blank=True)
+    # Ro'yxatlar uchun: calculate_score da hisoblanadi (faqat variantli va yozma savollar)
+    correct_count = models.PositiveIntegerField(default=0)
+    wrong_count = models.PositiveIntegerField(default=0)
+    # Mijoz yuborgan Idempotency-Key: qayta yuborilgan so'rovga asl javob qaytariladi
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, unique=True)
+    # O'quvchi = (student_telegram_id, student_key); urinish raqami shu juftlik ichida unique
+    student_key = models.CharField(max_length=255, default='', editable=False)
+    # Bir martalik rejimda: "id:<telegram_id>" yoki veb uchun "name:<student_key>" - test ichida unique
+    single_key = models.CharField(max_length=264, null=True, blank=True, editable=False)
     submitted_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         db_table = 'submissions'
         ordering = ['-submitted_at']
-        # uniqueness olib tashlandi, chunki ko'p martalik rejim qo'shildi
+        indexes = [
+            # Natijalar ro'yxati: keyset pagination (score, id) bo'yicha
+            models.Index(fields=['test', '-score', '-id'], name='submission_test_score_idx'),
+            # O'quvchi urinishlari: check_attempt_status va urinish raqami
+            models.Index(fields=['test', 'student_telegram_id', 'attempt_number'], name='submission_student_idx'),
+        ]
+        # Parallel yuborishlarda urinish raqami va bir martalik rejim baza darajasida himoyalangan (ingest.save_submission)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['test', 'student_telegram_id', 'student_key', 'attempt_number'],
+                name='submission_attempt_unique',
+            ),
+            models.UniqueConstraint(fields=['test', 'single_key'], name='submission_single_unique'),
+        ]
     
     def __str__(self):
         return f"{self.student_name} - {self.test.access_code} ({self.score} ball)"
+
+    def save(self, *args, **kwargs):
+        self.student_key = normalize_student_name(self.student_name)
+        super().save(*args, **kwargs)
     
     def calculate_score(self, send_notify=False):
         """Ball va darajani hisoblash (Milliy Sertifikat standarti)"""
         from decimal import Decimal
         import json
         
-        questions = self.test.questions.all().order_by('question_number')
-        total_possible_score = sum(q.points for q in questions)
-        earned_score = Decimal('0.0')
-        
-        from .scoring import get_question_result
-        
-        for question in questions:
-            q_num = str(question.question_number)
-            student_answer = self.answers.get(q_num, '')
-            
-            is_correct, earned_points = get_question_result(question, student_answer)
-            earned_score += earned_points
-            
-            logger.debug(f"Q{q_num} ({question.question_type}): Student='{student_answer}', Correct='{(question.correct_answer or '')[:20]}...' -> {'OK' if is_correct else 'WRONG'}")
+        from .scoring import grade_answers, grade_for_percentage
         
+        questions = self.test.questions.all().order_by('question_number')
+        earned_score, total_possible_score, self.correct_count, self.wrong_count = grade_answers(questions, self.answers)
         self.score = earned_score
         
         # Darajani aniqlash (Milliy sertifikat standarti bo'yicha)
@@ -277,23 +285,16 @@ class Submission(models.Model):
             calc_percentage = float(self.scaled_score)
         elif total_possible_score > Decimal('0'):
             calc_percentage = float((earned_score / total_possible_score) * 100)
-        
-        if calc_percentage >= 70: self.grade = 'A+'
-        elif calc_percentage >= 65: self.grade = 'A'
-        elif calc_percentage >= 60: self.grade = 'B+'
-        elif calc_percentage >= 55: self.grade = 'B'
-        elif calc_percentage >= 50: self.grade = 'C+'
-        elif calc_percentage >= 46: self.grade = 'C'
-        else: self.grade = 'F'
+        self.grade = grade_for_percentage(calc_percentage)
         
         self.save()
         
         if send_notify:
             try:
-                from .notifications import send_telegram_notification
+                from .outbox import queue_notification
                 creator_chat_id = self.test.creator.telegram_id
                 msg = f"Natija yuborildi!\n\nTest: {self.test.title}\nTalaba: {self.student_name}\nBall: {self.score}\nDaraja: {self.grade}"
-                send_telegram_notification(creator_chat_id, msg)
+                queue_notification(creator_chat_id, msg, kind='submission', parse_mode='')
             except Exception as e:
                 logger.error(f"Notification error: {e}")
         
@@ -363,6 +364,7 @@ class Announcement(models.Model):
 class BroadcastHistory(models.Model):
     """Xabar yuborish tarixi va statusi"""
     STATUS_CHOICES = [
+        ('scheduled', 'Rejalashtirilgan'),
         ('pending', 'Kutilmoqda'),
         ('processing', 'Yuborilmoqda'),
         ('completed', 'Tugallandi'),
@@ -374,10 +376,29 @@ class BroadcastHistory(models.Model):
     image = models.ImageField(upload_to='broadcasts/images/', null=True, blank=True)
     file = models.FileField(upload_to='broadcasts/files/', null=True, blank=True)
     target_roles = models.JSONField(default=list)  # ['all'], ['admin', 'teacher'], etc.
+    segment = models.JSONField(default=dict, blank=True)  # {'active_days': 7, 'has_balance': True}, audience.py ga qarang
+    scheduled_at = models.DateTimeField(null=True, blank=True)
     total_users = models.IntegerField(default=0)
     success_count = models.IntegerField(default=0)
     fail_count = models.IntegerField(default=0)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # Telegramga yuklangan media file_id si (media faqat bir marta yuklanadi)
+    media_file_id = models.CharField(max_length=255, null=True, blank=True)
+    # Tahrirlash jarayoni statistikasi
+    edit_status = models.CharField(max_length=20, choices=STATUS_CHOICES, null=True, blank=True)
+    edit_total = models.IntegerField(default=0)
+    edit_success_count = models.IntegerField(default=0)
+    edit_fail_count = models.IntegerField(default=0)
+    edited_at = models.DateTimeField(null=True, blank=True)
+    # Qaytarib olish (foydalanuvchilar chatidan o'chirish) statistikasi
+    recall_status = models.CharField(max_length=20, choices=STATUS_CHOICES, null=True, blank=True)
+    recall_total = models.IntegerField(default=0)
+    recall_success_count = models.IntegerField(default=0)
+    recall_fail_count = models.IntegerField(default=0)
+    recalled_at = models.DateTimeField(null=True, blank=True)
+    # Yuborish, tahrirlash yoki qaytarib olish xato bilan tugaganda ('failed')
+    last_error = models.TextField(null=True, blank=True)
+    resume_count = models.PositiveIntegerField(default=0)  # resume_stalled_broadcasts_task qayta boshlashlari
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     
@@ -392,13 +413,14 @@ class BroadcastRecipient(models.Model):
     broadcast = models.ForeignKey(BroadcastHistory, on_delete=models.CASCADE, related_name='recipients')
     telegram_id = models.BigIntegerField()
     message_id = models.BigIntegerField(null=True, blank=True)
-    status = models.CharField(max_length=20, default='sent')
+    status = models.CharField(max_length=20, default='sent')  # queued, sent, failed, deleted
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = 'broadcast_recipients'
         indexes = [
             models.Index(fields=['broadcast', 'telegram_id']),
+            models.Index(fields=['broadcast', 'status']),
         ]
 
 class SystemSettings(models.Model):
@@ -468,3 +490,80 @@ class ActivityLog(models.Model):
 
     def __str__(self):
         return f"{self.event_type} - {self.created_at}"
+
+
+class NotificationOutbox(models.Model):
+    """
+    Yuborilishi kerak bo'lgan Telegram bildirishnomalari (outbox).
+    So'rov bilan bir tranzaksiyada yoziladi va Celery tomonidan yuboriladi.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Kutilmoqda'),
+        ('sending', 'Yuborilmoqda'),
+        ('sent', 'Yuborildi'),
+        ('failed', 'Xatolik'),
+    ]
+
+    chat_id = models.BigIntegerField()
+    method = models.CharField(max_length=30, default='sendMessage')  # sendMessage, sendPhoto, sendDocument
+    text = models.TextField()  # sendPhoto/sendDocument uchun caption
+    parse_mode = models.CharField(max_length=10, default='HTML', blank=True)
+    extra = models.JSONField(default=dict, blank=True)  # photo/document file_id, reply_markup
+    kind = models.CharField(max_length=30, default='general')  # payment, test_created, test_finished, submission
+    # 0 - tranzaksion, 1 - hisobot, 2 - broadcast (broadcast_service.PRIORITY_*)
+    priority = models.PositiveSmallIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    available_at = models.DateTimeField(default=timezone.now)  # Qayta urinish vaqti
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'notification_outbox'
+        ordering = ['priority', 'id']
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+            models.Index(fields=['status', 'priority', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} -> {self.chat_id} ({self.status})"
+
+
+class SubmissionIntake(models.Model):
+    """
+    Navbat orqali qabul qilingan javoblar varaqasi (imtihon oxiridagi yuklama uchun).
+    So'rovda faqat yoziladi, baholash va Submission yaratish Celery'da partiyalab bajariladi.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Kutilmoqda'),
+        ('processing', 'Baholanmoqda'),
+        ('done', 'Baholandi'),
+        ('rejected', 'Rad etildi'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)  # Qabul raqami (receipt)
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='intakes')
+    student_telegram_id = models.BigIntegerField()
+    student_name = models.CharField(max_length=255)
+    answers = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    submission = models.OneToOneField(Submission, on_delete=models.SET_NULL, null=True, blank=True, related_name='intake')
+    error = models.TextField(null=True, blank=True)
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, unique=True)
+    attempts = models.PositiveIntegerField(default=0)  # Xato bilan tugagan qayta ishlashlar soni
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'submission_intakes'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.student_name} - {self.test_id} ({self.status})"
@@ -1,7 +1,7 @@
-import os
-import requests
 import logging
+import requests
 from django.conf import settings
+from . import telegram_client
 
 logger = logging.getLogger(__name__)
 
@@ -9,12 +9,10 @@ def send_telegram_notification(chat_id, text):
     """
     Telegram bot orqali xabar yuborish
     """
-    token = settings.TELEGRAM_BOT_TOKEN
-    if not token:
+    if not settings.TELEGRAM_BOT_TOKEN:
         logger.error("TELEGRAM_BOT_TOKEN sozlamalarda topilmadi!")
         return False
     
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
     payload = {
         "chat_id": chat_id,
         "text": text,
@@ -22,10 +20,12 @@ def send_telegram_notification(chat_id, text):
     }
     
     try:
-        response = requests.post(url, json=payload, timeout=10)
+        from .broadcast_service import get_rate_limiter
+        get_rate_limiter().acquire()
+        response = telegram_client.post('sendMessage', payload)
         response.raise_for_status()
         return True
-    except Exception as e:
+    except requests.RequestException as e:
         logger.error(f"Telegram xabar yuborishda xatolik: {e}")
         return False
 
@@ -33,12 +33,10 @@ def send_telegram_document(chat_id, document, filename, caption=None):
     """
     Telegram bot orqali hujjat yuborish
     """
-    token = settings.TELEGRAM_BOT_TOKEN
-    if not token:
+    if not settings.TELEGRAM_BOT_TOKEN:
         logger.error("TELEGRAM_BOT_TOKEN sozlamalarda topilmadi!")
         return False
     
-    url = f"https://api.telegram.org/bot{token}/sendDocument"
     data = {
         "chat_id": chat_id,
         "parse_mode": "HTML"
@@ -51,9 +49,12 @@ def send_telegram_document(chat_id, document, filename, caption=None):
     }
     
     try:
-        response = requests.post(url, data=data, files=files, timeout=30)
+        # Hisobotlar umumiy limit orqali yuboriladi (broadcastlardan ustun, tranzaksion xabarlardan keyin)
+        from .broadcast_service import get_rate_limiter, PRIORITY_REPORT
+        get_rate_limiter().acquire(PRIORITY_REPORT)
+        response = telegram_client.post('sendDocument', data, files=files)
         response.raise_for_status()
         return True
-    except Exception as e:
+    except requests.RequestException as e:
         logger.error(f"Telegram hujjat yuborishda xatolik: {e}")
         return False
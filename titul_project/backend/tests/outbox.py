@@ -0,0 +1,108 @@
+"""
+Bildirishnomalar outbox'i: xabar joriy tranzaksiya ichida bazaga yoziladi,
+Telegramga esa Celery ishchisi yuboradi (so'rov Telegramni kutmaydi)
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .models import NotificationOutbox
+from .broadcast_service import telegram_request, fan_out, PRIORITY_TRANSACTIONAL
+
+logger = logging.getLogger(__name__)
+
+# Qayta urinib ko'rishga arziydigan javoblar (tarmoq xatosi, 429, server xatolari)
+RETRYABLE_STATUSES = (None, 429, 500, 502, 503, 504)
+
+
+def queue_notification(chat_id, text, kind='general', parse_mode='HTML',
+                       priority=PRIORITY_TRANSACTIONAL, method='sendMessage', extra=None):
+    """Bildirishnomani outbox'ga yozish. Tranzaksiya yakunlangach yuborish boshlanadi"""
+    if not chat_id:
+        return None
+    notification = NotificationOutbox.objects.create(
+        chat_id=chat_id, text=text, kind=kind, parse_mode=parse_mode,
+        priority=priority, method=method, extra=extra or {}
+    )
+    transaction.on_commit(schedule_drain)
+    return notification
+
+
+def schedule_drain():
+    """Outbox'ni yuboruvchi taskni navbatga qo'yish (qisqa vaqt ichida faqat bir marta)"""
+    try:
+        if not cache.add('notification_outbox:drain', 1, timeout=2):
+            return
+    except Exception as e:
+        logger.warning(f"Outbox drain flag error: {e}")
+
+    try:
+        from .tasks import drain_notification_outbox_task
+        drain_notification_outbox_task.delay()
+    except Exception as e:
+        # Broker ishlamasa ham xabar yo'qolmaydi - davriy task yuboradi
+        logger.error(f"Error scheduling outbox drain: {e}")
+
+
+def claim_batch(limit):
+    """Navbatdagi xabarlarni band qilish (bir nechta ishchi bir xil xabarni olmaydi)"""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            NotificationOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', available_at__lte=now)
+            .order_by('priority', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if ids:
+            NotificationOutbox.objects.filter(id__in=ids).update(status='sending', claimed_at=now)
+    return list(NotificationOutbox.objects.filter(id__in=ids).order_by('priority', 'id'))
+
+
+def send_notification(notification):
+    text_field = 'text' if notification.method == 'sendMessage' else 'caption'
+    payload = {'chat_id': notification.chat_id, text_field: notification.text, **notification.extra}
+    if notification.parse_mode:
+        payload['parse_mode'] = notification.parse_mode
+    return telegram_request(notification.method, payload, priority=notification.priority)
+
+
+def drain_outbox():
+    """Outbox bo'sh qolguncha xabarlarni partiyalab yuborish. Yuborilganlar sonini qaytaradi"""
+    batch_size = settings.NOTIFICATION_BATCH_SIZE
+    max_attempts = settings.NOTIFICATION_MAX_ATTEMPTS
+    sent = 0
+
+    while True:
+        batch = claim_batch(batch_size)
+        if not batch:
+            return sent
+
+        to_update = []
+        for notification, result in fan_out(batch, send_notification):
+            notification.attempts += 1
+            if result.ok:
+                notification.status = 'sent'
+                notification.sent_at = timezone.now()
+                notification.last_error = None
+                sent += 1
+            elif result.status_code in RETRYABLE_STATUSES and notification.attempts < max_attempts:
+                # Eksponensial kutish: 10s, 20s, 40s, ...
+                notification.status = 'pending'
+                notification.available_at = timezone.now() + timedelta(seconds=10 * 2 ** (notification.attempts - 1))
+                notification.last_error = result.description
+            else:
+                notification.status = 'failed'
+                notification.last_error = result.description
+                logger.warning(f"Notification {notification.id} to {notification.chat_id} failed: {result.description}")
+            to_update.append(notification)
+
+        NotificationOutbox.objects.bulk_update(to_update, ['status', 'attempts', 'sent_at', 'last_error', 'available_at'])
+
+
+def release_stale_claims():
+    """Ishchi o'chib qolganda 'sending' holatida qolib ketgan xabarlarni qaytarish"""
+    stale_before = timezone.now() - timedelta(seconds=settings.NOTIFICATION_CLAIM_TIMEOUT)
+    return NotificationOutbox.objects.filter(status='sending', claimed_at__lt=stale_before).update(status='pending')
@@ -0,0 +1,65 @@
+"""
+Natijalar ro'yxati uchun keyset (cursor) pagination: (score, id) kamayish tartibida.
+OFFSET ishlatilmaydi - har bir sahifa indeks bo'yicha bitta so'rov bilan olinadi.
+"""
+import base64
+from decimal import Decimal, InvalidOperation
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class ScoreCursorPagination:
+    page_size = 100
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    ordering = ('-score', '-id')
+
+    @classmethod
+    def is_requested(cls, request):
+        """Eski mijozlar uchun pagination ixtiyoriy: cursor yoki limit berilganda yoqiladi"""
+        return cls.cursor_query_param in request.query_params or cls.page_size_query_param in request.query_params
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, submission):
+        raw = f"{submission.score}:{submission.id}".encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            score, pk = raw.split(':')
+            return Decimal(score), int(pk)
+        except (ValueError, InvalidOperation, UnicodeDecodeError):
+            raise NotFound("Noto'g'ri cursor")
+
+    def paginate_queryset(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            score, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(Q(score__lt=score) | Q(score=score, id__lt=pk))
+
+        rows = list(queryset[:page_size + 1])
+        self.next_cursor = self.encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+        return rows[:page_size]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
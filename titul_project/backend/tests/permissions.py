@@ -1,3 +1,5 @@
+import hmac
+from django.conf import settings
 from rest_framework import permissions
 
 class IsAdminUser(permissions.BasePermission):
@@ -32,3 +34,14 @@ class IsSuperAdmin(permissions.BasePermission):
             return user.role == 'superadmin'
         except User.DoesNotExist:
             return False
+
+class IsInternalService(permissions.BasePermission):
+    """
+    Ruxsat: Ichki xizmatlar (masalan, bot) uchun - X-Internal-Token headeri
+    settings.INTERNAL_API_TOKEN ga teng bo'lishi kerak. Token sozlanmagan bo'lsa hech kimga ruxsat yo'q.
+    """
+    def has_permission(self, request, view):
+        token = request.headers.get('X-Internal-Token')
+        if not token or not settings.INTERNAL_API_TOKEN:
+            return False
+        return hmac.compare_digest(token, settings.INTERNAL_API_TOKEN)
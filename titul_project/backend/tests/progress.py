@@ -0,0 +1,225 @@
+"""
+Broadcast jarayonlari progressini real vaqtda kuzatish (Redis kesh kanali orqali)
+"""
+import json
+import time
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Operatsiya -> BroadcastHistory dagi (muvaffaqiyatli, xato) hisoblagich maydonlari
+COUNTER_FIELDS = {
+    'send': ('success_count', 'fail_count'),
+    'edit': ('edit_success_count', 'edit_fail_count'),
+    'recall': ('recall_success_count', 'recall_fail_count'),
+}
+
+FINAL_STATUSES = ('completed', 'failed')
+
+
+def progress_key(broadcast_id, operation='send'):
+    return f"broadcast:{broadcast_id}:progress:{operation}"
+
+
+def lock_key(broadcast_id, operation='send'):
+    return f"broadcast:{broadcast_id}:lock:{operation}"
+
+
+def acquire_lock(broadcast_id, operation='send'):
+    """
+    Ishchi lock'i. Ishchi progressni yozib turganda yangilanadi; ishchi o'chib qolsa
+    BROADCAST_LOCK_TIMEOUT dan keyin o'z-o'zidan tugaydi va vazifani qayta boshlash mumkin.
+    """
+    try:
+        return cache.add(lock_key(broadcast_id, operation), 1, timeout=settings.BROADCAST_LOCK_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Broadcast lock error: {e}")
+        return True
+
+
+def release_lock(broadcast_id, operation='send'):
+    try:
+        cache.delete(lock_key(broadcast_id, operation))
+    except Exception as e:
+        logger.warning(f"Broadcast lock release error: {e}")
+
+
+def is_locked(broadcast_id, operation='send'):
+    try:
+        return cache.get(lock_key(broadcast_id, operation)) is not None
+    except Exception as e:
+        logger.warning(f"Broadcast lock read error: {e}")
+        return True
+
+
+def get_progress(broadcast_id, operation='send'):
+    """Keshdagi oxirgi progress holatini olish (yo'q bo'lsa None)"""
+    try:
+        return cache.get(progress_key(broadcast_id, operation))
+    except Exception as e:
+        logger.warning(f"Progress cache read error: {e}")
+        return None
+
+
+def set_progress(broadcast_id, operation, data):
+    try:
+        cache.set(progress_key(broadcast_id, operation), data, timeout=settings.BROADCAST_PROGRESS_TTL)
+    except Exception as e:
+        logger.warning(f"Progress cache write error: {e}")
+
+
+def mark_pending(broadcast_id, operation='send', total=0):
+    """Vazifa navbatga qo'yilganda - stream ulanishlari ishchi boshlanishini kutib turadi"""
+    set_progress(broadcast_id, operation, {
+        'id': broadcast_id,
+        'operation': operation,
+        'status': 'pending',
+        'seq': 0,
+        'total': total,
+        'sent': 0,
+        'failed': 0,
+        'rate': 0.0,
+        'eta': None,
+        'updated_at': timezone.now().isoformat(),
+    })
+
+
+def snapshot_from_db(broadcast, operation='send'):
+    """Kesh bo'lmaganda (masalan, eski broadcast) holatni bazadan yig'ish"""
+    success_field, fail_field = COUNTER_FIELDS[operation]
+    status_value, total = {
+        'send': (broadcast.status, broadcast.total_users),
+        'edit': (broadcast.edit_status, broadcast.edit_total),
+        'recall': (broadcast.recall_status, broadcast.recall_total),
+    }[operation]
+    return {
+        'id': broadcast.id,
+        'operation': operation,
+        'status': status_value,
+        'seq': 0,
+        'total': total,
+        'sent': getattr(broadcast, success_field),
+        'failed': getattr(broadcast, fail_field),
+        'rate': 0.0,
+        'eta': None,
+        'updated_at': timezone.now().isoformat(),
+    }
+
+
+class BroadcastProgress:
+    """
+    Ishchi (Celery task) tomonidan har bir natijani qayd etish.
+    Progress keshga soniyasiga bir necha marta, BroadcastHistory qatoriga esa
+    faqat BROADCAST_DB_FLUSH_INTERVAL soniyada bir marta yoziladi.
+    """
+    def __init__(self, broadcast, operation='send', total=0, sent=0, failed=0):
+        self.broadcast = broadcast
+        self.operation = operation
+        self.total = total
+        # Qayta ishga tushirilganda oldingi natijalardan davom etadi
+        self.sent = sent
+        self.failed = failed
+        self.resumed = sent + failed
+        self.seq = 0
+        self.started_at = time.monotonic()
+        self.published_at = 0.0
+        self.flushed_at = self.started_at
+        self.publish('processing')
+
+    def record(self, ok):
+        if ok:
+            self.sent += 1
+        else:
+            self.failed += 1
+
+        now = time.monotonic()
+        if now - self.published_at >= settings.BROADCAST_PROGRESS_INTERVAL:
+            self.publish('processing')
+        if now - self.flushed_at >= settings.BROADCAST_DB_FLUSH_INTERVAL:
+            self.flush()
+
+    def snapshot(self, status):
+        done = self.sent + self.failed
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        rate = (done - self.resumed) / elapsed
+        eta = None
+        if status == 'processing' and rate > 0:
+            eta = round(max(self.total - done, 0) / rate, 1)
+        return {
+            'id': self.broadcast.id,
+            'operation': self.operation,
+            'status': status,
+            'seq': self.seq,
+            'total': self.total,
+            'sent': self.sent,
+            'failed': self.failed,
+            'rate': round(rate, 2),
+            'eta': eta,
+            'updated_at': timezone.now().isoformat(),
+        }
+
+    def publish(self, status):
+        self.seq += 1
+        self.published_at = time.monotonic()
+        set_progress(self.broadcast.id, self.operation, self.snapshot(status))
+
+    def flush(self):
+        """Hisoblagichlarni BroadcastHistory ga yozish"""
+        success_field, fail_field = COUNTER_FIELDS[self.operation]
+        setattr(self.broadcast, success_field, self.sent)
+        setattr(self.broadcast, fail_field, self.failed)
+        self.broadcast.save(update_fields=[success_field, fail_field])
+        self.flushed_at = time.monotonic()
+        try:
+            cache.touch(lock_key(self.broadcast.id, self.operation), settings.BROADCAST_LOCK_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Broadcast lock refresh error: {e}")
+
+    def finish(self, status='completed'):
+        self.flush()
+        self.publish(status)
+
+
+def format_event(data):
+    return f"data: {json.dumps(data, default=str)}\n\n"
+
+
+def stream_progress(broadcast, operation='send'):
+    """
+    Server-Sent Events generatori: progress o'zgarganda yangi hodisa yuboradi,
+    jarayon tugagach oqim yopiladi.
+    Oqim sinxron ishchini band qiladi, shuning uchun BROADCAST_STREAM_TIMEOUT soniyadan keyin yopiladi -
+    EventSource retry vaqtidan keyin o'zi qayta ulanadi va joriy holatni oladi.
+    """
+    interval = settings.BROADCAST_PROGRESS_INTERVAL
+    started_at = time.monotonic()
+    last_event_at = started_at
+    last_seq = None
+
+    yield f"retry: {settings.BROADCAST_STREAM_RETRY_MS}\n\n"
+
+    while True:
+        data = get_progress(broadcast.id, operation)
+        if data is None:
+            # Keshda yo'q - bazadagi holatni yuborib oqimni yopamiz
+            yield format_event(snapshot_from_db(broadcast, operation))
+            return
+
+        now = time.monotonic()
+        if data.get('seq') != last_seq:
+            last_seq = data.get('seq')
+            last_event_at = now
+            yield format_event(data)
+            if data.get('status') in FINAL_STATUSES:
+                return
+        elif now - last_event_at >= 15:
+            # Proksi ulanishni yopib qo'ymasligi uchun
+            last_event_at = now
+            yield ": ping\n\n"
+
+        if now - started_at >= settings.BROADCAST_STREAM_TIMEOUT:
+            return
+        time.sleep(interval)
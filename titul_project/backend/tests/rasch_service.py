@@ -178,7 +178,7 @@ def calibrate_test_items(test):
         question.save()
 
     test.is_calibrated = True
-    test.save()
+    test.save(update_fields=['is_calibrated'])
     return True
 
 def calculate_rasch_scores(test):
@@ -238,5 +238,7 @@ def calculate_rasch_scores(test):
         
         # Darajani va xabarlarni qayta hisoblash (modeldagi markazlashgan logikadan foydalanamiz)
         submission.calculate_score(send_notify=False)
-        
+
+    from .stats import recompute_stats
+    recompute_stats(test)
     return True
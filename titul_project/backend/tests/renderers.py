@@ -0,0 +1,13 @@
+import json
+from rest_framework.renderers import BaseRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Server-Sent Events (text/event-stream) uchun renderer"""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Xatolik javoblari (masalan, 404) ham bitta hodisa sifatida yuboriladi
+        return f"data: {json.dumps(data, default=str)}\n\n".encode(self.charset)
@@ -66,3 +66,35 @@ def get_question_result(question, student_answer):
         earned_points, is_correct = calculate_manual_score(student_answer, question.points)
         
     return is_correct, earned_points
+
+
+def grade_answers(questions, answers):
+    """
+    Javoblar varaqasini baholash (bazaga murojaatsiz).
+    (to'plangan ball, maksimal ball, to'g'ri, xato) qaytaradi; to'g'ri/xato faqat variantli va yozma savollar
+    """
+    earned_score = Decimal('0.0')
+    total_possible_score = Decimal('0')
+    correct_count = wrong_count = 0
+    for question in questions:
+        total_possible_score += question.points
+        student_answer = answers.get(str(question.question_number), '')
+        is_correct, earned_points = get_question_result(question, student_answer)
+        earned_score += earned_points
+        if question.question_type != 'manual':
+            if is_correct:
+                correct_count += 1
+            else:
+                wrong_count += 1
+    return earned_score, total_possible_score, correct_count, wrong_count
+
+
+def grade_for_percentage(percentage):
+    """Daraja (Milliy sertifikat standarti bo'yicha)"""
+    if percentage >= 70: return 'A+'
+    elif percentage >= 65: return 'A'
+    elif percentage >= 60: return 'B+'
+    elif percentage >= 55: return 'B'
+    elif percentage >= 50: return 'C+'
+    elif percentage >= 46: return 'C'
+    return 'F'
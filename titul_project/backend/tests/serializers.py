@@ -2,6 +2,19 @@ from rest_framework import serializers
 from django.utils import timezone
 from datetime import timedelta
 from .models import User, Test, Question, Submission, Payment, Announcement, SystemSettings, PaymentReceipt
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FieldsSelectionMixin:
+    """fields=[...] berilsa faqat shu maydonlar qaytariladi (?fields=id,score)"""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -51,6 +64,11 @@ class QuestionSerializer(serializers.ModelSerializer):
 class TestSerializer(serializers.ModelSerializer):
     questions = QuestionSerializer(many=True, read_only=True)
     creator_name = serializers.CharField(source='creator.full_name', read_only=True)
+    # Statistika Test ustunlarida saqlanadi (stats.py) - qo'shimcha so'rovsiz
+    max_score = serializers.FloatField(read_only=True)
+    total_points = serializers.FloatField(read_only=True)
+    digest_interval = serializers.IntegerField(min_value=10, max_value=3600, required=False)
+    digest_batch_size = serializers.IntegerField(min_value=1, max_value=1000, required=False)
     
     class Meta:
         model = Test
@@ -58,9 +76,10 @@ class TestSerializer(serializers.ModelSerializer):
             'id', 'creator', 'creator_name', 'title', 'subject', 'sub_type',
             'access_code', 'submission_mode', 'is_active', 'is_calibrated', 'created_at', 'expires_at', 
             'finished_at', 'questions', 'submissions_count', 
-            'average_score', 'max_score', 'total_points', 'is_points_based'
+            'average_score', 'max_score', 'total_points', 'is_points_based',
+            'notify_mode', 'digest_interval', 'digest_batch_size', 'ingest_mode'
         ]
-        read_only_fields = ['id', 'access_code', 'created_at', 'finished_at']
+        read_only_fields = ['id', 'access_code', 'created_at', 'finished_at', 'submissions_count', 'is_points_based']
 
     def update(self, instance, validated_data):
         # Questions data handling if provided (though it's read_only in regular serializer, 
@@ -70,16 +89,26 @@ class TestSerializer(serializers.ModelSerializer):
         instance.sub_type = validated_data.get('sub_type', instance.sub_type)
         instance.submission_mode = validated_data.get('submission_mode', instance.submission_mode)
         instance.expires_at = validated_data.get('expires_at', instance.expires_at)
-        instance.save()
+        instance.notify_mode = validated_data.get('notify_mode', instance.notify_mode)
+        instance.digest_interval = validated_data.get('digest_interval', instance.digest_interval)
+        instance.digest_batch_size = validated_data.get('digest_batch_size', instance.digest_batch_size)
+        instance.ingest_mode = validated_data.get('ingest_mode', instance.ingest_mode)
+        # Statistika maydonlari (Test.STATS_FIELDS) yozilmaydi
+        instance.save(update_fields=[
+            'title', 'subject', 'sub_type', 'submission_mode', 'expires_at',
+            'notify_mode', 'digest_interval', 'digest_batch_size', 'ingest_mode'
+        ])
         return instance
 
 class UpdateTestSerializer(serializers.ModelSerializer):
     """Test tahrirlash uchun serializer"""
     questions = QuestionSerializer(many=True)
+    digest_interval = serializers.IntegerField(min_value=10, max_value=3600, required=False)
+    digest_batch_size = serializers.IntegerField(min_value=1, max_value=1000, required=False)
 
     class Meta:
         model = Test
-        fields = ['title', 'subject', 'sub_type', 'submission_mode', 'expires_at', 'questions']
+        fields = ['title', 'subject', 'sub_type', 'submission_mode', 'expires_at', 'notify_mode', 'digest_interval', 'digest_batch_size', 'ingest_mode', 'questions']
 
     def validate_submission_mode(self, value):
         if self.instance and self.instance.submission_mode != value:
@@ -95,6 +124,15 @@ class UpdateTestSerializer(serializers.ModelSerializer):
         instance.subject = validated_data.get('subject', instance.subject)
         instance.sub_type = validated_data.get('sub_type', instance.sub_type)
         instance.submission_mode = validated_data.get('submission_mode', instance.submission_mode)
+        instance.notify_mode = validated_data.get('notify_mode', instance.notify_mode)
+        instance.digest_interval = validated_data.get('digest_interval', instance.digest_interval)
+        instance.digest_batch_size = validated_data.get('digest_batch_size', instance.digest_batch_size)
+        instance.ingest_mode = validated_data.get('ingest_mode', instance.ingest_mode)
+        # Statistika maydonlari (Test.STATS_FIELDS) yozilmaydi
+        update_fields = [
+            'title', 'subject', 'sub_type', 'submission_mode',
+            'notify_mode', 'digest_interval', 'digest_batch_size', 'ingest_mode'
+        ]
         
         # Agar vaqt o'zgargan bo'lsa va u kelajakda bo'lsa, testni qayta faollashtirish
         if new_expiry and new_expiry != instance.expires_at:
@@ -103,9 +141,8 @@ class UpdateTestSerializer(serializers.ModelSerializer):
                 instance.reactivate(new_expiry)
             else:
                 instance.expires_at = new_expiry
-                instance.save()
-        else:
-            instance.save()
+                update_fields.append('expires_at')
+        instance.save(update_fields=update_fields)
 
         if questions_data:
             # Mavjud savollarni o'chirib, yangilarini yaratish
@@ -116,10 +153,22 @@ class UpdateTestSerializer(serializers.ModelSerializer):
             # Natijalarni qayta hisoblash (Re-grading)
             for submission in instance.submissions.all():
                 submission.calculate_score(send_notify=False)
+
+            from .stats import refresh_question_stats, recompute_stats
+            refresh_question_stats(instance)
+            recompute_stats(instance)
         
         return instance
 
 
+class TestListSerializer(TestSerializer):
+    """Testlar ro'yxati uchun: savollarsiz (to'liq ma'lumot - /tests/{id}/)"""
+    questions = None
+    
+    class Meta(TestSerializer.Meta):
+        fields = [field for field in TestSerializer.Meta.fields if field != 'questions']
+
+
 class CreateTestSerializer(serializers.Serializer):
     """Test yaratish uchun serializer (nested questions bilan)"""
     creator_id = serializers.IntegerField(min_value=0)
@@ -128,6 +177,10 @@ class CreateTestSerializer(serializers.Serializer):
     subject = serializers.CharField(max_length=50)
     sub_type = serializers.CharField(max_length=10, required=False, allow_null=True)
     submission_mode = serializers.CharField(max_length=10, required=False, default='single')
+    notify_mode = serializers.ChoiceField(choices=Test.NOTIFY_CHOICES, required=False, default='digest')
+    digest_interval = serializers.IntegerField(min_value=10, max_value=3600, required=False, default=60)
+    digest_batch_size = serializers.IntegerField(min_value=1, max_value=1000, required=False, default=50)
+    ingest_mode = serializers.ChoiceField(choices=Test.INGEST_CHOICES, required=False, default='auto')
     expires_at = serializers.DateTimeField(required=False, allow_null=True)
     questions = QuestionSerializer(many=True)
     
@@ -237,10 +290,13 @@ class CreateTestSerializer(serializers.Serializer):
             # Savollarni yaratish
             for question_data in questions_data:
                 Question.objects.create(test=test, **question_data)
+
+            from .stats import refresh_question_stats
+            refresh_question_stats(test)
             
-            # Bildirishnoma yuborish
+            # Bildirishnoma outbox'ga yoziladi - Telegramga tranzaksiyadan keyin yuboriladi
             try:
-                from .tasks import send_payment_notification_task
+                from .outbox import queue_notification
                 msg = f"🚀 <b>Test muvaffaqiyatli yaratildi!</b>\n\n"
                 msg += f"Kodi: <code>{test.access_code}</code>\n"
                 if cost > 0:
@@ -249,18 +305,16 @@ class CreateTestSerializer(serializers.Serializer):
                 msg += f"💵 Joriy balans: <b>{user.balance} so'm</b>\n"
                 msg += f"🎁 Qolgan bepul testlar: <b>{user.remaining_free_tests} ta</b>"
                 
-                send_payment_notification_task(user.telegram_id, msg)
-            except:
-                pass
+                queue_notification(user.telegram_id, msg, kind='test_created')
+            except Exception as e:
+                logger.error(f"Notification error: {e}")
         
         return test
 
 
-class SubmissionSerializer(serializers.ModelSerializer):
+class SubmissionSerializer(FieldsSelectionMixin, serializers.ModelSerializer):
     test_title = serializers.CharField(source='test.title', read_only=True)
     test_subject = serializers.CharField(source='test.subject', read_only=True)
-    correct_count = serializers.SerializerMethodField()
-    wrong_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Submission
@@ -270,50 +324,38 @@ class SubmissionSerializer(serializers.ModelSerializer):
             'answers', 'correct_count', 'wrong_count', 'score', 
             'ability_logit', 'scaled_score', 'grade', 'submitted_at'
         ]
-        read_only_fields = ['id', 'attempt_number', 'score', 'ability_logit', 'scaled_score', 'grade', 'submitted_at']
-
-    def get_correct_count(self, obj):
-        count = 0
-        questions = obj.test.questions.all()
-        for q in questions:
-            q_num = str(q.question_number)
-            ans = obj.answers.get(q_num, '')
-            if q.question_type == 'choice':
-                if str(ans).strip().upper() == str(q.correct_answer).strip().upper():
-                    count += 1
-            elif q.question_type == 'writing':
-                import json
-                try:
-                    correct_parts = json.loads(q.correct_answer)
-                    if isinstance(correct_parts, list):
-                        student_parts = ans if isinstance(ans, list) else [ans]
-                        is_correct = True
-                        for i, alternatives in enumerate(correct_parts):
-                            student_part = str(student_parts[i]).strip().lower() if i < len(student_parts) else ""
-                            if not any(str(alt).strip().lower() == student_part for alt in alternatives):
-                                is_correct = False
-                                break
-                        if is_correct: count += 1
-                    else:
-                        if str(ans).strip().lower() == str(q.correct_answer).strip().lower():
-                            count += 1
-                except:
-                    if str(ans).strip().lower() == str(q.correct_answer).strip().lower():
-                        count += 1
-        return count
-
-    def get_wrong_count(self, obj):
-        questions_count = obj.test.questions.filter(question_type__in=['choice', 'writing']).count()
-        return questions_count - self.get_correct_count(obj)
-    
+        read_only_fields = [
+            'id', 'attempt_number', 'correct_count', 'wrong_count', 'score',
+            'ability_logit', 'scaled_score', 'grade', 'submitted_at'
+        ]
+
     def create(self, validated_data):
         submission = Submission.objects.create(**validated_data)
         submission.calculate_score()  # Ballni hisoblash
+        from .stats import record_submission
+        record_submission(submission)
         return submission
 
 
+class SubmissionListSerializer(FieldsSelectionMixin, serializers.ModelSerializer):
+    """Natijalar ro'yxati uchun: javoblarsiz (to'liq ma'lumot - /submissions/{id}/)"""
+    
+    class Meta:
+        model = Submission
+        fields = [
+            'id', 'test', 'student_telegram_id', 'student_name', 'attempt_number',
+            'correct_count', 'wrong_count', 'score', 'ability_logit', 'scaled_score',
+            'grade', 'submitted_at'
+        ]
+        read_only_fields = fields
+
+
 class CreateSubmissionSerializer(serializers.Serializer):
-    """Javob yuborish uchun serializer"""
+    """
+    Javob yuborish uchun serializer.
+    Test va savollar keshdagi kalitdan olinadi (answer_key.py), baholash xotirada bajariladi va
+    natija bitta INSERT bilan yoziladi.
+    """
     test_id = serializers.IntegerField()
     student_telegram_id = serializers.IntegerField()
     student_name = serializers.CharField(max_length=255)
@@ -321,92 +363,71 @@ class CreateSubmissionSerializer(serializers.Serializer):
     
     def validate_test_id(self, value):
         from datetime import timedelta
-        try:
-            test = Test.objects.get(id=value)
-            now = timezone.now()
-            
-            # 30 soniyalik fan-vaqt (grace period) qo'shish
-            if test.expires_at and now > (test.expires_at + timedelta(seconds=30)):
-                if test.is_active:
-                    test.finish(send_notify=True)
-                raise serializers.ValidationError("Bu test muddati tugagan va yakunlangan!")
-                
-            if not test.is_active:
-                raise serializers.ValidationError("Bu test yakunlangan!")
-            return value
-        except Test.DoesNotExist:
+        from .answer_key import get_answer_key
+        
+        answer_key = get_answer_key(value)
+        if answer_key is None:
             raise serializers.ValidationError("Test topilmadi!")
+        test = answer_key[0]
+        now = timezone.now()
+        
+        # 30 soniyalik fan-vaqt (grace period) qo'shish
+        if test.expires_at and now > (test.expires_at + timedelta(seconds=30)):
+            if test.is_active:
+                # Keshdagi nusxa emas, bazadagi test yakunlanadi
+                Test.objects.get(id=value).finish(send_notify=True)
+            raise serializers.ValidationError("Bu test muddati tugagan va yakunlangan!")
+            
+        if not test.is_active:
+            raise serializers.ValidationError("Bu test yakunlangan!")
+        self.answer_key = answer_key
+        return value
+
+    def validate_answers(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError("Javoblar {savol_raqami: javob} ko'rinishida bo'lishi kerak")
+        return value
 
     def validate(self, attrs):
-        test_id = attrs.get('test_id')
         student_telegram_id = attrs.get('student_telegram_id')
         student_name = attrs.get('student_name', '').strip()
+        test = self.answer_key[0]
         
-        try:
-            test = Test.objects.get(id=test_id)
-            if test.submission_mode == 'single':
-                # Soddaroq mantiq: Agar student_telegram_id 0 bo'lsa (veb), ismi bilan tekshiramiz
-                # Aks holda (telegram) ID si bilan tekshiramiz
-                if int(student_telegram_id) != 0:
-                    if Submission.objects.filter(test=test, student_telegram_id=student_telegram_id).exists():
-                        raise serializers.ValidationError({"detail": "Siz ushbu testni yechib bo'lgansiz!"})
-                else:
-                    # Veb foydalanuvchisi uchun ism bo'yicha (Case-insensitive)
-                    if Submission.objects.filter(test=test, student_name__iexact=student_name).exists():
-                        raise serializers.ValidationError({"detail": f"Hurmatli {student_name}, siz ushbu testni oldin yechgansiz!"})
-        except Test.DoesNotExist:
-            pass # validate_test_id will handle this
+        if test.submission_mode == 'single':
+            # Telegram foydalanuvchisi ID bo'yicha, veb foydalanuvchisi (ID=0) ism bo'yicha -
+            # topshirish sahifasidagi tekshiruv (check_attempt_status) bilan bir xil shart
+            from .ingest import single_mode_filter
+            if Submission.objects.filter(single_mode_filter(student_telegram_id, student_name), test_id=test.id).exists():
+                if student_telegram_id:
+                    raise serializers.ValidationError({"detail": "Siz ushbu testni yechib bo'lgansiz!"})
+                raise serializers.ValidationError({"detail": f"Hurmatli {student_name}, siz ushbu testni oldin yechgansiz!"})
             
         return attrs
     
     def create(self, validated_data):
-        test_id = validated_data.pop('test_id')
-        test = Test.objects.get(id=test_id)
+        test, questions = self.answer_key
         student_telegram_id = validated_data['student_telegram_id']
         
-        # Urinish raqamini aniqlash (Har doim ID + ism bo'yicha guruhlaymiz)
-        query = Submission.objects.filter(
-            test=test, 
-            student_telegram_id=student_telegram_id,
-            student_name__iexact=validated_data['student_name'].strip()
-        )
-            
-        existing_submissions = query.order_by('attempt_number')
-        
-        attempt_number = 1
-        if existing_submissions.exists():
-            attempt_number = existing_submissions.last().attempt_number + 1
-            
-        # Yangi submission yaratish (update_or_create emas, har doim yangi)
-        submission = Submission.objects.create(
-            test=test,
-            student_telegram_id=student_telegram_id,
-            student_name=validated_data['student_name'],
-            answers=validated_data['answers'],
-            attempt_number=attempt_number
+        # Baholash yozishdan oldin xotirada, natija bitta INSERT bilan yoziladi
+        from .ingest import AlreadySubmitted, build_submission, save_submission
+        submission = build_submission(
+            test, questions, student_telegram_id, validated_data['student_name'], validated_data['answers'],
+            attempt_number=1,
         )
-        
-        # Savollarni tekshirish (manual ballar uchun)
-        answers = validated_data.get('answers', {})
-        for q_num_str, student_answer in answers.items():
-            try:
-                question = test.questions.get(question_number=int(q_num_str))
-                if question.question_type == 'manual':
-                    try:
-                        from decimal import Decimal
-                        score_val = Decimal(str(student_answer))
-                        if score_val < 0 or score_val > question.points:
-                            # Frontendda ham cheklangan, lekin backendda ham xavfsizlik uchun tekshiramiz
-                            # Agar xato bo'lsa, uni oralig'iga keltiramiz yoki error beramiz
-                            # Hozircha oralig'iga keltirish calculate_score da bor, 
-                            # lekin bu yerda validatesi bo'lishi yaxshi.
-                            pass 
-                    except:
-                        pass
-            except Question.DoesNotExist:
-                continue
-
-        submission.calculate_score()
+        submission.idempotency_key = validated_data.get('idempotency_key')
+        # Urinish raqami (ID + ism bo'yicha) oxirgi urinishdan olinadi; parallel so'rov bilan to'qnashsa qayta olinadi
+        try:
+            previous = save_submission(submission)
+        except AlreadySubmitted:
+            raise serializers.ValidationError({"detail": "Siz ushbu testni yechib bo'lgansiz!"})
+
+        # Test statistikasini yangilash (o'rtacha, maksimal ball, ishtirokchilar)
+        from .stats import record_submission
+        record_submission(submission, previous=previous['score'] if previous else None)
+
+        # O'qituvchini xabardor qilish (test sozlamasiga ko'ra: digest, har biri yoki o'chirilgan)
+        from .digest import notify_submission
+        notify_submission(submission)
         return submission
 
 
@@ -420,3 +441,16 @@ class PaymentSerializer(serializers.ModelSerializer):
             'status', 'transaction_id', 'created_at', 'completed_at'
         ]
         read_only_fields = ['id', 'status', 'created_at', 'completed_at']
+
+
+class OutboxMessageSerializer(serializers.Serializer):
+    """Ichki xizmatlar Telegram gateway'iga yuboradigan xabar"""
+    METHOD_CHOICES = ['sendMessage', 'sendPhoto', 'sendDocument']
+
+    chat_id = serializers.IntegerField()
+    text = serializers.CharField(allow_blank=True, default='')
+    method = serializers.ChoiceField(choices=METHOD_CHOICES, default='sendMessage')
+    parse_mode = serializers.CharField(max_length=10, allow_blank=True, default='HTML')
+    extra = serializers.DictField(required=False, default=dict)
+    kind = serializers.CharField(max_length=30, default='general')
+    priority = serializers.IntegerField(min_value=0, max_value=2, default=0)
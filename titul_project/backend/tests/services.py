@@ -48,7 +48,7 @@ def send_preliminary_finish_notification(test):
     Test yakunlangani haqida darhol xabar yuborish (hisob-kitob boshlanishidan oldin)
     """
     try:
-        from .notifications import send_telegram_notification
+        from .outbox import queue_notification
         msg = f"""
 ⏳ <b>Test yakunlandi!</b>
 
@@ -57,7 +57,7 @@ def send_preliminary_finish_notification(test):
 
 Rasch modeli bo'yicha hisob-kitoblar va PDF hisobot bir necha soniyadan so'ng yuboriladi. Iltimos, kutib turing.
 """
-        send_telegram_notification(test.creator.telegram_id, msg)
+        queue_notification(test.creator.telegram_id, msg, kind='test_finished')
         return True
     except Exception as e:
         logger.error(f"Error sending prelim notification: {e}")
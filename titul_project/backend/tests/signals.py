@@ -0,0 +1,44 @@
+"""
+Model o'zgarishlari bo'yicha keshlarni yangilash: bot profil keshi (hodisa orqali),
+access code bo'yicha test manifesti va natija qabul qilish kaliti
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import User, Test, Question, Payment, PaymentReceipt
+from .events import user_changed
+from .manifest_cache import invalidate_manifest
+from .answer_key import invalidate_answer_key
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_saved(sender, instance, **kwargs):
+    user_changed(instance.telegram_id)
+
+
+@receiver([post_save, post_delete], sender=Test)
+def test_saved(sender, instance, **kwargs):
+    # Testlar ro'yxati va soni profil tarkibida
+    user_changed(instance.creator.telegram_id)
+    # Tahrirlash, yakunlash va qayta faollashtirish - barchasi save() orqali
+    access_code, test_id = instance.access_code, instance.id
+    transaction.on_commit(lambda: invalidate_manifest(access_code))
+    transaction.on_commit(lambda: invalidate_answer_key(test_id))
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_saved(sender, instance, **kwargs):
+    test_id = instance.test_id
+    transaction.on_commit(lambda: invalidate_answer_key(test_id))
+    test = instance._state.fields_cache.get('test')
+    if test is None:
+        test = Test.objects.filter(id=instance.test_id).only('access_code').first()
+    if test is not None:
+        access_code = test.access_code
+        transaction.on_commit(lambda: invalidate_manifest(access_code))
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=PaymentReceipt)
+def payment_saved(sender, instance, **kwargs):
+    user_changed(instance.user.telegram_id)
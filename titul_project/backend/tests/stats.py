@@ -0,0 +1,92 @@
+"""
+Test statistikasi Test jadvalida saqlanadi (har bir o'quvchining oxirgi urinishi bo'yicha):
+natija yozilganda bosqichma-bosqich yangilanadi, qayta baholashda to'liq qayta hisoblanadi.
+O'quvchi = (telegram_id, student_key) juftligi, urinishlar raqamlanishidagi kabi.
+Har ikki holatda results_version oshiriladi (natijalar ETag i).
+"""
+from decimal import Decimal
+from django.db.models import Count, Exists, F, Max, OuterRef, Q, Sum
+from django.db.models.functions import Greatest
+from .models import Test, Question, Submission
+
+
+def latest_attempts(submissions):
+    """Har bir o'quvchining faqat oxirgi urinishi (bazada, NOT EXISTS orqali)"""
+    newer = Submission.objects.filter(
+        test_id=OuterRef('test_id'),
+        student_telegram_id=OuterRef('student_telegram_id'),
+        student_key=OuterRef('student_key'),
+    ).filter(
+        Q(submitted_at__gt=OuterRef('submitted_at')) |
+        Q(submitted_at=OuterRef('submitted_at'), id__gt=OuterRef('id'))
+    )
+    return submissions.filter(~Exists(newer))
+
+
+def calculate_stats(test_id):
+    stats = latest_attempts(Submission.objects.filter(test_id=test_id)).aggregate(
+        submissions_count=Count('id'), score_sum=Sum('score'), max_score=Max('score')
+    )
+    return {
+        'submissions_count': stats['submissions_count'],
+        'score_sum': stats['score_sum'] or Decimal('0'),
+        'max_score': stats['max_score'] or Decimal('0'),
+    }
+
+
+def recompute_stats(test):
+    """Natijalar statistikasini to'liq qayta hisoblash (qayta baholash, Rasch, o'chirish)"""
+    stats = calculate_stats(test.id)
+    Test.objects.filter(id=test.id).update(**stats, results_version=F('results_version') + 1)
+    for field, value in stats.items():
+        setattr(test, field, value)
+
+
+def refresh_question_stats(test):
+    """Savollar o'zgarganda: jami ball va ballik tizim belgisi"""
+    questions = Question.objects.filter(test_id=test.id)
+    special = questions.filter(Q(question_type__in=['manual', 'writing']) | ~Q(points=1))
+    stats = Test.objects.filter(id=test.id).annotate(
+        points=Sum('questions__points'),
+        special=Exists(special.filter(test_id=OuterRef('id'))),
+    ).values('points', 'special').first()
+    if stats is None:
+        return
+    test.total_points = stats['points'] or Decimal('0')
+    test.is_points_based = stats['special']
+    Test.objects.filter(id=test.id).update(total_points=test.total_points, is_points_based=test.is_points_based)
+
+
+_LOOKUP = object()
+
+
+def record_submission(submission, previous=_LOOKUP):
+    """
+    Yangi natijani statistikaga qo'shish (F ifodalari bilan, qatorni o'qimasdan).
+    previous - o'quvchining oldingi oxirgi urinishi bali (None - birinchi urinish); berilmasa bazadan olinadi.
+    Oldingi ball yangi balldan yuqori bo'lsa maksimum kamayishi mumkin - bu holatda to'liq qayta hisoblanadi.
+    """
+    if previous is _LOOKUP:
+        previous = Submission.objects.filter(
+            test_id=submission.test_id,
+            student_telegram_id=submission.student_telegram_id,
+            student_key=submission.student_key,
+        ).exclude(id=submission.id).order_by('-submitted_at', '-id').values_list('score', flat=True).first()
+
+    score = submission.score
+    tests = Test.objects.filter(id=submission.test_id)
+    if previous is None:
+        tests.update(
+            submissions_count=F('submissions_count') + 1,
+            score_sum=F('score_sum') + score,
+            max_score=Greatest(F('max_score'), score),
+            results_version=F('results_version') + 1,
+        )
+    elif previous <= score:
+        tests.update(
+            score_sum=F('score_sum') + (score - previous),
+            max_score=Greatest(F('max_score'), score),
+            results_version=F('results_version') + 1,
+        )
+    else:
+        recompute_stats(submission.test)
@@ -1,116 +1,156 @@
 from celery import shared_task
-import os
 from django.conf import settings
 from django.utils import timezone
-import requests
-import time
+from django.db.models import F, Q
 import logging
 from .models import User, Test, BroadcastHistory, BroadcastRecipient
+from .broadcast_service import (
+    get_media_kind, read_media, deliver,
+    send_broadcast_message, edit_broadcast_message, delete_broadcast_message,
+    fan_out, PRIORITY_REPORT
+)
+from .progress import BroadcastProgress, acquire_lock, release_lock, is_locked
+from .audience import materialize_audience
 
 logger = logging.getLogger(__name__)
 
-@shared_task(bind=True)
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
 def send_broadcast_task(self, broadcast_id):
+    """
+    Broadcast yuborish. Auditoriya broadcast_recipients jadvalida 'queued' holatida oldindan
+    saqlangan bo'ladi - faqat navbatdagilar yuboriladi, shuning uchun vazifa qayta ishga
+    tushirilsa (worker o'chib qolsa yoki resume_stalled_broadcasts_task orqali) davom etadi.
+    """
     try:
         broadcast = BroadcastHistory.objects.get(id=broadcast_id)
     except BroadcastHistory.DoesNotExist:
         return "Broadcast not found"
 
-    broadcast.status = 'processing'
-    broadcast.save()
+    if broadcast.status == 'completed':
+        return "Broadcast already completed"
+    if broadcast.status == 'scheduled' and broadcast.scheduled_at and broadcast.scheduled_at > timezone.now():
+        return "Broadcast is not due yet"
 
-    bot_token = settings.TELEGRAM_BOT_TOKEN
-    
-    # Target foydalanuvchilarni aniqlash va telegram_id borligiga ishonch hosil qilish
-    query = User.objects.filter(telegram_id__isnull=False).exclude(telegram_id=0)
-    if 'all' not in broadcast.target_roles:
-        query = query.filter(role__in=broadcast.target_roles)
-    
-    users = query
-    broadcast.total_users = users.count()
-    broadcast.save()
+    # Bir vaqtda faqat bitta ishchi yuborishi mumkin
+    if not acquire_lock(broadcast.id, 'send'):
+        return "Broadcast is already being sent"
+
+    try:
+        # Auditoriyasi saqlanmagan eski broadcastlar uchun
+        if not broadcast.recipients.exists():
+            broadcast.total_users = materialize_audience(broadcast)
+
+        broadcast.status = 'processing'
+        broadcast.save()
+
+        sent_before = broadcast.recipients.filter(status='sent').count()
+        failed_before = broadcast.recipients.filter(status='failed').count()
+        queued = broadcast.recipients.filter(status='queued').order_by('id').values_list('id', 'telegram_id')
+
+        # Progress keshga real vaqtda, bazaga esa vaqti-vaqti bilan yoziladi
+        progress = BroadcastProgress(broadcast, 'send', broadcast.total_users, sent=sent_before, failed=failed_before)
+        recipients_to_update = []
+        blocked_ids = []
+
+        def flush_recipients():
+            BroadcastRecipient.objects.bulk_update(recipients_to_update, ['status', 'message_id'])
+            if blocked_ids:
+                # Botni bloklaganlar keyingi "reachable_only" segmentlariga kirmaydi
+                User.objects.filter(telegram_id__in=blocked_ids).update(is_reachable=False)
+
+        # Media fayl diskdan faqat 1 marta o'qiladi va Telegramga faqat 1 marta yuklanadi,
+        # keyingi xabarlarda file_id qayta ishlatiladi
+        kind = get_media_kind(broadcast)
+        upload = read_media(broadcast) if kind and not broadcast.media_file_id else None
+
+        def save_file_id(file_id):
+            broadcast.media_file_id = file_id
+            broadcast.save(update_fields=['media_file_id'])
+
+        results = deliver(
+            queued.iterator(chunk_size=2000),
+            lambda item, file_id, media: send_broadcast_message(broadcast, item[1], kind, file_id, media),
+            kind=kind,
+            file_id=broadcast.media_file_id,
+            upload=upload,
+            on_file_id=save_file_id
+        )
+
+        for (recipient_id, chat_id), result in results:
+            progress.record(result.ok)
+            if not result.ok:
+                logger.warning(f"Broadcast error for user {chat_id}: {result.description}")
+                if result.status_code == 403:
+                    blocked_ids.append(chat_id)
+
+            # Muvaffaqiyatsizlar ham qayd etiladi - qayta ishga tushirilganda ularga qayta yuborilmaydi
+            recipients_to_update.append(BroadcastRecipient(
+                id=recipient_id,
+                message_id=result.result.get('message_id') if result.ok else None,
+                status='sent' if result.ok else 'failed'
+            ))
+
+            # Har 50 ta xabardan keyin yozamiz
+            if len(recipients_to_update) >= 50:
+                flush_recipients()
+                recipients_to_update = []
+                blocked_ids = []
+
+        # Qolgan recipientlarni yozish
+        if recipients_to_update:
+            flush_recipients()
+
+        broadcast.status = 'completed'
+        broadcast.completed_at = timezone.now()
+        broadcast.save()
+        progress.finish('completed')
+    finally:
+        release_lock(broadcast.id, 'send')
+
+    return f"Completed: {progress.sent} success, {progress.failed} fail"
+
+
+@shared_task
+def resume_stalled_broadcasts_task():
+    """
+    Ishchisi to'xtab qolgan (lock muddati o'tgan) broadcastlarni va vaqti o'tib ketgan,
+    lekin boshlanmagan rejalashtirilgan broadcastlarni qayta navbatga qo'yish
+    """
+    overdue = timezone.now() - timezone.timedelta(minutes=5)
+    stalled = BroadcastHistory.objects.filter(
+        Q(status='processing') | Q(status='scheduled', scheduled_at__lte=overdue)
+    ).values_list('id', flat=True)
+    resumed = failed = 0
+    for broadcast_id in stalled:
+        if is_locked(broadcast_id, 'send'):
+            continue
+        # Har safar yiqiladigan broadcast cheksiz qayta boshlanmaydi
+        updated = BroadcastHistory.objects.filter(
+            id=broadcast_id, resume_count__lt=settings.BROADCAST_MAX_RESUMES
+        ).update(resume_count=F('resume_count') + 1)
+        if updated:
+            send_broadcast_task.delay(broadcast_id)
+            resumed += 1
+            continue
+        broadcast = BroadcastHistory.objects.get(id=broadcast_id)
+        broadcast.status = 'failed'
+        broadcast.last_error = f"Ishchi {settings.BROADCAST_MAX_RESUMES} marta qayta boshlangandan keyin ham yakunlamadi"
+        broadcast.save(update_fields=['status', 'last_error'])
+        BroadcastProgress(
+            broadcast, 'send', broadcast.total_users, sent=broadcast.success_count, failed=broadcast.fail_count
+        ).publish('failed')
+        logger.error(f"Broadcast {broadcast_id} marked failed after {settings.BROADCAST_MAX_RESUMES} resumes")
+        failed += 1
+    return f"Resumed {resumed} broadcasts, {failed} failed"
+
+
+def fail_operation(broadcast, progress, status_field, error):
+    """Tahrirlash/qaytarib olish xato bilan tugadi: holat 'failed', xato matni saqlanadi"""
+    setattr(broadcast, status_field, 'failed')
+    broadcast.last_error = str(error)[:1000]
+    broadcast.save(update_fields=[status_field, 'last_error'])
+    progress.finish('failed')
 
-    success_count = 0
-    fail_count = 0
-    recipients_to_create = []
-    
-    # Session orqali ulanishlarni qayta ishlatish (tezlik uchun)
-    session = requests.Session()
-    
-    # Media fayllarni oldindan o'qib olamiz (faqat 1 marta)
-    image_content = None
-    file_content = None
-    image_name = None
-    file_name = None
-
-    if broadcast.image:
-        with open(broadcast.image.path, 'rb') as f:
-            image_content = f.read()
-            image_name = os.path.basename(broadcast.image.name)
-    if broadcast.file:
-        with open(broadcast.file.path, 'rb') as f:
-            file_content = f.read()
-            file_name = os.path.basename(broadcast.file.name)
-
-    for i, user in enumerate(users):
-        try:
-            resp = None
-            if image_content:
-                url = f"https://api.telegram.org/bot{bot_token}/sendPhoto"
-                files = {'photo': (image_name, image_content)}
-                payload = {'chat_id': user.telegram_id, 'caption': broadcast.message, 'parse_mode': 'HTML'}
-                resp = session.post(url, data=payload, files=files, timeout=15)
-            elif file_content:
-                url = f"https://api.telegram.org/bot{bot_token}/sendDocument"
-                files = {'document': (file_name, file_content)}
-                payload = {'chat_id': user.telegram_id, 'caption': broadcast.message, 'parse_mode': 'HTML'}
-                resp = session.post(url, data=payload, files=files, timeout=15)
-            else:
-                url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-                payload = {'chat_id': user.telegram_id, 'text': broadcast.message, 'parse_mode': 'HTML'}
-                resp = session.post(url, json=payload, timeout=10)
-
-            if resp and resp.status_code == 200:
-                success_count += 1
-                result = resp.json().get('result', {})
-                # Recipient ni bulk_create uchun yig'amiz
-                recipients_to_create.append(BroadcastRecipient(
-                    broadcast=broadcast,
-                    telegram_id=user.telegram_id,
-                    message_id=result.get('message_id'),
-                    status='sent'
-                ))
-            else:
-                fail_count += 1
-        except Exception as e:
-            logger.error(f"Broadcast error for user {user.telegram_id}: {e}")
-            fail_count += 1
-        
-        # Har 30 ta xabardan keyin yoki oxirida yozamiz
-        if len(recipients_to_create) >= 50:
-            BroadcastRecipient.objects.bulk_create(recipients_to_create)
-            recipients_to_create = []
-            
-            # Progressni yangilash
-            broadcast.success_count = success_count
-            broadcast.fail_count = fail_count
-            broadcast.save(update_fields=['success_count', 'fail_count'])
-
-        # Telegram flood control uchun qisqa kutish
-        if (i + 1) % 30 == 0:
-            time.sleep(0.3)
-
-    # Qolgan recipientlarni yozish
-    if recipients_to_create:
-        BroadcastRecipient.objects.bulk_create(recipients_to_create)
-
-    broadcast.status = 'completed'
-    broadcast.completed_at = timezone.now()
-    broadcast.success_count = success_count
-    broadcast.fail_count = fail_count
-    broadcast.save()
-    
-    return f"Completed: {success_count} success, {fail_count} fail"
 
 @shared_task(bind=True)
 def update_broadcast_task(self, broadcast_id):
@@ -120,91 +160,172 @@ def update_broadcast_task(self, broadcast_id):
     except BroadcastHistory.DoesNotExist:
         return "Broadcast not found"
 
-    bot_token = settings.TELEGRAM_BOT_TOKEN
     recipients = broadcast.recipients.filter(status='sent', message_id__isnull=False)
-    
-    session = requests.Session()
-    success_count = 0
-    total_recipients = recipients.count()
-    
-    for recipient in recipients:
-        try:
-            resp = None
-            if broadcast.image:
-                # Edit Media (Image)
-                url = f"https://api.telegram.org/bot{bot_token}/editMessageMedia"
-                import json
-                media = {
-                    'type': 'photo',
-                    'media': 'attach://photo',
-                    'caption': broadcast.message,
-                    'parse_mode': 'HTML'
-                }
-                with open(broadcast.image.path, 'rb') as photo:
-                    files = {'photo': photo}
-                    payload = {
-                        'chat_id': recipient.telegram_id,
-                        'message_id': recipient.message_id,
-                        'media': json.dumps(media)
-                    }
-                    resp = session.post(url, data=payload, files=files, timeout=15)
-            elif broadcast.file:
-                # Edit Media (Document)
-                url = f"https://api.telegram.org/bot{bot_token}/editMessageMedia"
-                import json
-                media = {
-                    'type': 'document',
-                    'media': 'attach://doc',
-                    'caption': broadcast.message,
-                    'parse_mode': 'HTML'
-                }
-                with open(broadcast.file.path, 'rb') as doc:
-                    files = {'doc': doc}
-                    payload = {
-                        'chat_id': recipient.telegram_id,
-                        'message_id': recipient.message_id,
-                        'media': json.dumps(media)
-                    }
-                    resp = session.post(url, data=payload, files=files, timeout=15)
+
+    broadcast.edit_status = 'processing'
+    broadcast.edit_total = recipients.count()
+    broadcast.edit_success_count = 0
+    broadcast.edit_fail_count = 0
+    broadcast.edited_at = None
+    broadcast.save(update_fields=['edit_status', 'edit_total', 'edit_success_count', 'edit_fail_count', 'edited_at'])
+    progress = BroadcastProgress(broadcast, 'edit', broadcast.edit_total)
+
+    try:
+        # Yangi media faqat birinchi tahrirda yuklanadi, qolganlarida file_id ishlatiladi
+        kind = get_media_kind(broadcast)
+        upload = read_media(broadcast) if kind and not broadcast.media_file_id else None
+
+        def save_file_id(file_id):
+            broadcast.media_file_id = file_id
+            broadcast.save(update_fields=['media_file_id'])
+
+        results = deliver(
+            recipients.values_list('telegram_id', 'message_id').iterator(chunk_size=2000),
+            lambda item, file_id, media: edit_broadcast_message(broadcast, item[0], item[1], kind, file_id, media),
+            kind=kind,
+            file_id=broadcast.media_file_id,
+            upload=upload,
+            on_file_id=save_file_id
+        )
+
+        for (chat_id, message_id), result in results:
+            progress.record(result.ok)
+            if not result.ok:
+                logger.warning(f"Broadcast edit error for user {chat_id} (message {message_id}): {result.description}")
+
+        broadcast.edit_status = 'completed'
+        broadcast.edited_at = timezone.now()
+        broadcast.save(update_fields=['edit_status', 'edited_at'])
+        progress.finish('completed')
+    except Exception as e:
+        # Jarayon 'processing' holatida qolib ketmasligi kerak - aks holda keyingi tahrirlar bloklanadi
+        logger.error(f"Broadcast {broadcast.id} edit failed: {e}")
+        fail_operation(broadcast, progress, 'edit_status', e)
+        raise
+
+    return f"Updated {progress.sent} messages, {progress.failed} failed"
+
+
+@shared_task(bind=True)
+def recall_broadcast_task(self, broadcast_id):
+    """Yuborilgan xabarlarni barcha foydalanuvchilar chatidan o'chirish (qaytarib olish)"""
+    try:
+        broadcast = BroadcastHistory.objects.select_related('admin').get(id=broadcast_id)
+    except BroadcastHistory.DoesNotExist:
+        return "Broadcast not found"
+
+    recipients = BroadcastRecipient.objects.filter(
+        broadcast=broadcast, status='sent', message_id__isnull=False
+    )
+
+    broadcast.recall_status = 'processing'
+    broadcast.recall_total = recipients.count()
+    broadcast.recall_success_count = 0
+    broadcast.recall_fail_count = 0
+    broadcast.recalled_at = None
+    broadcast.save(update_fields=['recall_status', 'recall_total', 'recall_success_count', 'recall_fail_count', 'recalled_at'])
+    progress = BroadcastProgress(broadcast, 'recall', broadcast.recall_total)
+
+    try:
+        def flush_deleted(chat_ids):
+            BroadcastRecipient.objects.filter(broadcast=broadcast, telegram_id__in=chat_ids).update(status='deleted')
+
+        # (broadcast, telegram_id) indeksi bo'yicha oqim - barcha recipientlar xotiraga yuklanmaydi
+        items = recipients.order_by('telegram_id').values_list('telegram_id', 'message_id').iterator(chunk_size=2000)
+
+        deleted_ids = []
+        for (chat_id, message_id), result in fan_out(items, lambda item: delete_broadcast_message(*item)):
+            progress.record(result.ok)
+            if result.ok:
+                deleted_ids.append(chat_id)
             else:
-                # Edit Text Only
-                url = f"https://api.telegram.org/bot{bot_token}/editMessageText"
-                payload = {
-                    'chat_id': recipient.telegram_id,
-                    'message_id': recipient.message_id,
-                    'text': broadcast.message,
-                    'parse_mode': 'HTML'
-                }
-                resp = session.post(url, json=payload, timeout=10)
-            
-            if resp and resp.status_code == 200:
-                success_count += 1
-            
-            # Flood control: Faqat ko'p foydalanuvchi bo'lsa kutamiz
-            if total_recipients > 30 and success_count % 30 == 0:
-                time.sleep(0.5)
+                logger.warning(f"Broadcast recall error for user {chat_id} (message {message_id}): {result.description}")
 
-        except Exception as e:
-            continue
+            if len(deleted_ids) >= 500:
+                flush_deleted(deleted_ids)
+                deleted_ids = []
+
+        if deleted_ids:
+            flush_deleted(deleted_ids)
+
+        broadcast.recall_status = 'completed'
+        broadcast.recalled_at = timezone.now()
+        broadcast.save(update_fields=['recall_status', 'recalled_at'])
+        progress.finish('completed')
+    except Exception as e:
+        # Jarayon 'processing' holatida qolib ketmasligi kerak - aks holda qayta urinib bo'lmaydi
+        logger.error(f"Broadcast {broadcast.id} recall failed: {e}")
+        fail_operation(broadcast, progress, 'recall_status', e)
+        raise
+
+    success_count, fail_count = progress.sent, progress.failed
 
-    return f"Updated {success_count} messages"
+    # Yakuniy hisobotni adminga yuborish
+    report = (
+        f"🗑 <b>Xabar qaytarib olindi</b> (#{broadcast.id})\n\n"
+        f"👥 Jami: <b>{broadcast.recall_total}</b>\n"
+        f"✅ O'chirildi: <b>{success_count}</b>\n"
+        f"❌ Xatolik: <b>{fail_count}</b>"
+    )
+    if fail_count:
+        report += "\n\n<i>Telegram 48 soatdan eski xabarlarni o'chirishga ruxsat bermaydi.</i>"
+    from .outbox import queue_notification
+    queue_notification(broadcast.admin.telegram_id, report, kind='broadcast_report', priority=PRIORITY_REPORT)
+
+    return f"Recalled {success_count} messages, {fail_count} failed"
 
 
 @shared_task
 def send_payment_notification_task(telegram_id, message):
-    """To'lov holati haqida foydalanuvchini xabardor qilish"""
-    bot_token = settings.TELEGRAM_BOT_TOKEN
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-    payload = {
-        'chat_id': telegram_id,
-        'text': message,
-        'parse_mode': 'HTML'
-    }
-    try:
-        resp = requests.post(url, json=payload, timeout=10)
-        return resp.status_code == 200
-    except Exception as e:
-        return str(e)
+    """To'lov holati haqida foydalanuvchini xabardor qilish (outbox orqali)"""
+    from .outbox import queue_notification
+    queue_notification(telegram_id, message, kind='payment')
+    return True
+
+
+@shared_task
+def drain_notification_outbox_task():
+    """Outbox'dagi bildirishnomalarni Telegramga yuborish"""
+    from .outbox import drain_outbox
+    sent = drain_outbox()
+    return f"Sent {sent} notifications"
+
+
+@shared_task
+def send_submission_digest_task(test_id):
+    """Test egasiga yangi natijalar bo'yicha jamlanma xabar yuborish"""
+    from .digest import send_digest
+    count = send_digest(test_id)
+    return f"Digest for test {test_id}: {count} submissions"
+
+
+@shared_task
+def process_submission_intakes_task():
+    """Navbatdagi javoblar varaqlarini partiyalab baholash va yozish"""
+    from .ingest import process_intakes
+    created = process_intakes()
+    return f"Created {created} submissions from intake queue"
+
+
+@shared_task
+def sweep_submission_intakes_task():
+    """Davriy tekshiruv: to'xtab qolgan va rejalashtirilmay qolgan varaqlarni qayta ishlash, eskilarini tozalash"""
+    from .ingest import cleanup_intakes, process_intakes, release_stale_claims
+    released = release_stale_claims()
+    created = process_intakes()
+    deleted = cleanup_intakes()
+    return f"Released {released}, created {created} submissions, deleted {deleted} old intakes"
+
+
+@shared_task
+def sweep_notification_outbox_task():
+    """Davriy tekshiruv: qolib ketgan va qayta urinish vaqti kelgan xabarlarni yuborish"""
+    from .outbox import drain_outbox, release_stale_claims
+    released = release_stale_claims()
+    sent = drain_outbox()
+    return f"Released {released}, sent {sent} notifications"
+
+
 @shared_task
 def check_expired_tests_task():
     """Muddati o'tgan testlarni aniqlash va yakunlash (Avtomatik)"""
@@ -0,0 +1,60 @@
+"""
+Telegram Bot API uchun jarayon (process) bo'yicha yagona HTTP client.
+Ulanishlar pool'da saqlanadi (keep-alive) - har bir xabar uchun yangi TCP+TLS ulanish ochilmaydi.
+"""
+import threading
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# (ulanish, javobni o'qish) timeoutlari, soniyada
+DEFAULT_TIMEOUT = (3.05, 10)
+UPLOAD_TIMEOUT = (3.05, 30)
+
+_session = None
+_lock = threading.Lock()
+
+
+def build_retry():
+    """
+    Transport darajasida qayta yuborish yo'q: Telegram 5xx yoki uzilgan ulanishdan oldin xabarni
+    yetkazgan bo'lishi mumkin. Qayta yuborish qarori bitta joyda - broadcast_service.telegram_request da.
+    """
+    return Retry(total=0, raise_on_status=False)
+
+
+def get_session():
+    """Ulanishlarni qayta ishlatuvchi yagona session (thread-safe)"""
+    global _session
+    with _lock:
+        if _session is None:
+            adapter = HTTPAdapter(
+                pool_connections=2,
+                pool_maxsize=settings.TELEGRAM_POOL_SIZE,
+                max_retries=build_retry(),
+            )
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+    return _session
+
+
+def api_url(method):
+    return f"{settings.TELEGRAM_API_URL.rstrip('/')}/bot{settings.TELEGRAM_BOT_TOKEN}/{method}"
+
+
+def post(method, data=None, files=None, timeout=None):
+    """
+    Bot API metodini chaqirish. Fayl bo'lmasa JSON, aks holda multipart yuboriladi.
+    requests.Response qaytaradi (tarmoq xatolarida requests.RequestException ko'tariladi).
+    """
+    session = get_session()
+    if files:
+        return session.post(api_url(method), data=data, files=files, timeout=timeout or UPLOAD_TIMEOUT)
+    return session.post(api_url(method), json=data, timeout=timeout or DEFAULT_TIMEOUT)
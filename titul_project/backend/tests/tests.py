@@ -1,3 +1,716 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import outbox, tasks
+from .broadcast_service import TelegramResult
+from .ingest import build_submission
+from .models import (
+    User, Test, Question, Submission, SubmissionIntake,
+    NotificationOutbox, BroadcastHistory, BroadcastRecipient,
+)
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class SubmissionTestCase(TestCase):
+    """Natija qabul qilish testlari uchun umumiy tayyorgarlik (Redis va Celery talab qilinmaydi)"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.creator = User.objects.create(telegram_id=1000, full_name='Teacher')
+
+    def make_test(self, submission_mode='multiple', ingest_mode='sync', notify_mode='off', **fields):
+        test = Test.objects.create(
+            creator=self.creator, title='Test', subject='Matematika',
+            submission_mode=submission_mode, ingest_mode=ingest_mode, notify_mode=notify_mode, **fields
+        )
+        for number in range(1, 4):
+            Question.objects.create(test=test, question_number=number, correct_answer='A')
+        return test
+
+    def submit(self, test, telegram_id=1, name='Ali', key=None, correct=1):
+        """Natija yuborish: birinchi `correct` ta javob to'g'ri, qolganlari xato"""
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key is not None else {}
+        answers = {str(number): 'A' if number <= correct else 'B' for number in range(1, 4)}
+        return self.client.post('/api/v1/submissions/', {
+            'test_id': test.id,
+            'student_telegram_id': telegram_id,
+            'student_name': name,
+            'answers': answers,
+        }, format='json', **headers)
+
+
+class IdempotencyKeyTests(SubmissionTestCase):
+    def test_replay_returns_original_result(self):
+        test = self.make_test()
+        first = self.submit(test, key='key-1')
+        second = self.submit(test, key='key-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.json()['id'], first.json()['id'])
+        self.assertEqual(Submission.objects.filter(test=test).count(), 1)
+
+    def test_key_reused_for_other_student(self):
+        test = self.make_test()
+        self.submit(test, key='key-1')
+        response = self.submit(test, telegram_id=2, key='key-1')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Submission.objects.filter(test=test).count(), 1)
+
+    def test_invalid_key(self):
+        test = self.make_test()
+        self.assertEqual(self.submit(test, key='x' * 65).status_code, 400)
+        self.assertEqual(self.submit(test, key='  ').status_code, 400)
+        self.assertFalse(Submission.objects.exists())
+
+    def test_concurrent_request_with_same_key(self):
+        """Ikkinchi so'rov oldindan tekshiruvdan o'tib ketgan: unique cheklov asl natijani qaytaradi"""
+        from .views import SubmissionViewSet
+
+        test = self.make_test()
+        original = self.submit(test, key='key-1')
+        real_replay = SubmissionViewSet.replay_submission
+        calls = []
+
+        def replay(view, request, key):
+            # Birinchi chaqiruv (yozishdan oldingi tekshiruv) kalitni hali ko'rmaydi
+            calls.append(key)
+            return None if len(calls) == 1 else real_replay(view, request, key)
+
+        with mock.patch.object(SubmissionViewSet, 'replay_submission', autospec=True, side_effect=replay):
+            response = self.submit(test, key='key-1')
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(response.json()['id'], original.json()['id'])
+        self.assertEqual(Submission.objects.filter(test=test).count(), 1)
+
+    def test_queued_submission_replay(self):
+        test = self.make_test(ingest_mode='async')
+        first = self.submit(test, key='key-1')
+        second = self.submit(test, key='key-1')
+
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(second.status_code, 202)
+        self.assertEqual(second.json()['receipt_id'], first.json()['receipt_id'])
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(SubmissionIntake.objects.filter(test=test).count(), 1)
+
+
+class AttemptNumberingTests(SubmissionTestCase):
+    def build(self, test, telegram_id=1, name='Ali'):
+        return build_submission(test, list(test.questions.all()), telegram_id, name, {'1': 'A'}, attempt_number=1)
+
+    def test_sequential_attempts(self):
+        test = self.make_test()
+        numbers = [self.submit(test, name=name).json()['attempt_number'] for name in ['Ali', ' ali', 'ALI ']]
+        self.assertEqual(numbers, [1, 2, 3])
+
+    def test_conflict_is_retried_with_next_number(self):
+        """Eskirgan o'qish: parallel so'rov 1-urinishni yozib ulgurgan"""
+        from .ingest import save_submission
+
+        test = self.make_test()
+        save_submission(self.build(test))
+        submission = self.build(test)
+        previous = save_submission(submission, previous=None)
+
+        self.assertEqual(submission.attempt_number, 2)
+        self.assertEqual(previous['attempt_number'], 1)
+        self.assertEqual(
+            sorted(Submission.objects.filter(test=test).values_list('attempt_number', flat=True)), [1, 2]
+        )
+
+    def test_conflict_retries_are_limited(self):
+        from django.db import IntegrityError
+        from .ingest import save_submission
+
+        test = self.make_test()
+        save_submission(self.build(test))
+        with override_settings(SUBMISSION_ATTEMPT_RETRIES=1):
+            with self.assertRaises(IntegrityError):
+                save_submission(self.build(test), previous=None)
+        self.assertEqual(Submission.objects.filter(test=test).count(), 1)
+
+    def test_single_mode_conflict(self):
+        from .ingest import AlreadySubmitted, save_submission
+
+        test = self.make_test(submission_mode='single')
+        save_submission(self.build(test, name='Ali'))
+        # Telegram foydalanuvchisi ID bo'yicha - boshqa ism bilan ham
+        with self.assertRaises(AlreadySubmitted):
+            save_submission(self.build(test, name='Vali'), previous=None)
+        # Veb foydalanuvchisi (ID=0) ism bo'yicha
+        save_submission(self.build(test, telegram_id=0, name='Web'))
+        with self.assertRaises(AlreadySubmitted):
+            save_submission(self.build(test, telegram_id=0, name=' web'), previous=None)
+        self.assertEqual(Submission.objects.filter(test=test).count(), 2)
+
+    def test_single_mode_race_returns_400(self):
+        """validate() boshqa so'rov yozilishidan oldin o'tgan: baza cheklovi ikkinchi natijani rad etadi"""
+        from .serializers import CreateSubmissionSerializer
+
+        test = self.make_test(submission_mode='single')
+        self.assertEqual(self.submit(test).status_code, 201)
+        with mock.patch.object(CreateSubmissionSerializer, 'validate', lambda self, attrs: attrs):
+            response = self.submit(test)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('detail', response.json())
+        self.assertEqual(Submission.objects.filter(test=test).count(), 1)
+
+    def test_batch_falls_back_to_individual_saves(self):
+        """Partiya o'qilgandan keyin sinxron so'rov yozilgan: bulk_create to'qnashadi, varaqlar birma-bir yoziladi"""
+        from . import ingest
+
+        test = self.make_test()
+        intakes = [
+            SubmissionIntake.objects.create(
+                test=test, student_telegram_id=telegram_id, student_name=name, answers={'1': 'A'}, status='processing'
+            )
+            for telegram_id, name in [(1, 'Ali'), (2, 'Vali')]
+        ]
+        real_build = ingest.build_submission
+        concurrent = []
+
+        def build_after_concurrent_write(*args):
+            if not concurrent:
+                concurrent.append(ingest.save_submission(self.build(test)))
+            return real_build(*args)
+
+        with mock.patch.object(ingest, 'build_submission', side_effect=build_after_concurrent_write), \
+                mock.patch.object(ingest, 'save_individually', wraps=ingest.save_individually) as fallback:
+            created = ingest.process_test_batch(test.id, intakes)
+
+        fallback.assert_called_once()
+        self.assertEqual(created, 2)
+        self.assertEqual(
+            sorted(Submission.objects.filter(test=test).values_list('student_telegram_id', 'attempt_number')),
+            [(1, 1), (1, 2), (2, 1)],
+        )
+        for intake in intakes:
+            intake.refresh_from_db()
+            self.assertEqual(intake.status, 'done')
+
+    def test_batch_fallback_rejects_single_mode_duplicate(self):
+        from . import ingest
+
+        test = self.make_test(submission_mode='single')
+        intake = SubmissionIntake.objects.create(
+            test=test, student_telegram_id=1, student_name='Ali', answers={'1': 'A'}, status='processing'
+        )
+        real_build = ingest.build_submission
+
+        def build_after_concurrent_write(*args):
+            ingest.save_submission(self.build(test))
+            return real_build(*args)
+
+        with mock.patch.object(ingest, 'build_submission', side_effect=build_after_concurrent_write):
+            created = ingest.process_test_batch(test.id, [intake])
+
+        intake.refresh_from_db()
+        self.assertEqual(created, 0)
+        self.assertEqual(intake.status, 'rejected')
+        self.assertEqual(Submission.objects.filter(test=test).count(), 1)
+
+
+class SubmissionIntakeTests(SubmissionTestCase):
+    def test_queued_submission_flow(self):
+        from .ingest import process_intakes
+
+        test = self.make_test(ingest_mode='async')
+        response = self.submit(test)
+        self.assertEqual(response.status_code, 202)
+        status_url = response.json()['status_url']
+        self.assertEqual(self.client.get(status_url).json()['status'], 'pending')
+
+        self.assertEqual(process_intakes(), 1)
+        data = self.client.get(status_url).json()
+        self.assertEqual(data['status'], 'done')
+        self.assertEqual(data['submission']['attempt_number'], 1)
+        test.refresh_from_db()
+        self.assertEqual(test.submissions_count, 1)
+
+    def test_single_mode_duplicate_rejected(self):
+        from .ingest import process_intakes
+
+        test = self.make_test(submission_mode='single', ingest_mode='async')
+        first = self.submit(test).json()['receipt_id']
+        second = self.submit(test, name='Boshqa').json()['receipt_id']
+        process_intakes()
+
+        self.assertEqual(SubmissionIntake.objects.get(id=first).status, 'done')
+        rejected = self.client.get(f'/api/v1/submissions/intake/{second}/').json()
+        self.assertEqual(rejected['status'], 'rejected')
+        self.assertTrue(rejected['error'])
+
+    def test_failing_batch_does_not_block_other_tests(self):
+        from . import ingest
+
+        failing, other = self.make_test(ingest_mode='async'), self.make_test(ingest_mode='async')
+        failed_receipt = self.submit(failing).json()['receipt_id']
+        other_receipt = self.submit(other).json()['receipt_id']
+        real_batch = ingest.process_test_batch
+
+        def process_test_batch(test_id, intakes):
+            if test_id == failing.id:
+                raise RuntimeError('boom')
+            return real_batch(test_id, intakes)
+
+        with override_settings(SUBMISSION_INGEST_MAX_ATTEMPTS=2), \
+                mock.patch.object(ingest, 'process_test_batch', side_effect=process_test_batch):
+            ingest.process_intakes()
+            self.assertEqual(SubmissionIntake.objects.get(id=other_receipt).status, 'done')
+            self.assertEqual(SubmissionIntake.objects.get(id=failed_receipt).status, 'pending')
+            ingest.process_intakes()
+
+        intake = SubmissionIntake.objects.get(id=failed_receipt)
+        self.assertEqual((intake.status, intake.attempts), ('rejected', 2))
+        self.assertIn('boom', intake.error)
+
+    def test_unknown_receipt(self):
+        response = self.client.get('/api/v1/submissions/intake/00000000-0000-0000-0000-000000000000/')
+        self.assertEqual(response.status_code, 404)
+
+
+class TestStatsTests(SubmissionTestCase):
+    def stats(self, test):
+        test.refresh_from_db()
+        return test.submissions_count, test.score_sum, test.max_score, test.results_version
+
+    def test_first_attempts_are_added(self):
+        test = self.make_test()
+        self.submit(test, telegram_id=1, correct=2)
+        self.submit(test, telegram_id=2, correct=3)
+
+        self.assertEqual(self.stats(test), (2, 5, 3, 2))
+        self.assertEqual(test.average_score, 2.5)
+
+    def test_only_latest_attempt_counts(self):
+        test = self.make_test()
+        self.submit(test, name='Ali', correct=1)
+        # Ism registri va bo'shliqlar boshqa o'quvchi hisoblanmaydi
+        self.submit(test, name='  ali ', correct=3)
+
+        self.assertEqual(self.stats(test), (1, 3, 3, 2))
+
+    def test_lower_retry_recomputes_max(self):
+        test = self.make_test()
+        self.submit(test, telegram_id=1, correct=3)
+        self.submit(test, telegram_id=2, correct=1)
+        self.submit(test, telegram_id=1, correct=2)
+
+        self.assertEqual(self.stats(test), (2, 3, 2, 3))
+
+    def test_record_submission_with_known_previous(self):
+        from .stats import record_submission
+
+        test = self.make_test()
+        self.submit(test, correct=1)
+        submission = Submission.objects.get(test=test)
+        submission.score = 3
+        record_submission(submission, previous=1)
+
+        self.assertEqual(self.stats(test), (1, 3, 3, 2))
+
+    def test_recompute_stats_matches_submissions(self):
+        from .stats import calculate_stats, recompute_stats
+
+        test = self.make_test()
+        self.submit(test, telegram_id=1, correct=1)
+        self.submit(test, telegram_id=1, correct=2)
+        self.submit(test, telegram_id=2, correct=3)
+        Test.objects.filter(id=test.id).update(submissions_count=0, score_sum=0, max_score=0)
+        Submission.objects.filter(test=test, student_telegram_id=2).delete()
+
+        recompute_stats(test)
+
+        self.assertEqual((test.submissions_count, test.score_sum, test.max_score), (1, 2, 2))
+        self.assertEqual(self.stats(test), (1, 2, 2, 4))
+        self.assertEqual(calculate_stats(test.id)['submissions_count'], 1)
+
+    def test_saving_test_keeps_stats(self):
+        test = self.make_test()
+        stale = Test.objects.get(id=test.id)
+        self.submit(test, correct=2)
+
+        response = self.client.patch(f'/api/v1/tests/{test.id}/', {'title': 'Yangi'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        stale.finish(send_notify=False)
+        test.refresh_from_db()
+        self.assertEqual((test.title, test.is_active), ('Yangi', False))
+        self.assertEqual((test.submissions_count, test.score_sum), (1, 2))
+
+
+class SubmissionListTests(SubmissionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.test = self.make_test()
+        self.submit(self.test, telegram_id=1, name='Ali', correct=3)
+        self.submit(self.test, telegram_id=1, name=' ali ', correct=1)
+        self.submit(self.test, telegram_id=2, name='Vali', correct=2)
+        self.submit(self.test, telegram_id=3, name='Sami', correct=3)
+        self.url = f'/api/v1/tests/{self.test.id}/results/'
+
+    def ids(self, response):
+        data = response.json()
+        return [row['id'] for row in (data['results'] if isinstance(data, dict) else data)]
+
+    def test_latest_uses_student_key(self):
+        response = self.client.get(self.url, {'latest': '1'})
+
+        latest = Submission.objects.filter(test=self.test).exclude(attempt_number=1, student_telegram_id=1)
+        self.assertEqual(sorted(self.ids(response)), sorted(latest.values_list('id', flat=True)))
+        self.assertEqual(len(self.ids(response)), 3)
+
+    def test_grade_filter(self):
+        grade = Submission.objects.get(test=self.test, student_telegram_id=2).grade
+        response = self.client.get(self.url, {'grade': grade})
+
+        self.assertTrue(response.json())
+        self.assertTrue(all(row['grade'] == grade for row in response.json()))
+        self.assertNotIn(grade, Submission.objects.filter(student_telegram_id=3).values_list('grade', flat=True))
+
+    def test_fields_selection(self):
+        response = self.client.get(f'/api/v1/submissions/test/{self.test.id}/', {'fields': 'id,score'})
+
+        self.assertEqual(set(response.json()[0]), {'id', 'score'})
+
+    def test_cursor_pagination(self):
+        expected = list(Submission.objects.filter(test=self.test).order_by('-score', '-id').values_list('id', flat=True))
+
+        first = self.client.get(self.url, {'limit': 3}).json()
+        second = self.client.get(first['next']).json()
+
+        self.assertEqual([row['id'] for row in first['results']], expected[:3])
+        self.assertEqual([row['id'] for row in second['results']], expected[3:])
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.client.get(self.url, {'cursor': '!!!'}).status_code, 404)
+
+
+class SubmissionNotifyTests(SubmissionTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.multiple(tasks.send_submission_digest_task, delay=mock.DEFAULT, apply_async=mock.DEFAULT)
+        self.digest_task = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def notifications(self):
+        return NotificationOutbox.objects.filter(chat_id=self.creator.telegram_id)
+
+    def test_off_sends_nothing(self):
+        test = self.make_test(notify_mode='off')
+        self.submit(test)
+
+        self.assertFalse(self.notifications().exists())
+        self.assertFalse(self.digest_task['apply_async'].called)
+
+    def test_each_sends_one_message_per_submission(self):
+        test = self.make_test(notify_mode='each')
+        self.submit(test, telegram_id=1)
+        self.submit(test, telegram_id=2)
+
+        self.assertEqual(list(self.notifications().values_list('kind', flat=True)), ['submission', 'submission'])
+        self.assertFalse(self.digest_task['apply_async'].called)
+
+    def test_digest_is_coalesced(self):
+        from .digest import send_digest
+
+        test = self.make_test(notify_mode='digest', digest_interval=60, digest_batch_size=10)
+        for telegram_id in range(1, 4):
+            self.submit(test, telegram_id=telegram_id, name=f'Talaba <{telegram_id}>', correct=telegram_id)
+
+        # Bir oynadagi natijalar uchun bitta kechiktirilgan task
+        self.digest_task['apply_async'].assert_called_once_with((test.id,), countdown=60)
+        self.assertFalse(self.digest_task['delay'].called)
+        self.assertFalse(self.notifications().exists())
+
+        self.assertEqual(send_digest(test.id), 3)
+        self.assertEqual(send_digest(test.id), 0)
+
+        digest = self.notifications().get()
+        self.assertEqual(digest.kind, 'submission_digest')
+        self.assertIn('<b>3 ta</b>', digest.text)
+        self.assertIn('Talaba &lt;3&gt;', digest.text)
+        self.assertIn('<b>2.0</b>', digest.text)
+
+    def test_digest_batch_size_sends_early(self):
+        test = self.make_test(notify_mode='digest', digest_batch_size=2)
+        self.submit(test, telegram_id=1)
+        self.submit(test, telegram_id=2)
+
+        self.digest_task['delay'].assert_called_once_with(test.id)
+
+
+class ConditionalGetTests(SubmissionTestCase):
+    def setUp(self):
+        super().setUp()
+        from . import manifest_cache
+        manifest_cache._local.clear()
+        self.test = self.make_test()
+
+    def assertNotModified(self, url):
+        """ETag qaytariladi va If-None-Match bilan takroriy so'rov 304 oladi. ETag ni qaytaradi"""
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        cached = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], etag)
+        # Proksi zaif ETag ga aylantirgan bo'lsa ham mos keladi
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=f'W/{etag}').status_code, 304)
+        return etag
+
+    def assertChanged(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_results_etag_changes_after_submission(self):
+        for url in (f'/api/v1/tests/{self.test.id}/results/', f'/api/v1/submissions/test/{self.test.id}/'):
+            with self.subTest(url=url):
+                etag = self.assertNotModified(url)
+                self.submit(self.test, telegram_id=len(url))
+                self.assertChanged(url, etag)
+
+    def test_results_etag_depends_on_query(self):
+        url = f'/api/v1/tests/{self.test.id}/results/'
+        etag = self.assertNotModified(url)
+
+        self.assertEqual(self.client.get(f'{url}?latest=1', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_by_code_etag_changes_after_edit(self):
+        url = f'/api/v1/tests/code/{self.test.access_code}/'
+        etag = self.assertNotModified(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/v1/tests/{self.test.id}/', {'title': 'Yangi'}, format='json')
+
+        self.assertChanged(url, etag)
+
+    def test_settings_etag_changes_after_update(self):
+        User.objects.create(telegram_id=1, full_name='Super', role='superadmin')
+        etag = self.assertNotModified('/api/v1/admin/settings/')
+
+        response = self.client.patch(
+            '/api/v1/admin/settings/', {'free_test_limit': 10}, format='json', HTTP_X_TELEGRAM_ID='1'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertChanged('/api/v1/admin/settings/', etag)
+
+
+def telegram_result(status_code=200, description=None):
+    """Soxta Telegram javobi: 200 - muvaffaqiyatli, boshqasi - xatolik"""
+    if status_code == 200:
+        return TelegramResult(True, {'message_id': 1}, 200, None)
+    return TelegramResult(False, None, status_code, description or f'HTTP {status_code}')
+
+
+@override_settings(CACHES=LOCMEM_CACHE, NOTIFICATION_MAX_ATTEMPTS=3)
+class NotificationOutboxTests(TestCase):
+    def notify(self, chat_id, **kwargs):
+        return NotificationOutbox.objects.create(chat_id=chat_id, text='Salom', **kwargs)
+
+    def drain(self, status_by_chat):
+        def telegram_request(method, payload, priority=None):
+            return telegram_result(status_by_chat.get(payload['chat_id'], 200))
+
+        with mock.patch.object(outbox, 'telegram_request', side_effect=telegram_request):
+            return outbox.drain_outbox()
+
+    def test_claim_batch_orders_by_priority_and_skips_unavailable(self):
+        report = self.notify(1, priority=1)
+        transactional = self.notify(2, priority=0)
+        self.notify(3, available_at=timezone.now() + timedelta(minutes=1))
+        self.notify(4, status='sending', claimed_at=timezone.now())
+
+        claimed = outbox.claim_batch(10)
+
+        self.assertEqual([n.id for n in claimed], [transactional.id, report.id])
+        self.assertTrue(all(n.status == 'sending' and n.claimed_at for n in claimed))
+        self.assertEqual(outbox.claim_batch(10), [])
+
+    def test_claim_batch_respects_limit(self):
+        for chat_id in range(1, 4):
+            self.notify(chat_id)
+
+        self.assertEqual(len(outbox.claim_batch(2)), 2)
+        self.assertEqual(NotificationOutbox.objects.filter(status='pending').count(), 1)
+
+    def test_drain_marks_sent(self):
+        notification = self.notify(1)
+
+        self.assertEqual(self.drain({}), 1)
+        notification.refresh_from_db()
+        self.assertEqual((notification.status, notification.attempts), ('sent', 1))
+        self.assertIsNotNone(notification.sent_at)
+
+    def test_retryable_error_is_backed_off(self):
+        first, second = self.notify(1), self.notify(2, attempts=1)
+        before = timezone.now()
+
+        self.assertEqual(self.drain({1: 429, 2: None}), 0)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, first.attempts), ('pending', 1))
+        self.assertEqual((second.status, second.attempts), ('pending', 2))
+        # 10s, keyin 20s kutish
+        self.assertGreaterEqual(first.available_at, before + timedelta(seconds=10))
+        self.assertLess(first.available_at, before + timedelta(seconds=20))
+        self.assertGreaterEqual(second.available_at, before + timedelta(seconds=20))
+        self.assertEqual(first.last_error, 'HTTP 429')
+        # Kutish muddati tugamaguncha qayta olinmaydi
+        self.assertEqual(outbox.claim_batch(10), [])
+
+    def test_fails_after_max_attempts(self):
+        notification = self.notify(1, attempts=2)
+
+        self.drain({1: 503})
+
+        notification.refresh_from_db()
+        self.assertEqual((notification.status, notification.attempts), ('failed', 3))
+
+    def test_non_retryable_error_fails_immediately(self):
+        notification = self.notify(1)
+
+        self.drain({1: 403})
+
+        notification.refresh_from_db()
+        self.assertEqual((notification.status, notification.attempts), ('failed', 1))
+        self.assertEqual(notification.last_error, 'HTTP 403')
+
+    @override_settings(NOTIFICATION_CLAIM_TIMEOUT=60)
+    def test_release_stale_claims(self):
+        stale = self.notify(1, status='sending', claimed_at=timezone.now() - timedelta(minutes=5))
+        fresh = self.notify(2, status='sending', claimed_at=timezone.now())
+
+        self.assertEqual(outbox.release_stale_claims(), 1)
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, fresh.status), ('pending', 'sending'))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class BroadcastTaskTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create(telegram_id=1000, full_name='Admin', role='admin')
+
+    def make_broadcast(self, **kwargs):
+        return BroadcastHistory.objects.create(admin=self.admin, message='Salom', target_roles=['all'], **kwargs)
+
+    def add_recipients(self, broadcast, count):
+        for chat_id in range(1, count + 1):
+            BroadcastRecipient.objects.create(broadcast=broadcast, telegram_id=chat_id, status='sent', message_id=chat_id)
+
+    def test_audience_is_materialized_with_segment(self):
+        User.objects.create(telegram_id=1, full_name='A', role='teacher', balance=5)
+        User.objects.create(telegram_id=2, full_name='B', role='teacher', balance=0)
+        User.objects.create(telegram_id=3, full_name='C', role='teacher', balance=5, is_reachable=False)
+        User.objects.create(telegram_id=4, full_name='D', role='user', balance=5)
+        broadcast = self.make_broadcast(segment={'has_balance': True, 'reachable_only': True})
+        broadcast.target_roles = ['teacher']
+        broadcast.save()
+
+        with mock.patch.object(tasks, 'send_broadcast_message', return_value=telegram_result()):
+            tasks.send_broadcast_task(broadcast.id)
+
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.status, broadcast.total_users), ('completed', 1))
+        self.assertEqual(list(broadcast.recipients.values_list('telegram_id', 'status')), [(1, 'sent')])
+
+    def test_failed_recipients_are_not_resent(self):
+        User.objects.create(telegram_id=3, full_name='C')
+        broadcast = self.make_broadcast(status='processing', total_users=3)
+        BroadcastRecipient.objects.create(broadcast=broadcast, telegram_id=1, status='sent', message_id=1)
+        BroadcastRecipient.objects.create(broadcast=broadcast, telegram_id=2, status='failed')
+        BroadcastRecipient.objects.create(broadcast=broadcast, telegram_id=3, status='queued')
+
+        with mock.patch.object(tasks, 'send_broadcast_message', return_value=telegram_result(403)) as send:
+            tasks.send_broadcast_task(broadcast.id)
+
+        self.assertEqual([c.args[1] for c in send.call_args_list], [3])
+        # Botni bloklagan foydalanuvchi keyingi segmentlarga kirmaydi
+        self.assertFalse(User.objects.get(telegram_id=3).is_reachable)
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.success_count, broadcast.fail_count), (1, 2))
+
+    @override_settings(BROADCAST_MAX_RESUMES=2)
+    def test_resume_is_capped(self):
+        broadcast = self.make_broadcast(status='processing', resume_count=1)
+
+        with mock.patch.object(tasks.send_broadcast_task, 'delay') as delay:
+            tasks.resume_stalled_broadcasts_task()
+            tasks.resume_stalled_broadcasts_task()
+
+        delay.assert_called_once_with(broadcast.id)
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.status, broadcast.resume_count), ('failed', 2))
+        self.assertTrue(broadcast.last_error)
+
+    def test_edit_counts_results(self):
+        broadcast = self.make_broadcast(status='completed')
+        self.add_recipients(broadcast, 3)
+
+        def edit(broadcast, chat_id, message_id, kind, file_id, media):
+            return telegram_result(400 if chat_id == 2 else 200)
+
+        with mock.patch.object(tasks, 'edit_broadcast_message', side_effect=edit):
+            tasks.update_broadcast_task(broadcast.id)
+
+        broadcast.refresh_from_db()
+        self.assertEqual(broadcast.edit_status, 'completed')
+        self.assertEqual((broadcast.edit_total, broadcast.edit_success_count, broadcast.edit_fail_count), (3, 2, 1))
+
+    def test_edit_failure_is_recorded(self):
+        broadcast = self.make_broadcast(status='completed')
+        self.add_recipients(broadcast, 1)
+
+        with mock.patch.object(tasks, 'deliver', side_effect=RuntimeError('boom')), \
+                self.assertRaises(RuntimeError):
+            tasks.update_broadcast_task(broadcast.id)
+
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.edit_status, broadcast.last_error), ('failed', 'boom'))
+
+    def test_recall_deletes_messages_and_queues_report(self):
+        broadcast = self.make_broadcast(status='completed')
+        self.add_recipients(broadcast, 3)
+
+        def delete(chat_id, message_id):
+            return telegram_result(400 if chat_id == 3 else 200)
+
+        with mock.patch.object(tasks, 'delete_broadcast_message', side_effect=delete):
+            tasks.recall_broadcast_task(broadcast.id)
+
+        broadcast.refresh_from_db()
+        self.assertEqual(broadcast.recall_status, 'completed')
+        self.assertEqual((broadcast.recall_success_count, broadcast.recall_fail_count), (2, 1))
+        self.assertEqual(broadcast.recipients.filter(status='deleted').count(), 2)
+        report = NotificationOutbox.objects.get(kind='broadcast_report')
+        self.assertEqual(report.chat_id, self.admin.telegram_id)
+
+    def test_recall_failure_is_recorded(self):
+        broadcast = self.make_broadcast(status='completed')
+        self.add_recipients(broadcast, 1)
+
+        with mock.patch.object(tasks, 'fan_out', side_effect=RuntimeError('boom')), \
+                self.assertRaises(RuntimeError):
+            tasks.recall_broadcast_task(broadcast.id)
+
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.recall_status, broadcast.last_error), ('failed', 'boom'))
@@ -13,6 +13,7 @@ urlpatterns = [
     path('', include(router.urls)),
     path('public-stats/', views.PublicStatsView.as_view(), name='public-stats'),
     path('health/', views.health_check, name='health_check'),
+    path('internal/telegram/send/', views.InternalTelegramSendView.as_view(), name='internal_telegram_send'),
     
     # Admin routes
     path('admin/stats/', admin_views.AdminStatsView.as_view(), name='admin_stats'),
@@ -24,6 +25,8 @@ urlpatterns = [
     path('admin/broadcast/history/', admin_views.AdminBroadcastListView.as_view(), name='admin_broadcast_list'),
     path('admin/broadcast/<int:pk>/status/', admin_views.AdminBroadcastStatusView.as_view(), name='admin_broadcast_status'),
     path('admin/broadcast/<int:pk>/delete/', admin_views.AdminBroadcastDestroyView.as_view(), name='admin_broadcast_delete'),
+    path('admin/broadcast/<int:pk>/stream/', admin_views.AdminBroadcastStreamView.as_view(), name='admin_broadcast_stream'),
+    path('admin/broadcast/<int:pk>/recall/', admin_views.AdminBroadcastRecallView.as_view(), name='admin_broadcast_recall'),
     
     # Settings & Payment Receipts
     path('admin/settings/', admin_views.SystemSettingsView.as_view(), name='admin_settings'),
@@ -5,11 +5,12 @@ from django.shortcuts import get_object_or_404
 from django.http import HttpResponse, FileResponse
 from .models import User, Test, Question, Submission, Payment, Announcement, ActivityLog
 from .serializers import (
-    UserSerializer, TestSerializer, QuestionSerializer,
-    SubmissionSerializer, PaymentSerializer,
+    UserSerializer, TestSerializer, TestListSerializer, QuestionSerializer,
+    SubmissionSerializer, SubmissionListSerializer, PaymentSerializer,
     CreateTestSerializer, UpdateTestSerializer, CreateSubmissionSerializer,
-    AnnouncementSerializer
+    AnnouncementSerializer, OutboxMessageSerializer
 )
+from .permissions import IsInternalService
 from .utils import generate_pdf_report
 from .rasch_service import calibrate_test_items, calculate_rasch_scores
 import logging
@@ -17,6 +18,47 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def wants_detail(request):
+    """Ro'yxat endpointlarida to'liq ma'lumot faqat ?detail=1 bilan"""
+    return request.query_params.get('detail', '').lower() in ('1', 'true', 'yes')
+
+
+def list_submissions(request, submissions):
+    """
+    Natijalar ro'yxati: filtrlar (grade, name, latest), ?fields= va ixtiyoriy
+    cursor pagination (?limit=, ?cursor=) - results va by_test uchun umumiy
+    """
+    from .pagination import ScoreCursorPagination
+    from .stats import latest_attempts
+
+    params = request.query_params
+    if params.get('grade'):
+        # URL da '+' bo'sh joyga aylanadi (A+ -> "A "), darajalarda bo'sh joy yo'q
+        grades = [g.lstrip().replace(' ', '+') for g in params['grade'].split(',') if g.strip()]
+        submissions = submissions.filter(grade__in=grades)
+    if params.get('name'):
+        submissions = submissions.filter(student_name__istartswith=params['name'].strip())
+    if params.get('latest', '').lower() in ('1', 'true', 'yes'):
+        # Har bir o'quvchining (telegram_id, student_key) faqat oxirgi urinishi - statistika bilan bir xil
+        submissions = latest_attempts(submissions)
+
+    if wants_detail(request):
+        serializer_class = SubmissionSerializer
+        submissions = submissions.select_related('test')
+    else:
+        serializer_class = SubmissionListSerializer
+        submissions = submissions.defer('answers')
+    fields = [f.strip() for f in params.get('fields', '').split(',') if f.strip()] or None
+
+    if ScoreCursorPagination.is_requested(request):
+        paginator = ScoreCursorPagination()
+        page = paginator.paginate_queryset(submissions, request)
+        return paginator.get_paginated_response(serializer_class(page, many=True, fields=fields).data)
+
+    submissions = submissions.order_by(*ScoreCursorPagination.ordering)
+    return Response(serializer_class(submissions, many=True, fields=fields).data)
+
+
 class UserViewSet(viewsets.ModelViewSet):
     """Foydalanuvchilar CRUD"""
     queryset = User.objects.all()
@@ -44,10 +86,61 @@ class UserViewSet(viewsets.ModelViewSet):
                 description=f"Yangi foydalanuvchi ro'yxatdan o'tdi: {user.full_name}",
                 metadata={'telegram_id': user.telegram_id, 'role': user.role}
             )
+        elif not user.is_reachable:
+            # Foydalanuvchi botga qayta yozdi (/start) - botni blokdan chiqargan, broadcastlarga qaytariladi
+            User.objects.filter(id=user.id).update(is_reachable=True)
+            user.is_reachable = True
         
         serializer = self.get_serializer(user)
         return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
+    @action(detail=True, methods=['get'])
+    def me(self, request, telegram_id=None):
+        """
+        Bot menyulari uchun jamlangan profil: foydalanuvchi, balans, bepul testlar,
+        oxirgi to'lovlar va testlar - bitta so'rovda
+        """
+        from django.db.models import Count, Q, Sum
+        from .models import PaymentReceipt
+
+        user = get_object_or_404(User, telegram_id=telegram_id)
+        data = UserSerializer(user).data
+
+        # Faqat yakunlangan to'lovlar: online (completed) va chek orqali (accepted)
+        payments = Payment.objects.filter(user=user, status='completed')
+        receipts = PaymentReceipt.objects.filter(user=user, status='accepted')
+        online = payments.aggregate(count=Count('id'), total=Sum('amount'))
+        manual = receipts.aggregate(count=Count('id'), total=Sum('amount'))
+
+        # Vaqt va summalar oddiy serializerlardagi kabi formatlanadi
+        as_datetime = serializers.DateTimeField().to_representation
+        recent_payments = [
+            {'amount': str(p['amount']), 'payment_method': p['payment_method'], 'status': 'completed', 'timestamp': p['created_at']}
+            for p in payments.order_by('-created_at').values('amount', 'payment_method', 'created_at')[:5]
+        ] + [
+            {'amount': str(r['amount'] or 0), 'payment_method': 'Chek orqali', 'status': 'accepted', 'timestamp': r['created_at']}
+            for r in receipts.order_by('-created_at').values('amount', 'created_at')[:5]
+        ]
+        recent_payments = sorted(recent_payments, key=lambda x: x['timestamp'], reverse=True)[:5]
+        for item in recent_payments:
+            item['timestamp'] = as_datetime(item['timestamp'])
+
+        tests = Test.objects.filter(creator=user)
+        test_counts = tests.aggregate(total=Count('id'), active=Count('id', filter=Q(is_active=True)))
+
+        data.update({
+            'payments_count': online['count'] + manual['count'],
+            'total_paid': str((online['total'] or 0) + (manual['total'] or 0)),
+            'recent_payments': recent_payments,
+            'tests_count': test_counts['total'],
+            'active_tests_count': test_counts['active'],
+            'recent_tests': [
+                {**t, 'created_at': as_datetime(t['created_at'])}
+                for t in tests.order_by('-created_at').values('id', 'title', 'access_code', 'is_active', 'created_at')[:5]
+            ],
+        })
+        return Response(data)
+
 
 class TestViewSet(viewsets.ModelViewSet):
     """Testlar CRUD"""
@@ -134,11 +227,14 @@ class TestViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'], url_path='code/(?P<access_code>[^/.]+)')
     def by_code(self, request, access_code=None):
-        """Access code orqali test olish"""
-        test = get_object_or_404(Test, access_code=access_code)
-        test.is_expired()  # Avtomatik yakunlanishni tekshirish
-        serializer = self.get_serializer(test)
-        return Response(serializer.data)
+        """Access code orqali test olish (keshdan)"""
+        from .manifest_cache import get_manifest_entry
+        from .etags import conditional_response
+        entry = get_manifest_entry(access_code)
+        if entry is None:
+            return Response({'detail': 'Test topilmadi'}, status=status.HTTP_404_NOT_FOUND)
+        data, etag = entry
+        return conditional_response(request, etag, lambda: Response(data))
     
     @action(detail=False, methods=['get'], url_path='user/(?P<telegram_id>[^/.]+)')
     def user_tests(self, request, telegram_id=None):
@@ -147,14 +243,17 @@ class TestViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Telegram ID raqam bo\'lishi kerak'}, status=status.HTTP_400_BAD_REQUEST)
             
         user = get_object_or_404(User, telegram_id=telegram_id)
-        tests = Test.objects.filter(creator=user).order_by('-created_at')
+        tests = Test.objects.filter(creator=user).select_related('creator').order_by('-created_at')
+        if wants_detail(request):
+            tests = tests.prefetch_related('questions')
         
         # Har bir faol testni muddatini tekshirish
         for test in tests:
             if test.is_active:
                 test.is_expired()
                 
-        serializer = self.get_serializer(tests, many=True)
+        serializer_class = TestSerializer if wants_detail(request) else TestListSerializer
+        serializer = serializer_class(tests, many=True)
         return Response(serializer.data)
     
     @action(detail=True, methods=['get'], url_path='id')
@@ -167,47 +266,65 @@ class TestViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'], url_path='check_status/(?P<telegram_id>[^/.]+)')
     def check_attempt_status(self, request, pk=None, telegram_id=None):
-        """Talaba ushbu testni topshirganmi yoki yo'q tekshirish"""
-        test = self.get_object()
-        
-        # Telegram ID raqam ekanligini tekshirish (500 xatolikni oldini olish uchun)
-        if not str(telegram_id).isdigit():
-            # Agar ID raqam bo'lmasa (masalan, kutilmaganda test kodi kelib qolsa)
-            # Biz buni "yangi urinish" sifatida ko'rsatamiz (yoki 400 qaytaramiz)
-            # Frontend kodi noto'g'ri bo'lganda bu xatolikni oldini oladi
-            return Response({
-                'can_submit': True,
-                'existing_attempts_count': 0,
-                'submission_mode': test.submission_mode,
-                'is_active': test.is_active,
-                'is_expired': test.is_expired(),
-                'warning': 'Invalid Telegram ID format'
-            })
+        """
+        Talaba ushbu testni topshirganmi yoki yo'q tekshirish (topshirish sahifasi har ochilganda).
+        Test va urinishlar soni bitta so'rovda olinadi; muddati o'tgan testni yakunlash
+        check_expired_tests_task ga qoldiriladi.
+        """
+        from django.core.cache import cache
+        from django.conf import settings
+        from django.db.models import Count, Max, Q
+        from django.utils import timezone
 
+        # Telegram ID raqam bo'lmasa (masalan, kutilmaganda test kodi kelib qolsa)
+        # "yangi urinish" sifatida ko'rsatamiz - frontend xatosida 500 bo'lmasligi uchun
+        valid_id = str(telegram_id).isdigit()
         student_name = request.query_params.get('student_name', '').strip()
-        query = test.submissions.filter(student_telegram_id=telegram_id)
-        if str(telegram_id) == '0' and student_name:
-            query = query.filter(student_name__iexact=student_name)
-            
-        submissions = query.order_by('attempt_number')
-        
-        can_submit = True
-        if test.submission_mode == 'single':
-            if str(telegram_id) != '0':
-                if submissions.exists():
-                    can_submit = False
-            elif student_name:
-                # Veb foydalanuvchisi uchun (ID=0) ism bo'yicha tekshirish
-                if test.submissions.filter(student_name__iexact=student_name).exists():
-                    can_submit = False
-            
-        return Response({
-            'can_submit': can_submit,
-            'existing_attempts_count': submissions.count(),
-            'submission_mode': test.submission_mode,
-            'is_active': test.is_active,
-            'is_expired': test.is_expired()
-        })
+        # Veb foydalanuvchisi (ID=0) ism bo'yicha aniqlanadi
+        by_name = valid_id and str(telegram_id) == '0' and bool(student_name)
+
+        cache_key = f"attempt_status:{pk}:{telegram_id}:{student_name.lower() if by_name else ''}"
+        if valid_id:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return Response(cached)
+
+        tests = Test.objects.filter(pk=pk)
+        fields = ['submission_mode', 'is_active', 'expires_at']
+        if valid_id:
+            from .ingest import single_mode_filter
+            attempts = Q(submissions__student_telegram_id=telegram_id)
+            if by_name or str(telegram_id) != '0':
+                # Javob qabul qilishdagi (CreateSubmissionSerializer) bilan bir xil shart
+                attempts = single_mode_filter(int(telegram_id), student_name, prefix='submissions__')
+            tests = tests.annotate(
+                attempts_count=Count('submissions', filter=attempts),
+                last_attempt=Max('submissions__attempt_number', filter=attempts),
+            )
+            fields += ['attempts_count', 'last_attempt']
+        test = tests.values(*fields).first()
+        if test is None:
+            return Response({'detail': 'Test topilmadi'}, status=status.HTTP_404_NOT_FOUND)
+
+        is_expired = not test['is_active'] or bool(test['expires_at'] and timezone.now() > test['expires_at'])
+        data = {
+            'can_submit': True,
+            'existing_attempts_count': test.get('attempts_count', 0),
+            'last_attempt_number': test.get('last_attempt') or 0,
+            'submission_mode': test['submission_mode'],
+            'is_active': test['is_active'],
+            'is_expired': is_expired,
+        }
+        if not valid_id:
+            data['warning'] = 'Invalid Telegram ID format'
+            return Response(data)
+
+        # ID=0 va ismsiz so'rovda kimligini aniqlab bo'lmaydi
+        if test['submission_mode'] == 'single' and test['attempts_count'] and (str(telegram_id) != '0' or by_name):
+            data['can_submit'] = False
+            # Bir martalik testda topshirilgan holat o'zgarmaydi - qisqa muddat keshlanadi
+            cache.set(cache_key, data, timeout=settings.ATTEMPT_STATUS_CACHE_TTL)
+        return Response(data)
     
     @action(detail=True, methods=['post'])
     def finish(self, request, pk=None):
@@ -247,11 +364,13 @@ class TestViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def results(self, request, pk=None):
-        """Test natijalari (submissions)"""
-        test = self.get_object()
-        submissions = Submission.objects.filter(test=test).order_by('-score')
-        serializer = SubmissionSerializer(submissions, many=True)
-        return Response(serializer.data)
+        """Test natijalari (parametrlar - list_submissions)"""
+        from .etags import conditional_response, make_etag
+        version = Test.objects.filter(pk=pk).values_list('results_version', flat=True).first()
+        if version is None:
+            return Response({'detail': 'Test topilmadi'}, status=status.HTTP_404_NOT_FOUND)
+        etag = make_etag('results', pk, version, request.get_full_path())
+        return conditional_response(request, etag, lambda: list_submissions(request, Submission.objects.filter(test_id=pk)))
 
     @action(detail=True, methods=['post'])
     def send_report(self, request, pk=None):
@@ -292,22 +411,105 @@ class SubmissionViewSet(viewsets.ModelViewSet):
         return SubmissionSerializer
     
     def create(self, request):
-        """Javob yuborish"""
+        """
+        Javob yuborish. Yuklama yuqori bo'lsa (yoki test navbat rejimida) javoblar varaqasi
+        navbatga yoziladi va 202 + qabul raqami qaytariladi (ingest.py).
+        Idempotency-Key header bilan qayta yuborilgan so'rovga qayta baholamasdan asl javob qaytariladi.
+        """
+        from django.db import IntegrityError, transaction
+        from .ingest import should_queue, queue_submission
+
+        key = request.headers.get('Idempotency-Key')
+        if key is not None:
+            key = key.strip()
+            if not 0 < len(key) <= 64:
+                return Response({'error': "Idempotency-Key 1-64 belgidan iborat bo'lishi kerak"}, status=status.HTTP_400_BAD_REQUEST)
+            replay = self.replay_submission(request, key)
+            if replay is not None:
+                return replay
+
         serializer = CreateSubmissionSerializer(data=request.data)
-        if serializer.is_valid():
-            submission = serializer.save()
-            return Response(
-                SubmissionSerializer(submission).data,
-                status=status.HTTP_201_CREATED
-            )
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        test = serializer.answer_key[0]
+        try:
+            with transaction.atomic():
+                if should_queue(test):
+                    intake = queue_submission(test, serializer.validated_data, idempotency_key=key)
+                    return self.intake_accepted_response(intake)
+                submission = serializer.save(idempotency_key=key)
+        except IntegrityError:
+            # Xuddi shu kalit bilan parallel so'rov birinchi yozib ulgurgan
+            replay = self.replay_submission(request, key) if key else None
+            if replay is None:
+                raise
+            return replay
+        return Response(
+            SubmissionSerializer(submission).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    def intake_accepted_response(self, intake, replayed=False):
+        from django.urls import reverse
+        response = Response({
+            'receipt_id': str(intake.id),
+            'status': intake.status,
+            'status_url': reverse('submission-intake', args=[intake.id]),
+        }, status=status.HTTP_202_ACCEPTED)
+        if replayed:
+            response['Idempotent-Replayed'] = 'true'
+        return response
+
+    def replay_submission(self, request, key):
+        """Kalit bilan avval qabul qilingan so'rovning asl javobi yoki None"""
+        from .models import SubmissionIntake
+        original = SubmissionIntake.objects.filter(idempotency_key=key).first()
+        if original is None:
+            original = Submission.objects.select_related('test').filter(idempotency_key=key).first()
+        if original is None:
+            return None
+        # Kalit boshqa test yoki talabaning so'rovi uchun ishlatilgan bo'lsa javob oshkor qilinmaydi
+        if (str(original.test_id), str(original.student_telegram_id)) != (
+            str(request.data.get('test_id')), str(request.data.get('student_telegram_id'))
+        ):
+            return Response({'error': "Idempotency-Key boshqa so'rov uchun ishlatilgan"}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        if isinstance(original, SubmissionIntake):
+            return self.intake_accepted_response(original, replayed=True)
+        response = Response(SubmissionSerializer(original).data, status=status.HTTP_201_CREATED)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    @action(detail=False, methods=['get'], url_path='intake/(?P<receipt_id>[0-9a-fA-F-]{36})', url_name='intake')
+    def intake(self, request, receipt_id=None):
+        """Navbatga qabul qilingan javoblar holati: pending, processing, done (natija bilan) yoki rejected"""
+        from .models import SubmissionIntake
+        intake = get_object_or_404(SubmissionIntake.objects.select_related('submission__test'), id=receipt_id)
+        return Response({
+            'receipt_id': str(intake.id),
+            'status': intake.status,
+            'error': intake.error,
+            'submission': SubmissionSerializer(intake.submission).data if intake.submission else None,
+        })
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        from .stats import recompute_stats
+        recompute_stats(serializer.instance.test)
+
+    def perform_destroy(self, instance):
+        test = instance.test
+        super().perform_destroy(instance)
+        # Statistika va natijalar versiyasi (ETag) yangilanadi
+        from .stats import recompute_stats
+        recompute_stats(test)
     
     @action(detail=False, methods=['get'], url_path='test/(?P<test_id>[^/.]+)')
     def by_test(self, request, test_id=None):
-        """Test bo'yicha barcha javoblar"""
-        submissions = Submission.objects.filter(test_id=test_id).order_by('-score')
-        serializer = self.get_serializer(submissions, many=True)
-        return Response(serializer.data)
+        """Test bo'yicha barcha javoblar (parametrlar - list_submissions)"""
+        from .etags import conditional_response, make_etag
+        version = Test.objects.filter(pk=test_id).values_list('results_version', flat=True).first()
+        etag = make_etag('results', test_id, version, request.get_full_path())
+        return conditional_response(request, etag, lambda: list_submissions(request, Submission.objects.filter(test_id=test_id)))
     
     @action(detail=False, methods=['get'], url_path='test/(?P<test_id>[^/.]+)/report')
     def report_by_test(self, request, test_id=None): # Renamed to avoid confusion
@@ -408,3 +610,27 @@ class PublicStatsView(views.APIView):
             'total_tests': Test.objects.count(),
             'total_submissions': Submission.objects.count(),
         })
+
+
+class InternalTelegramSendView(views.APIView):
+    """
+    Yagona Telegram gateway: bot o'zi yubormaydigan xabarlarni shu yerga topshiradi.
+    Xabarlar outbox'ga yoziladi va umumiy limit hamda ustuvorlik bilan Celery orqali yuboriladi.
+    """
+    permission_classes = [IsInternalService]
+
+    def post(self, request):
+        from django.db import transaction
+        from .models import NotificationOutbox
+        from .outbox import schedule_drain
+
+        serializer = OutboxMessageSerializer(data=request.data.get('messages', []), many=True)
+        serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic():
+            created = NotificationOutbox.objects.bulk_create([
+                NotificationOutbox(**message) for message in serializer.validated_data
+            ])
+            transaction.on_commit(schedule_drain)
+
+        return Response({'queued': len(created)}, status=status.HTTP_202_ACCEPTED)
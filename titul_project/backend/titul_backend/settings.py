@@ -181,9 +181,10 @@ CORS_ALLOW_HEADERS = [
     "x-csrftoken",
     "x-requested-with",
     "x-telegram-id",  # Maxsus headerga ruxsat berish
+    "idempotency-key",  # Javob yuborishni qayta urinishda takrorlamaslik uchun
 ]
 
-CORS_EXPOSE_HEADERS = ["x-telegram-id"]
+CORS_EXPOSE_HEADERS = ["x-telegram-id", "idempotent-replayed"]
 
 
 # Celery settings
@@ -194,12 +195,96 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'tests.tasks.check_expired_tests_task',
         'schedule': 60.0,
     },
+    'sweep-notification-outbox-every-30-seconds': {
+        'task': 'tests.tasks.sweep_notification_outbox_task',
+        'schedule': 30.0,
+    },
+    'sweep-submission-intakes-every-30-seconds': {
+        'task': 'tests.tasks.sweep_submission_intakes_task',
+        'schedule': 30.0,
+    },
+    'resume-stalled-broadcasts-every-5-minutes': {
+        'task': 'tests.tasks.resume_stalled_broadcasts_task',
+        'schedule': 300.0,
+    },
 }
 
+# Cache (Redis) - Celery ishchilari va veb jarayonlar o'rtasida umumiy
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/2'),
+        'KEY_PREFIX': 'titul',
+    }
+}
+
+# Access code bo'yicha test manifesti keshi (soniya): umumiy kesh va jarayon ichidagi nusxa
+TEST_MANIFEST_CACHE_TTL = int(os.getenv('TEST_MANIFEST_CACHE_TTL', '300'))
+TEST_MANIFEST_LOCAL_TTL = int(os.getenv('TEST_MANIFEST_LOCAL_TTL', '5'))
+TEST_MANIFEST_LOCAL_SIZE = 1000
+# Javob yuborishda ishlatiladigan test kaliti (test + savollar) keshi (soniya)
+TEST_ANSWER_KEY_CACHE_TTL = int(os.getenv('TEST_ANSWER_KEY_CACHE_TTL', '300'))
+
+# Javoblarni navbat orqali qabul qilish (ingest.py): 'auto' rejimda test bo'yicha
+# SUBMISSION_ASYNC_WINDOW soniyada SUBMISSION_ASYNC_THRESHOLD dan ko'p so'rov kelsa navbatga o'tiladi
+SUBMISSION_ASYNC_THRESHOLD = int(os.getenv('SUBMISSION_ASYNC_THRESHOLD', '20'))
+SUBMISSION_ASYNC_WINDOW = int(os.getenv('SUBMISSION_ASYNC_WINDOW', '10'))
+SUBMISSION_INGEST_DELAY = int(os.getenv('SUBMISSION_INGEST_DELAY', '2'))  # partiya yig'ish uchun kutish (soniya)
+SUBMISSION_INGEST_BATCH_SIZE = int(os.getenv('SUBMISSION_INGEST_BATCH_SIZE', '500'))
+SUBMISSION_INGEST_CLAIM_TIMEOUT = 300
+# Xato bilan tugagan varaq shuncha urinishdan keyin rad etiladi
+SUBMISSION_INGEST_MAX_ATTEMPTS = int(os.getenv('SUBMISSION_INGEST_MAX_ATTEMPTS', '5'))
+# Qayta ishlangan (done/rejected) varaqlar shuncha kundan keyin o'chiriladi
+SUBMISSION_INTAKE_RETENTION_DAYS = int(os.getenv('SUBMISSION_INTAKE_RETENTION_DAYS', '7'))
+# Urinish raqami parallel so'rov bilan to'qnashganda qayta urinishlar soni (ingest.save_submission)
+SUBMISSION_ATTEMPT_RETRIES = int(os.getenv('SUBMISSION_ATTEMPT_RETRIES', '5'))
+
+# Bir martalik testda "allaqachon topshirgan" javobi keshi (soniya)
+ATTEMPT_STATUS_CACHE_TTL = int(os.getenv('ATTEMPT_STATUS_CACHE_TTL', '60'))
+
+# Bot profil keshini tozalash uchun hodisalar kanali (Redis pub/sub)
+USER_EVENTS_REDIS_URL = os.getenv('USER_EVENTS_REDIS_URL', os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/2'))
+USER_EVENTS_CHANNEL = os.getenv('USER_EVENTS_CHANNEL', 'titul:user-events')
+
 # Telegram Bot settings
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '')
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
+# Telegram ulanishlar pool'i hajmi (TELEGRAM_BROADCAST_WORKERS dan kam bo'lmasligi kerak)
+TELEGRAM_POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', '32'))
 TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL', '')
 
+# Broadcast: soniyasiga yuboriladigan xabarlar soni (Telegram limiti ~30) va parallel oqimlar
+TELEGRAM_BROADCAST_RATE = int(os.getenv('TELEGRAM_BROADCAST_RATE', '25'))
+TELEGRAM_BROADCAST_WORKERS = int(os.getenv('TELEGRAM_BROADCAST_WORKERS', '16'))
+
+# Backend jarayonlari (veb, Celery) uchun umumiy Telegram limiti (Redis orqali). Bot faqat gateway orqali
+# yuboradigan xabarlari bilan kiradi, suhbatdagi javoblari hisobga olinmaydi
+# Broadcastlar limitdan TELEGRAM_PRIORITY_RESERVE tasini tranzaksion xabarlar uchun qoldiradi
+TELEGRAM_SHARED_LIMITER = os.getenv('TELEGRAM_SHARED_LIMITER', 'True') == 'True'
+TELEGRAM_GLOBAL_RATE = int(os.getenv('TELEGRAM_GLOBAL_RATE', '28'))
+TELEGRAM_PRIORITY_RESERVE = int(os.getenv('TELEGRAM_PRIORITY_RESERVE', '6'))
+
+# Ichki xizmatlar (bot) uchun API tokeni - X-Internal-Token headerida yuboriladi
+INTERNAL_API_TOKEN = os.getenv('INTERNAL_API_TOKEN', '')
+
+# Broadcast progressi: keshga yozish oralig'i, bazaga yozish oralig'i (soniya), SSE oqimi davomiyligi
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv('BROADCAST_PROGRESS_INTERVAL', '0.25'))
+BROADCAST_DB_FLUSH_INTERVAL = float(os.getenv('BROADCAST_DB_FLUSH_INTERVAL', '5'))
+BROADCAST_PROGRESS_TTL = 60 * 60 * 24
+# SSE oqimi gunicorn sync ishchisini band qiladi - qisqa oyna, keyin brauzer qayta ulanadi
+BROADCAST_STREAM_TIMEOUT = int(os.getenv('BROADCAST_STREAM_TIMEOUT', '45'))
+BROADCAST_STREAM_RETRY_MS = 2000
+# Ishchi lock'i shu muddat ichida yangilanmasa broadcast to'xtab qolgan hisoblanadi
+BROADCAST_LOCK_TIMEOUT = int(os.getenv('BROADCAST_LOCK_TIMEOUT', '300'))
+# Har safar ishchisi to'xtab qolgan broadcast shuncha marta qayta boshlangach 'failed' deb belgilanadi
+BROADCAST_MAX_RESUMES = int(os.getenv('BROADCAST_MAX_RESUMES', '5'))
+
+# Bildirishnomalar outbox'i (tests/outbox.py)
+NOTIFICATION_BATCH_SIZE = int(os.getenv('NOTIFICATION_BATCH_SIZE', '100'))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', '5'))
+# 'sending' holatidagi xabar shu muddatdan keyin qayta navbatga qaytariladi
+NOTIFICATION_CLAIM_TIMEOUT = 300
+
 
 # Frontend URL
 FRONTEND_URL = os.getenv('NEXT_PUBLIC_SITE_URL', 'http://localhost:3000')
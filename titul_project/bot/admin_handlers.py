@@ -1,15 +1,17 @@
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
 from keyboards import admin_keyboard, main_keyboard, admin_user_actions_keyboard
-from api_client import APIClient
+from api_client import api
+import asyncio
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
 async def admin_panel_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Admin paneliga kirish"""
     user = update.effective_user
-    api_user = await APIClient.get_user(user.id)
+    api_user = await api.get_profile(user.id)
     
     if api_user and api_user.get('role') in ['admin', 'superadmin']:
         from api_client import FRONTEND_URL
@@ -34,7 +36,7 @@ async def admin_panel_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def admin_stats_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Tizim statistikasini ko'rish"""
     user = update.effective_user
-    stats = await APIClient.get_admin_stats(user.id)
+    stats = await api.get_admin_stats(user.id)
     
     if stats:
         # total_payments Decimal bo'lgani uchun string bo'lishi mumkin
@@ -63,6 +65,76 @@ async def admin_broadcast_handler(update: Update, context: ContextTypes.DEFAULT_
         parse_mode='HTML'
     )
 
+def format_broadcast_progress(data):
+    """Broadcast progress holatini matnga aylantirish"""
+    done = data.get('sent', 0) + data.get('failed', 0)
+    total = data.get('total', 0)
+    if data.get('status') == 'completed':
+        title = "✅ <b>Xabar yuborildi</b>"
+    elif data.get('status') == 'failed':
+        title = "❌ <b>Xabar yuborishda xatolik</b>"
+    else:
+        title = "⏳ <b>Xabar yuborilmoqda...</b>"
+
+    text = (
+        f"{title}\n\n"
+        f"👥 Jami: <b>{total}</b>\n"
+        f"📤 Jarayon: <b>{done}/{total}</b>\n"
+        f"✅ Yuborildi: <b>{data.get('sent', 0)}</b>\n"
+        f"❌ Xatolik: <b>{data.get('failed', 0)}</b>"
+    )
+    if data.get('status') == 'processing' and data.get('eta') is not None:
+        text += f"\n⏱ Taxminiy vaqt: <b>{int(data['eta'])} soniya</b>"
+    return text
+
+# Progress oqimiga ketma-ket shuncha marta ulanib bo'lmasa kuzatish to'xtatiladi
+BROADCAST_STREAM_MAX_FAILURES = 5
+
+async def track_broadcast_progress(status_message, admin_id, broadcast_id):
+    """
+    Bitta holat xabarini backend progress oqimi asosida tahrirlab borish.
+    Backend oqimni qisqa oynadan keyin yopadi - yakuniy holat kelguncha qayta ulanamiz.
+    Faqat ketma-ket muvaffaqiyatsiz ulanishlar hisoblanadi; ular tugasa holat bazadan olinadi.
+    """
+    last_text = None
+    last_edit_at = 0.0
+    failures = 0
+
+    async def show(data, is_final):
+        nonlocal last_text, last_edit_at
+        text = format_broadcast_progress(data)
+        now = time.monotonic()
+        # Telegram chekloviga tushmaslik uchun oraliq holat 2 soniyada bir marta yangilanadi
+        if text == last_text or (not is_final and now - last_edit_at < 2):
+            return
+        try:
+            await status_message.edit_text(text, parse_mode='HTML')
+            last_text = text
+            last_edit_at = now
+        except Exception as e:
+            logger.warning(f"Broadcast progress edit error: {e}")
+
+    while failures < BROADCAST_STREAM_MAX_FAILURES:
+        received = False
+        async for data in api.stream_broadcast_progress(admin_id, broadcast_id):
+            received = True
+            is_final = data.get('status') in ('completed', 'failed')
+            await show(data, is_final)
+            if is_final:
+                return
+        # Oqim oddiy yopilgan bo'lsa darhol, ulanib bo'lmagan bo'lsa kutib qayta ulanamiz
+        failures = 0 if received else failures + 1
+        await asyncio.sleep(2 if received else 5)
+
+    history = await api.get_broadcast_status(admin_id, broadcast_id)
+    if history:
+        await show({
+            'status': history['status'],
+            'total': history['total_users'],
+            'sent': history['success_count'],
+            'failed': history['fail_count'],
+        }, is_final=True)
+
 async def admin_user_search_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Foydalanuvchilarni izlashni boshlash"""
     context.user_data['admin_state'] = 'waiting_for_user_search'
@@ -83,22 +155,19 @@ async def handle_admin_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if state == 'waiting_for_broadcast_msg':
         context.user_data['admin_state'] = None
-        user_ids = await APIClient.get_all_user_ids(admin_id)
-        
-        count = 0
-        await update.message.reply_text(f"⏳ {len(user_ids)} ta foydalanuvchiga xabar yuborilmoqda...")
-        
-        for uid in user_ids:
-            try:
-                await context.bot.send_message(chat_id=uid, text=text, parse_mode='HTML')
-                count += 1
-            except Exception as e:
-                logger.error(f"Broadcast error for {uid}: {e}")
-        
-        await update.message.reply_text(f"✅ Xabar {count} ta foydalanuvchiga muvaffaqiyatli yuborildi.")
+        result = await api.create_broadcast(admin_id, text)
+        if not result or not result.get('broadcast_id'):
+            return await update.message.reply_text("❌ Xabarni navbatga qo'shishda xatolik.")
+
+        status_message = await update.message.reply_text("⏳ Xabar yuborish navbatga qo'shildi...")
+        # Progress fonda kuzatiladi - handler darhol bo'shaydi
+        context.application.create_task(
+            track_broadcast_progress(status_message, admin_id, result['broadcast_id']),
+            update=update
+        )
 
     elif state == 'waiting_for_user_search':
-        users = await APIClient.get_all_users(admin_id, search=text)
+        users = await api.get_all_users(admin_id, search=text)
         if not users:
             return await update.message.reply_text("❌ Foydalanuvchi topilmadi.")
         
@@ -120,12 +189,12 @@ async def handle_admin_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             amount = float(text.strip())
             # Joriy balance ni olish uchun user ni qayta yuklaymiz
-            user = await APIClient.get_user(target_id)
+            user = await api.get_user(target_id)
             current_balance = float(user.get('balance', 0))
             
             new_balance = current_balance + amount if action == "qo'shish" else current_balance - amount
             
-            result = await APIClient.update_user_balance(admin_id, target_id, new_balance)
+            result = await api.update_user_balance(admin_id, target_id, new_balance)
             if result:
                 context.user_data['admin_state'] = None
                 await update.message.reply_text(f"✅ Balans yangilandi. Yangi balans: {new_balance} so'm")
@@ -138,38 +207,20 @@ async def handle_admin_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         receipt_id = state.split("_")[-1]
         try:
             amount = float(text.strip())
-            import requests
-            from api_client import API_BASE_URL
-            response = requests.post(
-                f"{API_BASE_URL}/admin/receipts/{receipt_id}/verify/",
-                json={'action': 'accept', 'amount': amount, 'comment': 'Tasdiqlandi'},
-                headers={'X-Telegram-Id': str(admin_id)}
-            )
-            if response.status_code == 200:
-                res_data = response.json()
+            result = await api.verify_receipt(admin_id, receipt_id, 'accept', amount=amount, comment='Tasdiqlandi')
+            if 'error' not in result:
                 context.user_data['admin_state'] = None
-                await update.message.reply_text(f"✅ To'lov tasdiqlandi. Foydalanuvchi balansi {res_data['new_balance']} so'mga yetdi.")
-                
-                # Userga xabar yuborish
-                user_tid = res_data.get('user_telegram_id')
-                if user_tid:
-                    try:
-                        await context.bot.send_message(
-                            chat_id=user_tid,
-                            text=f"✅ <b>Tabriklaymiz!</b>\n\nSizning to'lovingiz tasdiqlandi.\nSumma: <b>{amount} so'm</b>\nYangi balans: <b>{res_data['new_balance']} so'm</b>",
-                            parse_mode='HTML'
-                        )
-                    except:
-                        pass
+                # Foydalanuvchiga xabarni backend (gateway) yuboradi
+                await update.message.reply_text(f"✅ To'lov tasdiqlandi. Foydalanuvchi balansi {result['new_balance']} so'mga yetdi.")
             else:
-                await update.message.reply_text(f"❌ Xatolik yuz berdi: {response.text}")
+                await update.message.reply_text(f"❌ Xatolik yuz berdi: {result['error']}")
         except ValueError:
             await update.message.reply_text("❌ Iltimos, faqat son kiriting!")
 
 async def admin_back_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Asosiy menyuga qaytish"""
     user = update.effective_user
-    api_user = await APIClient.get_user(user.id)
+    api_user = await api.get_profile(user.id)
     is_admin = api_user and api_user.get('role') in ['admin', 'superadmin']
     
     await update.message.reply_text(
@@ -196,7 +247,7 @@ async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
 
     elif data.startswith("adm_change_role_"):
         # Rolni o'zgartirish faqat Superadmin uchun
-        api_user = await APIClient.get_user(admin_id)
+        api_user = await api.get_profile(admin_id)
         if api_user.get('role') != 'superadmin':
             return await query.message.reply_text("❌ Faqat Superadmin rollarni o'zgartira oladi.")
             
@@ -214,7 +265,7 @@ async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
         role = parts[2]
         target_id = parts[3]
         
-        result = await APIClient.update_user_role(admin_id, target_id, role)
+        result = await api.update_user_role(admin_id, target_id, role)
         if result:
             await query.message.edit_text(f"✅ Foydalanuvchi roli '{role}' ga o'zgartirildi.")
         else:
@@ -230,25 +281,13 @@ async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
         else:
             # Reject immediately
             try:
-                # Backendga rad etishni yuborish
-                import requests
-                from api_client import API_BASE_URL
-                response = requests.post(
-                    f"{API_BASE_URL}/admin/receipts/{receipt_id}/verify/",
-                    json={'action': 'reject', 'comment': 'Chek rad etildi'},
-                    headers={'X-Telegram-Id': str(admin_id)}
-                )
-                if response.status_code == 200:
-                    # Userga xabar yuborish
-                    res_data = response.json()
-                    # Hozircha user ID ni backenddan olish kerak yoki original xabardan
-                    # Keling backend bizga user_telegram_id ni ham qaytarsin
-                    # Yoki biz buni admin_handlers da user_data da saqlasak?
-                    # Yaxshisi backend verificiationdan keyin user info qaytarsin.
+                # Backendga rad etishni yuborish (foydalanuvchiga xabarni backend yuboradi)
+                result = await api.verify_receipt(admin_id, receipt_id, 'reject', comment='Chek rad etildi')
+                if 'error' not in result:
                     await query.message.edit_reply_markup(reply_markup=None)
                     await query.message.reply_text("❌ Chek rad etildi.")
                 else:
-                    await query.message.reply_text("❌ Xatolik yuz berdi.")
+                    await query.message.reply_text(f"❌ Xatolik yuz berdi: {result['error']}")
             except Exception as e:
                 logger.error(f"Reject verify error: {e}")
                 await query.message.reply_text(f"❌ Xatolik: {e}")
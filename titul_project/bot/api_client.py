@@ -2,261 +2,416 @@
 Backend API bilan aloqa (Asinxron)
 """
 import os
+import json
 import httpx
 import logging
 from dotenv import load_dotenv
+from cache import TTLCache
 
 load_dotenv()
 
 API_BASE_URL = os.getenv('BACKEND_API_URL', 'http://localhost:8000/api/v1')
+INTERNAL_API_TOKEN = os.getenv('INTERNAL_API_TOKEN', '')
 FRONTEND_URL = os.getenv('NEXT_PUBLIC_SITE_URL', 'http://localhost:3000')
 
+# Backend bilan ulanishlar puli sozlamalari
+API_MAX_CONNECTIONS = int(os.getenv('API_MAX_CONNECTIONS', '100'))
+API_MAX_KEEPALIVE = int(os.getenv('API_MAX_KEEPALIVE', '20'))
+API_KEEPALIVE_EXPIRY = float(os.getenv('API_KEEPALIVE_EXPIRY', '30'))
+API_CONNECT_TIMEOUT = float(os.getenv('API_CONNECT_TIMEOUT', '3'))
+API_TIMEOUT = float(os.getenv('API_TIMEOUT', '10'))
+# HTTP/2 uchun `pip install httpx[http2]` kerak
+API_HTTP2 = os.getenv('API_HTTP2', 'false').lower() in ('1', 'true', 'yes')
+# Foydalanuvchi profili keshi (backend o'zgarishlarni user_events orqali xabar qiladi)
+PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', '60'))
+# ETag bilan saqlangan javoblar (sozlamalar, test manifesti, natijalar) - 304 bo'lsa shu nusxa ishlatiladi
+ETAG_CACHE_TTL = int(os.getenv('ETAG_CACHE_TTL', '3600'))
+ETAG_CACHE_SIZE = int(os.getenv('ETAG_CACHE_SIZE', '1000'))
+
 logger = logging.getLogger(__name__)
 
+
+def http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
 class APIClient:
-    """Backend API client (Async)"""
-    
-    @staticmethod
-    async def get_or_create_user(telegram_id, full_name):
+    """
+    Backend API client (Async).
+    Bitta uzoq yashovchi httpx.AsyncClient (keep-alive ulanishlar puli) barcha so'rovlar uchun ishlatiladi:
+    bot ishga tushganda start(), to'xtaganda close() chaqiriladi.
+    """
+
+    def __init__(self, base_url=API_BASE_URL):
+        self.base_url = base_url
+        self._client = None
+        self.profiles = TTLCache(ttl=PROFILE_CACHE_TTL)
+        self.etags = TTLCache(ttl=ETAG_CACHE_TTL, maxsize=ETAG_CACHE_SIZE)
+
+    def _create_client(self):
+        http2 = API_HTTP2 and http2_available()
+        if API_HTTP2 and not http2:
+            logger.warning("API_HTTP2 yoqilgan, lekin h2 paketi o'rnatilmagan - HTTP/1.1 ishlatiladi")
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=API_MAX_CONNECTIONS,
+                max_keepalive_connections=API_MAX_KEEPALIVE,
+                keepalive_expiry=API_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(API_TIMEOUT, connect=API_CONNECT_TIMEOUT),
+        )
+
+    @property
+    def client(self):
+        # start() chaqirilmagan bo'lsa (masalan, skriptlarda) birinchi so'rovda yaratiladi
+        if self._client is None or self._client.is_closed:
+            self._client = self._create_client()
+        return self._client
+
+    async def start(self, application=None):
+        """Application post_init: ulanishlar pulini yaratish"""
+        self.client
+        logger.info(f"Backend API client tayyor: {self.base_url}")
+
+    async def close(self, application=None):
+        """Application post_shutdown: ulanishlarni yopish"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_conditional(self, path):
+        """
+        GET so'rovi If-None-Match bilan: backend 304 qaytarsa keshdagi javob ishlatiladi.
+        200 bo'lmagan javoblarda None
+        """
+        cached = self.etags.get(path)
+        headers = {'If-None-Match': cached[0]} if cached else None
+        response = await self.client.get(path, headers=headers)
+        if response.status_code == 304 and cached:
+            return cached[1]
+        if response.status_code != 200:
+            return None
+        data = response.json()
+        etag = response.headers.get('ETag')
+        if etag:
+            self.etags.set(path, (etag, data))
+        return data
+
+    async def get_or_create_user(self, telegram_id, full_name):
         """Foydalanuvchi yaratish yoki olish"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{API_BASE_URL}/users/",
-                    json={
-                        'telegram_id': telegram_id,
-                        'full_name': full_name,
-                        'role': 'teacher'
-                    }
-                )
-                return response.json() if response.status_code in [200, 201] else None
+            self.invalidate_profile(telegram_id)
+            response = await self.client.post(
+                "/users/",
+                json={
+                    'telegram_id': telegram_id,
+                    'full_name': full_name,
+                    'role': 'teacher'
+                }
+            )
+            return response.json() if response.status_code in [200, 201] else None
         except Exception as e:
             logger.error(f"API Error (get_or_create_user): {e}")
             return None
     
-    @staticmethod
-    async def get_user(telegram_id):
+    async def get_user(self, telegram_id):
         """Foydalanuvchi ma'lumotlarini olish"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{API_BASE_URL}/users/{telegram_id}/")
-                return response.json() if response.status_code == 200 else None
+            response = await self.client.get(f"/users/{telegram_id}/")
+            return response.json() if response.status_code == 200 else None
         except Exception as e:
             logger.error(f"API Error (get_user): {e}")
             return None
     
-    @staticmethod
-    async def get_user_tests(telegram_id):
+    async def get_profile(self, telegram_id, use_cache=True):
+        """
+        Jamlangan profil (foydalanuvchi, balans, bepul testlar, oxirgi to'lovlar va testlar).
+        Menyu tugmalari uchun - qisqa muddat keshlanadi.
+        """
+        if use_cache:
+            cached = self.profiles.get(int(telegram_id))
+            if cached is not None:
+                return cached
+        try:
+            response = await self.client.get(f"/users/{telegram_id}/me/")
+            if response.status_code != 200:
+                return None
+            profile = response.json()
+            self.profiles.set(int(telegram_id), profile)
+            return profile
+        except Exception as e:
+            logger.error(f"API Error (get_profile): {e}")
+            return None
+
+    def invalidate_profile(self, telegram_id):
+        self.profiles.delete(int(telegram_id))
+
+    async def get_user_tests(self, telegram_id):
         """Foydalanuvchi testlarini olish"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{API_BASE_URL}/tests/user/{telegram_id}/")
-                return response.json() if response.status_code == 200 else []
+            response = await self.client.get(f"/tests/user/{telegram_id}/")
+            return response.json() if response.status_code == 200 else []
         except Exception as e:
             logger.error(f"API Error (get_user_tests): {e}")
             return []
     
-    @staticmethod
-    async def get_test_by_code(access_code):
+    async def get_test_by_code(self, access_code):
         """Access code orqali test olish"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{API_BASE_URL}/tests/code/{access_code}/")
-                return response.json() if response.status_code == 200 else None
+            return await self.get_conditional(f"/tests/code/{access_code}/")
         except Exception as e:
             logger.error(f"API Error (get_test_by_code): {e}")
             return None
     
-    @staticmethod
-    async def finish_test(test_id):
+    async def finish_test(self, test_id):
         """Testni yakunlash"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(f"{API_BASE_URL}/tests/{test_id}/finish/")
-                return response.status_code == 200
+            response = await self.client.post(f"/tests/{test_id}/finish/")
+            return response.status_code == 200
         except Exception as e:
             logger.error(f"API Error (finish_test): {e}")
             return False
     
-    @staticmethod
-    async def get_test_submissions(test_id):
+    async def get_test_submissions(self, test_id):
         """Test javoblarini olish"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{API_BASE_URL}/submissions/test/{test_id}/")
-                return response.json() if response.status_code == 200 else []
+            data = await self.get_conditional(f"/submissions/test/{test_id}/")
+            return data if data is not None else []
         except Exception as e:
             logger.error(f"API Error (get_test_submissions): {e}")
             return []
     
-    @staticmethod
-    async def download_test_report(test_id):
+    async def download_test_report(self, test_id):
         """PDF hisobot yuklab olish"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{API_BASE_URL}/submissions/test/{test_id}/report/"
-                )
-                return response.content if response.status_code == 200 else None
+            # PDF yaratish oddiy so'rovlardan uzoqroq davom etishi mumkin
+            response = await self.client.get(
+                f"/submissions/test/{test_id}/report/",
+                timeout=httpx.Timeout(60.0, connect=API_CONNECT_TIMEOUT)
+            )
+            return response.content if response.status_code == 200 else None
         except Exception as e:
             logger.error(f"API Error (download_test_report): {e}")
             return None
     
-    @staticmethod
-    async def get_user_payments(telegram_id):
+    async def get_user_payments(self, telegram_id):
         """Foydalanuvchi to'lovlarini olish"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{API_BASE_URL}/payments/user/{telegram_id}/")
-                return response.json() if response.status_code == 200 else []
+            response = await self.client.get(f"/payments/user/{telegram_id}/")
+            return response.json() if response.status_code == 200 else []
         except Exception as e:
             logger.error(f"API Error (get_user_payments): {e}")
             return []
     
-    @staticmethod
-    async def create_payment(telegram_id, amount, payment_method):
+    async def create_payment(self, telegram_id, amount, payment_method):
         """To'lov yaratish"""
         try:
-            async with httpx.AsyncClient() as client:
-                # Avval user olish
-                user = await APIClient.get_user(telegram_id)
-                if not user:
-                    return None
+            # Avval user olish
+            user = await self.get_user(telegram_id)
+            if not user:
+                return None
                 
-                response = await client.post(
-                    f"{API_BASE_URL}/payments/",
-                    json={
-                        'user': user['id'],
-                        'amount': amount,
-                        'payment_method': payment_method
-                    }
-                )
-                return response.json() if response.status_code == 201 else None
+            response = await self.client.post(
+                "/payments/",
+                json={
+                    'user': user['id'],
+                    'amount': amount,
+                    'payment_method': payment_method
+                }
+            )
+            self.invalidate_profile(telegram_id)
+            return response.json() if response.status_code == 201 else None
         except Exception as e:
             logger.error(f"API Error (create_payment): {e}")
             return None
 
-    @staticmethod
-    async def get_admin_stats(telegram_id):
+    async def get_admin_stats(self, telegram_id):
         """Admin statistikasini olish"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{API_BASE_URL}/admin/stats/",
-                    headers={'X-Telegram-Id': str(telegram_id)}
-                )
-                return response.json() if response.status_code == 200 else None
+            response = await self.client.get(
+                "/admin/stats/",
+                headers={'X-Telegram-Id': str(telegram_id)}
+            )
+            return response.json() if response.status_code == 200 else None
         except Exception as e:
             logger.error(f"API Error (get_admin_stats): {e}")
             return None
 
-    @staticmethod
-    async def get_all_users(admin_telegram_id, search=None):
+    async def get_all_users(self, admin_telegram_id, search=None):
         """Barcha foydalanuvchilarni olish (Admin uchun)"""
         try:
             params = {'search': search} if search else {}
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{API_BASE_URL}/admin/users/",
-                    params=params,
-                    headers={'X-Telegram-Id': str(admin_telegram_id)}
-                )
-                if response.status_code == 200:
-                    data = response.json()
-                    return data.get('results', data) if isinstance(data, dict) else data
-                return []
+            response = await self.client.get(
+                "/admin/users/",
+                params=params,
+                headers={'X-Telegram-Id': str(admin_telegram_id)}
+            )
+            if response.status_code == 200:
+                data = response.json()
+                return data.get('results', data) if isinstance(data, dict) else data
+            return []
         except Exception as e:
             logger.error(f"API Error (get_all_users): {e}")
             return []
 
-    @staticmethod
-    async def update_user_role(admin_telegram_id, target_telegram_id, role):
+    async def update_user_role(self, admin_telegram_id, target_telegram_id, role):
         """Foydalanuvchi rolini o'zgartirish"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.patch(
-                    f"{API_BASE_URL}/admin/users/{target_telegram_id}/",
-                    json={'role': role},
-                    headers={'X-Telegram-Id': str(admin_telegram_id)}
-                )
-                return response.json() if response.status_code == 200 else None
+            response = await self.client.patch(
+                f"/admin/users/{target_telegram_id}/",
+                json={'role': role},
+                headers={'X-Telegram-Id': str(admin_telegram_id)}
+            )
+            self.invalidate_profile(target_telegram_id)
+            return response.json() if response.status_code == 200 else None
         except Exception as e:
             logger.error(f"API Error (update_user_role): {e}")
             return None
 
-    @staticmethod
-    async def get_all_user_ids(admin_telegram_id):
-        """Barcha foydalanuvchilar ID larini olish (Broadcast uchun)"""
+    async def create_broadcast(self, admin_telegram_id, message, target_roles=None):
+        """Broadcast yaratish - yuborish backend (Celery) tomonidan amalga oshiriladi"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{API_BASE_URL}/admin/users/",
-                    headers={'X-Telegram-Id': str(admin_telegram_id)}
-                )
-                if response.status_code == 200:
-                    data = response.json()
-                    results = data.get('results', data)
-                    return [u['telegram_id'] for u in results]
-                return []
+            response = await self.client.post(
+                "/admin/broadcast/",
+                json={'message': message, 'target_roles': target_roles or ['all']},
+                headers={'X-Telegram-Id': str(admin_telegram_id)}
+            )
+            return response.json() if response.status_code == 200 else None
         except Exception as e:
-            logger.error(f"API Error (get_all_user_ids): {e}")
-            return []
+            logger.error(f"API Error (create_broadcast): {e}")
+            return None
+
+    async def stream_broadcast_progress(self, admin_telegram_id, broadcast_id, operation='send'):
+        """Broadcast progressini real vaqtda olish (Server-Sent Events oqimi)"""
+        url = f"/admin/broadcast/{broadcast_id}/stream/"
+        params = {'telegram_id': admin_telegram_id, 'operation': operation}
+        timeout = httpx.Timeout(10.0, read=60.0)
+        try:
+            async with self.client.stream('GET', url, params=params, timeout=timeout) as response:
+                if response.status_code != 200:
+                    return
+                async for line in response.aiter_lines():
+                    if not line.startswith('data: '):
+                        continue
+                    data = json.loads(line[len('data: '):])
+                    yield data
+                    if data.get('status') in ('completed', 'failed'):
+                        return
+        except Exception as e:
+            logger.error(f"API Error (stream_broadcast_progress): {e}")
 
-    @staticmethod
-    async def update_user_balance(admin_telegram_id, target_telegram_id, amount):
+    async def get_broadcast_status(self, admin_telegram_id, broadcast_id):
+        """Broadcastning bazadagi holati (progress oqimi ishlamaganda)"""
+        try:
+            response = await self.client.get(
+                f"/admin/broadcast/{broadcast_id}/status/",
+                headers={'X-Telegram-Id': str(admin_telegram_id)}
+            )
+            return response.json() if response.status_code == 200 else None
+        except Exception as e:
+            logger.error(f"API Error (get_broadcast_status): {e}")
+            return None
+
+    async def update_user_balance(self, admin_telegram_id, target_telegram_id, amount):
         """Foydalanuvchi balansini o'zgartirish"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.patch(
-                    f"{API_BASE_URL}/admin/users/{target_telegram_id}/",
-                    json={'balance': amount},
-                    headers={'X-Telegram-Id': str(admin_telegram_id)}
-                )
-                return response.json() if response.status_code == 200 else None
+            response = await self.client.patch(
+                f"/admin/users/{target_telegram_id}/",
+                json={'balance': amount},
+                headers={'X-Telegram-Id': str(admin_telegram_id)}
+            )
+            self.invalidate_profile(target_telegram_id)
+            return response.json() if response.status_code == 200 else None
         except Exception as e:
             logger.error(f"API Error (update_user_balance): {e}")
             return None
 
-    @staticmethod
-    async def get_system_settings():
+    async def get_system_settings(self):
         """Tizim sozlamalarini olish (Karta raqami va narx)"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{API_BASE_URL}/admin/settings/")
-                return response.json() if response.status_code == 200 else None
+            return await self.get_conditional("/admin/settings/")
         except Exception as e:
             logger.error(f"API Error (get_system_settings): {e}")
             return None
 
-    @staticmethod
-    async def upload_payment_receipt(telegram_id, image_bytes):
+    async def upload_payment_receipt(self, telegram_id, image_bytes):
         """To'lov chekini yuklash"""
         try:
             files = {'receipt_image': ('receipt.jpg', image_bytes, 'image/jpeg')}
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{API_BASE_URL}/admin/receipts/upload/",
-                    data={'user_telegram_id': telegram_id},
-                    files=files
-                )
-                return response.json() if response.status_code == 201 else None
+            response = await self.client.post(
+                "/admin/receipts/upload/",
+                data={'user_telegram_id': telegram_id},
+                files=files
+            )
+            return response.json() if response.status_code == 201 else None
         except Exception as e:
             logger.error(f"API Error (upload_payment_receipt): {e}")
             return None
 
-    @staticmethod
-    async def get_admins():
+    async def verify_receipt(self, admin_telegram_id, receipt_id, action, amount=None, comment=''):
+        """
+        To'lov chekini tasdiqlash ('accept', summa bilan) yoki rad etish ('reject').
+        Xatolikda {'error': ...} qaytaradi.
+        """
+        payload = {'action': action, 'comment': comment}
+        if amount is not None:
+            payload['amount'] = amount
+        try:
+            response = await self.client.post(
+                f"/admin/receipts/{receipt_id}/verify/",
+                json=payload,
+                headers={'X-Telegram-Id': str(admin_telegram_id)},
+                timeout=httpx.Timeout(15.0, connect=API_CONNECT_TIMEOUT)
+            )
+            if response.status_code == 200:
+                return response.json()
+            try:
+                error = response.json().get('error')
+            except ValueError:
+                error = None
+            return {'error': error or f"HTTP {response.status_code}"}
+        except Exception as e:
+            logger.error(f"API Error (verify_receipt): {e}")
+            return {'error': str(e) or type(e).__name__}
+
+    async def submit_telegram_messages(self, messages):
+        """
+        Xabarlarni backend Telegram gateway'iga topshirish (umumiy limit va ustuvorlik bilan yuboriladi).
+        Hozircha faqat adminlarga chek xabarlari uchun; suhbatdagi javoblarni bot o'zi yuboradi.
+        messages: [{'chat_id', 'text', 'method', 'extra', 'priority', 'kind'}, ...]
+        """
+        try:
+            response = await self.client.post(
+                "/internal/telegram/send/",
+                json={'messages': messages},
+                headers={'X-Internal-Token': INTERNAL_API_TOKEN}
+            )
+            return response.status_code == 202
+        except Exception as e:
+            logger.error(f"API Error (submit_telegram_messages): {e}")
+            return False
+
+    async def get_admins(self):
         """Barcha adminlarni olish (Bildirishnoma yuborish uchun)"""
         try:
             superadmin_id = os.getenv('SUPERADMIN_ID')
             headers = {'X-Telegram-Id': str(superadmin_id)} if superadmin_id else {}
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{API_BASE_URL}/admin/users/", headers=headers)
-                if response.status_code == 200:
-                    users = response.json()
-                    if isinstance(users, dict): users = users.get('results', [])
-                    return [u for u in users if u['role'] in ['admin', 'superadmin']]
-                return []
+            response = await self.client.get("/admin/users/", headers=headers)
+            if response.status_code == 200:
+                users = response.json()
+                if isinstance(users, dict): users = users.get('results', [])
+                return [u for u in users if u['role'] in ['admin', 'superadmin']]
+            return []
         except Exception as e:
             logger.error(f"API Error (get_admins): {e}")
             return []
+
+
+# Bot bo'ylab yagona client (bot.py da post_init/post_shutdown ga ulanadi)
+api = APIClient()
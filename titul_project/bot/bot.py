@@ -2,7 +2,9 @@
 Telegram Bot - Asosiy fayl
 """
 import os
+import asyncio
 import logging
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 from telegram import Update
 from telegram.ext import (
@@ -25,6 +27,9 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Import handlers
+from api_client import api
+import user_events
+from update_processor import PerUserUpdateProcessor
 from handlers import (
     start_handler,
     create_test_handler,
@@ -48,6 +53,54 @@ from admin_handlers import (
 )
 
 
+# Ishga tushirish rejimi: production uchun 'webhook', lokal ishlash uchun 'polling'
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET', '')
+# Bir vaqtda qayta ishlanadigan updatelar soni (1 - ketma-ket)
+CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', '64'))
+
+# Dev rejim: event loopni bloklayotgan (sekin) callbacklar logga yoziladi
+BOT_DEBUG = os.getenv('BOT_DEBUG', 'false').lower() in ('1', 'true', 'yes')
+SLOW_CALLBACK_DURATION = float(os.getenv('SLOW_CALLBACK_DURATION', '0.1'))
+
+
+async def post_init(application):
+    """Application ishga tushgandan keyin (event loop ichida)"""
+    await api.start(application)
+    user_events.start()
+    if BOT_DEBUG:
+        # Handler ichidagi bloklovchi I/O (sinxron requests, time.sleep, ...) shu yerda ko'rinadi:
+        # "Executing <Task ...> took 0.512 seconds"
+        loop = asyncio.get_running_loop()
+        loop.set_debug(True)
+        loop.slow_callback_duration = SLOW_CALLBACK_DURATION
+        logging.getLogger('asyncio').setLevel(logging.WARNING)
+        logger.info(f"Event loop debug yoqildi (slow_callback_duration={SLOW_CALLBACK_DURATION}s)")
+
+
+async def post_shutdown(application):
+    await user_events.stop()
+    await api.close(application)
+
+
+def use_webhook():
+    """Webhook rejimi sozlanganmi - aks holda polling ishlatiladi"""
+    if BOT_MODE != 'webhook':
+        return False
+    if not WEBHOOK_URL:
+        logger.warning("BOT_MODE=webhook, lekin TELEGRAM_WEBHOOK_URL berilmagan - polling ishlatiladi")
+        return False
+    try:
+        import tornado  # noqa: F401 - python-telegram-bot[webhooks]
+    except ImportError:
+        logger.warning("Webhook uchun python-telegram-bot[webhooks] o'rnatilmagan - polling ishlatiladi")
+        return False
+    return True
+
+
 def main():
     """Bot ishga tushirish"""
     # Bot token
@@ -57,7 +110,23 @@ def main():
         return
     
     # Application yaratish
-    application = Application.builder().token(token).build()
+    builder = Application.builder().token(token)
+
+    # Lokal/soxta Bot API serveri (masalan, fake_telegram) bilan ishlash uchun
+    api_url = os.getenv('TELEGRAM_API_URL')
+    if api_url:
+        api_url = api_url.rstrip('/')
+        builder = builder.base_url(f"{api_url}/bot").base_file_url(f"{api_url}/file/bot")
+        logger.info(f"Telegram API URL: {api_url}")
+
+    # Backend bilan umumiy ulanishlar puli bot ishga tushganda ochiladi va to'xtaganda yopiladi
+    builder = builder.post_init(post_init).post_shutdown(post_shutdown)
+
+    # Turli foydalanuvchilar updatelari parallel, bitta foydalanuvchiniki ketma-ket
+    if CONCURRENT_UPDATES > 1:
+        builder = builder.concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+
+    application = builder.build()
     
     # Handlers ro'yxatdan o'tkazish
     application.add_handler(CommandHandler("start", start_handler))
@@ -92,8 +161,19 @@ def main():
     application.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), text_handler))
     
     # Bot ishga tushirish
-    logger.info("Bot ishga tushmoqda...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if use_webhook():
+        logger.info(f"Bot webhook rejimida ishga tushmoqda: {WEBHOOK_URL}")
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=urlparse(WEBHOOK_URL).path.lstrip('/'),
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    else:
+        logger.info("Bot polling rejimida ishga tushmoqda...")
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,53 @@
+"""
+Bot jarayoni ichidagi oddiy TTL kesh (tez-tez so'raladigan backend/Telegram javoblari uchun)
+"""
+import time
+
+
+class TTLCache:
+    """Har bir yozuv o'z muddati bilan saqlanadi. maxsize oshsa eng eski yozuvlar o'chiriladi"""
+
+    def __init__(self, ttl, maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        value, expires_at = item
+        if expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            return default
+        return value
+
+    def set(self, key, value, ttl=None):
+        if key not in self._data and len(self._data) >= self.maxsize:
+            self._evict()
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+    def _evict(self):
+        now = time.monotonic()
+        expired = [key for key, (_, expires_at) in self._data.items() if expires_at <= now]
+        for key in expired:
+            del self._data[key]
+        # Muddati o'tganlar yetmasa - eng birinchi qo'shilganlarning o'ndan biri
+        if len(self._data) >= self.maxsize:
+            for key in list(self._data)[:max(self.maxsize // 10, 1)]:
+                del self._data[key]
+
+
+_MISSING = object()
@@ -2,10 +2,12 @@
 Telegram Bot Handlers
 """
 import os
+import asyncio
 from telegram import Update
 from telegram.ext import ContextTypes
 from keyboards import main_keyboard, web_app_keyboard, payment_keyboard, test_actions_keyboard
-from api_client import APIClient
+from api_client import api
+from cache import TTLCache
 from dotenv import load_dotenv
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ChatMemberStatus
@@ -22,12 +24,30 @@ load_dotenv()
 FRONTEND_URL = os.getenv('NEXT_PUBLIC_SITE_URL', 'http://192.168.1.122:3000')
 CHANNEL_ID = os.getenv('CHANNEL_ID', '@titul_test_bot')
 
+# Obuna tekshiruvi keshi: obuna bo'lganlar uzoqroq, bo'lmaganlar juda qisqa saqlanadi
+# (obuna bo'lgan zahoti tugmani bosganda qayta tekshiriladi)
+SUBSCRIPTION_TTL = int(os.getenv('SUBSCRIPTION_CACHE_TTL', '300'))
+SUBSCRIPTION_NEGATIVE_TTL = int(os.getenv('SUBSCRIPTION_NEGATIVE_TTL', '10'))
+CHANNELS_TTL = int(os.getenv('CHANNELS_CACHE_TTL', '300'))
+
+subscription_cache = TTLCache(ttl=SUBSCRIPTION_TTL)
+channels_cache = TTLCache(ttl=CHANNELS_TTL, maxsize=1)
+
+SUBSCRIBED_STATUSES = (ChatMemberStatus.MEMBER, ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER)
+
+
 async def get_dynamic_channels():
-    """Tizim sozlamalaridan barcha majburiy kanallarni olish"""
+    """Tizim sozlamalaridan barcha majburiy kanallarni olish (keshlangan)"""
+    cached = channels_cache.get('channels')
+    if cached is not None:
+        return cached
+
     channels = []
+    loaded = False
     try:
-        settings = await APIClient.get_system_settings()
+        settings = await api.get_system_settings()
         if settings:
+            loaded = True
             # Faqat manage qilinayotgan ro'yxatni ishlatamiz
             mandatory_list = settings.get('mandatory_channels', [])
             if mandatory_list:
@@ -51,29 +71,36 @@ async def get_dynamic_channels():
             "username": CHANNEL_ID, 
             "link": f"https://t.me/{CHANNEL_ID.lstrip('@')}"
         })
-    
+
+    # Backend javob bermagan bo'lsa default ro'yxat qisqa muddat saqlanadi
+    channels_cache.set('channels', channels, ttl=None if loaded else SUBSCRIPTION_NEGATIVE_TTL)
     return channels
 
-async def is_user_subscribed(context, user_id: int) -> bool:
+async def check_channel(context, channel, user_id: int) -> bool:
+    try:
+        member = await context.bot.get_chat_member(chat_id=channel['username'], user_id=user_id)
+        return member.status in SUBSCRIBED_STATUSES
+    except Exception as e:
+        # Bot kanal admini bo'lmasa yoki kanal topilmasa - obuna tekshiruvi muhim, shuning uchun False
+        logger.error(f"Error checking sub for {channel['username']}: {e}")
+        return False
+
+async def is_user_subscribed(context, user_id: int, use_cache: bool = True) -> bool:
+    if use_cache:
+        cached = subscription_cache.get(user_id)
+        if cached is not None:
+            return cached
     try:
         channels = await get_dynamic_channels()
-        for ch in channels:
-            try:
-                member = await context.bot.get_chat_member(
-                    chat_id=ch['username'],
-                    user_id=user_id
-                )
-                if member.status not in [ChatMemberStatus.MEMBER, ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER]:
-                    return False
-            except Exception as e:
-                logger.error(f"Error checking sub for {ch['username']}: {e}")
-                # Agar bot kanal admini bo'lmasa yoki kanal topilmasa, bu kanalni o'tkazib yuboramiz (yoki False qaytaramiz)
-                # Keling, xatolik bo'lsa False qaytaramiz, chunki obuna tekshiruvi muhim
-                return False
-        return True
+        # Barcha kanallar parallel tekshiriladi
+        results = await asyncio.gather(*(check_channel(context, ch, user_id) for ch in channels))
+        subscribed = all(results)
     except Exception as e:
         logger.error(f"Subscription check error for {user_id}: {e}")
-        return False
+        subscribed = False
+
+    subscription_cache.set(user_id, subscribed, ttl=None if subscribed else SUBSCRIPTION_NEGATIVE_TTL)
+    return subscribed
 
 def subscription_required(func):
     """
@@ -113,7 +140,9 @@ async def check_subscription_callback(update: Update, context: ContextTypes.DEFA
     await query.answer()
 
     user = query.from_user
-    subscribed = await is_user_subscribed(context, user.id)
+    # Foydalanuvchi hozirgina obuna bo'lgan bo'lishi mumkin - keshdagi natija hisobga olinmaydi
+    subscription_cache.delete(user.id)
+    subscribed = await is_user_subscribed(context, user.id, use_cache=False)
 
     if not subscribed:
         channels = await get_dynamic_channels()
@@ -124,7 +153,7 @@ async def check_subscription_callback(update: Update, context: ContextTypes.DEFA
         return
 
     full_name = user.full_name or f"User {user.id}"
-    await APIClient.get_or_create_user(user.id, full_name)
+    await api.get_or_create_user(user.id, full_name)
 
     await query.message.reply_text(
         f"✅ Rahmat, {full_name}!\n\nBotdan foydalanishingiz mumkin 👇 \n\n"
@@ -145,7 +174,7 @@ async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Obuna tekshirish (Endi dekorator orqali amalga oshiriladi)
     
     # Foydalanuvchini yaratish yoki olish
-    api_user = await APIClient.get_or_create_user(telegram_id, full_name)
+    api_user = await api.get_or_create_user(telegram_id, full_name)
     is_admin = api_user and api_user.get('role') in ['admin', 'superadmin']
     
     welcome_message = f"""
@@ -178,7 +207,7 @@ async def create_test_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
     full_name = user.full_name or ""
     
     # Foydalanuvchi ma'lumotlarini olish
-    api_user = await APIClient.get_user(telegram_id)
+    api_user = await api.get_profile(telegram_id)
     remaining_free = api_user.get('remaining_free_tests', 0) if api_user else 0
     
     # Web app URL
@@ -234,10 +263,12 @@ async def my_tests_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     telegram_id = user.id
     
-    # Foydalanuvchi testlarini olish
-    tests = await APIClient.get_user_tests(telegram_id)
+    # Testlar soni profil tarkibida keladi
+    profile = await api.get_profile(telegram_id)
+    tests_count = profile.get('tests_count', 0) if profile else 0
+    active_count = profile.get('active_tests_count', 0) if profile else 0
     
-    if not tests:
+    if not tests_count:
         await update.message.reply_text(
             "❌ Sizda hozircha testlar yo'q.\n\n"
             "Test yaratish uchun '🧪 Test yaratish' tugmasini bosing."
@@ -250,9 +281,9 @@ async def my_tests_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = f"""
 📊 <b>Mening testlarim</b>
 
-Jami testlar: <b>{len(tests)}</b>
-Faol: <b>{sum(1 for t in tests if t.get('is_active'))}</b>
-Yakunlangan: <b>{sum(1 for t in tests if not t.get('is_active'))}</b>
+Jami testlar: <b>{tests_count}</b>
+Faol: <b>{active_count}</b>
+Yakunlangan: <b>{tests_count - active_count}</b>
 
 Batafsil ko'rish uchun quyidagi tugmani bosing 👇
 """
@@ -273,7 +304,7 @@ async def profile_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = user.id
     
     # Foydalanuvchi ma'lumotlarini olish
-    api_user = await APIClient.get_user(telegram_id)
+    api_user = await api.get_profile(telegram_id)
     
     if not api_user:
         await update.message.reply_text("❌ Ma'lumotlar topilmadi.")
@@ -300,9 +331,8 @@ async def balance_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     telegram_id = user.id
     
-    # Foydalanuvchi va to'lovlar ma'lumotlarini olish
-    api_user = await APIClient.get_user(telegram_id)
-    payments = await APIClient.get_user_payments(telegram_id)
+    # Foydalanuvchi va to'lovlar ma'lumotlari bitta profil so'rovida
+    api_user = await api.get_profile(telegram_id)
     
     if not api_user:
         await update.message.reply_text("❌ Ma'lumotlar topilmadi.")
@@ -312,16 +342,16 @@ async def balance_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     free_tests_used = api_user.get('free_tests_used', 0)
     remaining_free = api_user.get('remaining_free_tests', 0)
     
-    # 'completed' (online) va 'accepted' (manual) to'lovlarni filtrlaymiz
-    # Backend endi bularni yagona listda qaytarmoqda
-    completed_payments = [p for p in payments if p.get('status') in ['completed', 'accepted']]
-    total_paid = sum(float(p.get('amount', 0)) for p in completed_payments)
+    # Faqat yakunlangan: 'completed' (online) va 'accepted' (chek orqali) to'lovlar
+    completed_payments = api_user.get('recent_payments', [])
+    payments_count = api_user.get('payments_count', 0)
+    total_paid = float(api_user.get('total_paid') or 0)
     
     message = f"""
 💰 <b>Mening hisobim</b>
 
 💵 Joriy balans: <b>{float(balance):,.0f} so'm</b>
-📊 Jami to'lovlar: <b>{len(completed_payments)} ta</b>
+📊 Jami to'lovlar: <b>{payments_count} ta</b>
 💳 Jami to'langan: <b>{total_paid:,.0f} so'm</b>
 
 🎁 <b>Siz uchun imkoniyatlar:</b>
@@ -358,7 +388,7 @@ async def payment_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     To'lov qilish handler (Manual Receipt)
     """
-    settings = await APIClient.get_system_settings()
+    settings = await api.get_system_settings()
     if not settings:
         return await update.message.reply_text("❌ Tizim sozlamalari topilmadi. Keyinroq urinib ko'ring.")
     
@@ -397,7 +427,7 @@ async def handle_receipt_photo(update: Update, context: ContextTypes.DEFAULT_TYP
     image_bytes = await file.download_as_bytearray()
     
     # Backendga yuklash
-    result = await APIClient.upload_payment_receipt(user.id, bytes(image_bytes))
+    result = await api.upload_payment_receipt(user.id, bytes(image_bytes))
     
     if result and result.get('success'):
         context.user_data['waiting_for_receipt'] = False
@@ -409,8 +439,7 @@ async def handle_receipt_photo(update: Update, context: ContextTypes.DEFAULT_TYP
         )
 
         # Adminlarni xabardor qilish
-        from keyboards import receipt_verify_keyboard
-        admins = await APIClient.get_admins()
+        admins = await api.get_admins()
         admin_msg = f"""
 🆕 <b>Yangi to'lov cheki!</b>
 
@@ -419,21 +448,37 @@ async def handle_receipt_photo(update: Update, context: ContextTypes.DEFAULT_TYP
 
 Iltimos, chekni tekshiring va tasdiqlang.
 """
-        for admin in admins:
-            try:
-                await context.bot.send_photo(
-                    chat_id=admin['telegram_id'],
-                    photo=photo.file_id,
-                    caption=admin_msg,
-                    reply_markup=receipt_verify_keyboard(receipt_id),
-                    parse_mode='HTML'
-                )
-            except Exception as e:
-                logger.error(f"Admin notification error: {e}")
+        await notify_admins_about_receipt(context, admins, 'sendPhoto', admin_msg, photo.file_id, receipt_id)
     else:
         await update.message.reply_text("❌ Chekni yuklashda xatolik yuz berdi. Qaytadan urinib ko'ring.")
 
 
+async def notify_admins_about_receipt(context, admins, method, caption, file_id, receipt_id):
+    """
+    Adminlarga yangi chek haqida xabar. Xabarlar umumiy Telegram gateway (backend) orqali
+    yuboriladi; gateway ishlamasa bot o'zi yuboradi.
+    """
+    from keyboards import receipt_verify_keyboard
+    reply_markup = receipt_verify_keyboard(receipt_id)
+    media_field = 'photo' if method == 'sendPhoto' else 'document'
+    queued = await api.submit_telegram_messages([{
+        'chat_id': admin['telegram_id'],
+        'method': method,
+        'text': caption,
+        'extra': {media_field: file_id, 'reply_markup': reply_markup.to_dict()},
+        'kind': 'receipt',
+    } for admin in admins])
+    if queued:
+        return
+
+    send = context.bot.send_photo if method == 'sendPhoto' else context.bot.send_document
+    for admin in admins:
+        try:
+            await send(admin['telegram_id'], file_id, caption=caption, reply_markup=reply_markup, parse_mode='HTML')
+        except Exception as e:
+            logger.error(f"Admin notification error: {e}")
+
+
 async def handle_receipt_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Foydalanuvchi yuborgan chek faylini qabul qilish"""
     if not context.user_data.get('waiting_for_receipt'):
@@ -451,7 +496,7 @@ async def handle_receipt_document(update: Update, context: ContextTypes.DEFAULT_
     image_bytes = await file.download_as_bytearray()
     
     # Backendga yuklash
-    result = await APIClient.upload_payment_receipt(user.id, bytes(image_bytes))
+    result = await api.upload_payment_receipt(user.id, bytes(image_bytes))
     
     if result and result.get('success'):
         context.user_data['waiting_for_receipt'] = False
@@ -463,8 +508,7 @@ async def handle_receipt_document(update: Update, context: ContextTypes.DEFAULT_
         )
 
         # Adminlarni xabardor qilish
-        from keyboards import receipt_verify_keyboard
-        admins = await APIClient.get_admins()
+        admins = await api.get_admins()
         admin_msg = f"""
         📄 <b>Yangi to'lov cheki (Fayl)!</b>
 
@@ -474,17 +518,7 @@ async def handle_receipt_document(update: Update, context: ContextTypes.DEFAULT_
 
         Iltimos, chekni tekshiring va tasdiqlang.
         """
-        for admin in admins:
-            try:
-                await context.bot.send_document(
-                    chat_id=admin['telegram_id'],
-                    document=doc.file_id,
-                    caption=admin_msg,
-                    reply_markup=receipt_verify_keyboard(receipt_id),
-                    parse_mode='HTML'
-                )
-            except Exception as e:
-                logger.error(f"Admin notification error (Doc): {e}")
+        await notify_admins_about_receipt(context, admins, 'sendDocument', admin_msg, doc.file_id, receipt_id)
     else:
         await update.message.reply_text("❌ Chekni yuklashda xatolik yuz berdi.")
 
@@ -494,7 +528,7 @@ async def help_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Foydalanish yo'riqnomasi handler
     """
-    settings = await APIClient.get_system_settings()
+    settings = await api.get_system_settings()
     support_link = settings.get('support_link')
     
     message = f"""
@@ -551,7 +585,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Test harakatlari
     elif data.startswith('finish_'):
         test_id = data.replace('finish_', '')
-        success = await APIClient.finish_test(test_id)
+        success = await api.finish_test(test_id)
         if success:
             await query.edit_message_text("✅ Test yakunlandi!")
         else:
@@ -561,7 +595,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         test_id = data.replace('download_', '')
         await query.edit_message_text("📥 PDF tayyorlanmoqda...")
         
-        pdf_content = await APIClient.download_test_report(test_id)
+        pdf_content = await api.download_test_report(test_id)
         if pdf_content:
             await query.message.reply_document(
                 document=pdf_content,
@@ -585,7 +619,7 @@ async def text_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         code = text.strip().upper()
         
         # API dan testni tekshirish
-        test = await APIClient.get_test_by_code(code)
+        test = await api.get_test_by_code(code)
         
         if test:
             user_data['waiting_for_code'] = False
@@ -0,0 +1,58 @@
+"""
+Updatelarni parallel qayta ishlash: turli foydalanuvchilarning updatelari bir vaqtda,
+bitta foydalanuvchiniki esa kelgan tartibida (ketma-ket) bajariladi.
+"""
+import asyncio
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# Bazaviy semafor faqat bir vaqtda kutayotgan updatelar sonini cheklaydi,
+# haqiqiy parallellik _workers semafori bilan boshqariladi
+QUEUE_FACTOR = 4
+
+
+def update_key(update):
+    """Tartib saqlanadigan kalit: foydalanuvchi, bo'lmasa chat"""
+    if isinstance(update, Update):
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Bitta foydalanuvchining updatelari uchun lock: u band bo'lsa keyingi update
+    ishchi o'rnini egallamasdan navbatda turadi, boshqa foydalanuvchilar kutmaydi.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates * QUEUE_FACTOR)
+        self.workers = max_concurrent_updates
+        self._workers = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._locks = {}  # key -> [lock, shu kalit bo'yicha kutayotgan/bajarilayotgan updatelar]
+
+    async def do_process_update(self, update, coroutine):
+        key = update_key(update)
+        if key is None:
+            async with self._workers:
+                await coroutine
+            return
+
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._workers:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                self._locks.pop(key, None)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -0,0 +1,71 @@
+"""
+Backend hodisalarini tinglash (Redis pub/sub): foydalanuvchi ma'lumotlari o'zgarganda
+bot keshidagi profil o'chiriladi. Redis sozlanmagan bo'lsa kesh faqat TTL bilan yangilanadi.
+"""
+import os
+import json
+import asyncio
+import logging
+from api_client import api
+
+logger = logging.getLogger(__name__)
+
+USER_EVENTS_REDIS_URL = os.getenv('USER_EVENTS_REDIS_URL', '')
+USER_EVENTS_CHANNEL = os.getenv('USER_EVENTS_CHANNEL', 'titul:user-events')
+
+_task = None
+
+
+def handle_event(event):
+    if event.get('type') == 'user_changed' and event.get('telegram_id'):
+        api.invalidate_profile(event['telegram_id'])
+
+
+async def listen():
+    import redis.asyncio as redis
+
+    delay = 1
+    while True:
+        client = redis.Redis.from_url(USER_EVENTS_REDIS_URL)
+        try:
+            async with client.pubsub() as pubsub:
+                await pubsub.subscribe(USER_EVENTS_CHANNEL)
+                logger.info(f"User events kanaliga ulandi: {USER_EVENTS_CHANNEL}")
+                # Ulanish uzilgan paytda o'tkazib yuborilgan hodisalar bo'lishi mumkin
+                api.profiles.clear()
+                delay = 1
+                async for message in pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+                    try:
+                        handle_event(json.loads(message['data']))
+                    except (ValueError, TypeError) as e:
+                        logger.warning(f"Noto'g'ri user event: {e}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"User events ulanish xatosi: {e}. {delay}s dan keyin qayta ulanadi")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+        finally:
+            await client.aclose()
+
+
+def start():
+    """Application post_init: tinglovchini fon vazifasi sifatida ishga tushirish"""
+    global _task
+    if not USER_EVENTS_REDIS_URL:
+        logger.info("USER_EVENTS_REDIS_URL berilmagan - profil keshi faqat TTL bilan yangilanadi")
+        return
+    _task = asyncio.get_running_loop().create_task(listen())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
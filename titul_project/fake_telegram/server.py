@@ -0,0 +1,341 @@
+"""
+Lokal soxta Telegram Bot API serveri (oflayn test va yuklama sinovlari uchun)
+
+Ishga tushirish:
+    python fake_telegram/server.py --port 8081 --latency 50 --rate-limit 30 --blocked-ratio 0.05
+
+Backend/botni unga yo'naltirish:
+    TELEGRAM_API_URL=http://localhost:8081
+
+Qo'shimcha endpointlar:
+    GET  /stats   - metodlar bo'yicha so'rovlar, soniyasiga so'rovlar, 429/403 soni
+    POST /config  - sozlamalarni ishlayotgan serverda o'zgartirish (JSON, Config maydonlari)
+    POST /updates - getUpdates orqali botga yetkaziladigan update qo'shish
+    POST /reset   - statistika va xabarlarni tozalash
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field, asdict, fields
+
+from aiohttp import web
+
+logger = logging.getLogger('fake_telegram')
+
+BOT_USER = {'id': 100000, 'is_bot': True, 'first_name': 'Fake Bot', 'username': 'fake_titul_bot'}
+
+
+@dataclass
+class Config:
+    latency: float = 0.0           # har bir javob kechikishi (ms)
+    jitter: float = 0.0            # kechikishga qo'shiladigan tasodifiy qism (ms)
+    rate_limit: int = 0            # soniyasiga ruxsat etilgan so'rovlar (0 - cheksiz), oshsa 429
+    retry_after: int = 1           # 429 javobidagi retry_after (soniya)
+    error_429_ratio: float = 0.0   # tasodifiy 429 ulushi (0..1)
+    blocked_ratio: float = 0.0     # botni bloklagan foydalanuvchilar ulushi (0..1, chat_id bo'yicha barqaror)
+    blocked: set = field(default_factory=set)       # botni bloklagan aniq chat_id lar
+    non_members: set = field(default_factory=set)   # getChatMember uchun kanalga a'zo bo'lmaganlar
+
+    def update(self, data):
+        for item in fields(self):
+            if item.name not in data:
+                continue
+            value = data[item.name]
+            if isinstance(getattr(self, item.name), set):
+                value = {int(v) for v in value}
+            else:
+                value = type(getattr(self, item.name))(value)
+            setattr(self, item.name, value)
+
+    def as_dict(self):
+        data = asdict(self)
+        data['blocked'] = sorted(self.blocked)
+        data['non_members'] = sorted(self.non_members)
+        return data
+
+
+class ApiError(Exception):
+    def __init__(self, code, description, parameters=None):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.parameters = parameters
+
+
+def inline_markup(params):
+    """Telegram javobda faqat inline klaviaturani qaytaradi (form so'rovlarda u JSON satr bo'ladi)"""
+    markup = params.get('reply_markup')
+    if isinstance(markup, str):
+        markup = json.loads(markup)
+    return markup if markup and 'inline_keyboard' in markup else None
+
+
+class FakeTelegram:
+    """Yuborilgan so'rovlarni xotirada saqlovchi soxta Bot API"""
+
+    def __init__(self, config=None):
+        self.config = config or Config()
+        self.reset()
+
+    def reset(self):
+        self.ids = itertools.count(1)
+        self.messages = {}  # (chat_id, message_id) -> message
+        self.files = {}     # file_id -> bytes
+        self.updates = []
+        self.update_ids = itertools.count(1)
+        self.new_update = asyncio.Event()
+        self.calls = Counter()
+        self.errors = Counter()
+        self.per_second = defaultdict(int)
+        self.window = (0, 0)  # (soniya, shu soniyadagi so'rovlar) - rate_limit uchun
+        self.started_at = time.time()
+
+    # --- Yordamchi funksiyalar ---
+
+    def message(self, chat_id, **fields):
+        message = {
+            'message_id': next(self.ids),
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private'},
+            'from': BOT_USER,
+            **{key: value for key, value in fields.items() if value is not None},
+        }
+        self.messages[(int(chat_id), message['message_id'])] = message
+        return message
+
+    def store_file(self, value):
+        """Yangi yuklangan fayl uchun file_id yaratish, mavjud file_id bo'lsa o'zini qaytarish"""
+        if isinstance(value, str):
+            return value
+        file_id = f"file{next(self.ids)}"
+        self.files[file_id] = value or b''
+        return file_id
+
+    def file(self, file_id):
+        return {
+            'file_id': file_id,
+            'file_unique_id': f"u{file_id}",
+            'file_size': len(self.files.get(file_id, b'')) or 1024,
+        }
+
+    def get_message(self, params):
+        key = (int(params['chat_id']), int(params['message_id']))
+        if key not in self.messages:
+            raise ApiError(400, 'Bad Request: message to edit not found')
+        return self.messages[key]
+
+    def is_blocked(self, chat_id):
+        chat_id = int(chat_id)
+        if chat_id in self.config.blocked:
+            return True
+        # Ulush chat_id bo'yicha barqaror: bir foydalanuvchi har doim bloklagan yoki bloklamagan
+        return self.config.blocked_ratio > 0 and (chat_id * 2654435761 % 1000) < self.config.blocked_ratio * 1000
+
+    def check_limits(self, method, params):
+        now = int(time.time())
+        second, count = self.window
+        count = count + 1 if second == now else 1
+        self.window = (now, count)
+
+        if self.config.rate_limit and count > self.config.rate_limit:
+            raise ApiError(429, f"Too Many Requests: retry after {self.config.retry_after}",
+                           {'retry_after': self.config.retry_after})
+        if self.config.error_429_ratio and random.random() < self.config.error_429_ratio:
+            raise ApiError(429, f"Too Many Requests: retry after {self.config.retry_after}",
+                           {'retry_after': self.config.retry_after})
+        if method.startswith(('send', 'edit', 'delete')) and 'chat_id' in params and self.is_blocked(params['chat_id']):
+            raise ApiError(403, 'Forbidden: bot was blocked by the user')
+
+    async def read_params(self, request):
+        """JSON, form yoki multipart so'rov parametrlarini o'qish (fayllar baytlar ko'rinishida)"""
+        params = dict(request.query)
+        if request.content_type == 'application/json':
+            params.update(await request.json())
+        elif request.can_read_body:
+            form = await request.post()
+            for key, value in form.items():
+                params[key] = value if isinstance(value, str) else value.file.read()
+        return params
+
+    # --- HTTP handlerlar ---
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        params = await self.read_params(request)
+        self.calls[method] += 1
+        self.per_second[int(time.time())] += 1
+
+        if self.config.latency or self.config.jitter:
+            await asyncio.sleep((self.config.latency + random.random() * self.config.jitter) / 1000)
+
+        try:
+            self.check_limits(method, params)
+            handler = getattr(self, f"method_{method}", None)
+            # Biz ishlatmaydigan metodlar (answerCallbackQuery, setMyCommands, ...) muvaffaqiyatli hisoblanadi
+            result = await handler(params) if handler else True
+        except ApiError as e:
+            self.errors[e.code] += 1
+            body = {'ok': False, 'error_code': e.code, 'description': e.description}
+            if e.parameters:
+                body['parameters'] = e.parameters
+            return web.json_response(body, status=e.code)
+        except (KeyError, ValueError) as e:
+            self.errors[400] += 1
+            return web.json_response({'ok': False, 'error_code': 400, 'description': f"Bad Request: {e}"}, status=400)
+
+        return web.json_response({'ok': True, 'result': result})
+
+    async def download(self, request):
+        file_id = request.match_info['path'].rsplit('/', 1)[-1]
+        if file_id not in self.files:
+            raise web.HTTPNotFound()
+        return web.Response(body=self.files[file_id])
+
+    async def stats(self, request):
+        seconds = sorted(self.per_second.items())
+        return web.json_response({
+            'calls': dict(self.calls),
+            'errors': {str(code): count for code, count in self.errors.items()},
+            'total': sum(self.calls.values()),
+            'max_per_second': max(self.per_second.values(), default=0),
+            'per_second': {str(second - int(self.started_at)): count for second, count in seconds[-120:]},
+            'config': self.config.as_dict(),
+        })
+
+    async def set_config(self, request):
+        self.config.update(await request.json())
+        return web.json_response(self.config.as_dict())
+
+    async def add_update(self, request):
+        """Botga yetkaziladigan update (message, callback_query va h.k.) qo'shish"""
+        update = await request.json()
+        update['update_id'] = next(self.update_ids)
+        self.updates.append(update)
+        self.new_update.set()
+        return web.json_response(update)
+
+    async def reset_state(self, request):
+        self.reset()
+        return web.json_response({'ok': True})
+
+    # --- Bot API metodlari ---
+
+    async def method_getMe(self, params):
+        return BOT_USER
+
+    async def method_sendMessage(self, params):
+        return self.message(params['chat_id'], text=params.get('text', ''), reply_markup=inline_markup(params))
+
+    async def method_sendPhoto(self, params):
+        file_id = self.store_file(params.get('photo'))
+        return self.message(params['chat_id'], photo=[self.file(file_id)], caption=params.get('caption'))
+
+    async def method_sendDocument(self, params):
+        file_id = self.store_file(params.get('document'))
+        return self.message(params['chat_id'], document=self.file(file_id), caption=params.get('caption'))
+
+    async def method_editMessageText(self, params):
+        message = self.get_message(params)
+        if message.get('text') == params.get('text'):
+            raise ApiError(400, 'Bad Request: message is not modified')
+        message['text'] = params.get('text', '')
+        message['edit_date'] = int(time.time())
+        return message
+
+    async def method_editMessageMedia(self, params):
+        message = self.get_message(params)
+        media = params['media'] if isinstance(params['media'], dict) else json.loads(params['media'])
+        value = media['media']
+        if isinstance(value, str) and value.startswith('attach://'):
+            value = params.get(value[len('attach://'):])
+        file_id = self.store_file(value)
+        message.pop('photo', None)
+        message.pop('document', None)
+        if media['type'] == 'photo':
+            message['photo'] = [self.file(file_id)]
+        else:
+            message['document'] = self.file(file_id)
+        if media.get('caption'):
+            message['caption'] = media['caption']
+        else:
+            message.pop('caption', None)
+        message['edit_date'] = int(time.time())
+        return message
+
+    async def method_deleteMessage(self, params):
+        key = (int(params['chat_id']), int(params['message_id']))
+        if self.messages.pop(key, None) is None:
+            raise ApiError(400, 'Bad Request: message to delete not found')
+        return True
+
+    async def method_getChatMember(self, params):
+        user_id = int(params['user_id'])
+        status = 'left' if user_id in self.config.non_members else 'member'
+        return {'status': status, 'user': {'id': user_id, 'is_bot': False, 'first_name': f"User {user_id}"}}
+
+    async def method_getFile(self, params):
+        file_id = params['file_id']
+        return {**self.file(file_id), 'file_path': f"documents/{file_id}"}
+
+    async def method_getUpdates(self, params):
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        self.updates = [update for update in self.updates if update['update_id'] >= offset]
+        if not self.updates and timeout:
+            self.new_update.clear()
+            try:
+                await asyncio.wait_for(self.new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get('limit') or 100)
+        return self.updates[:limit]
+
+
+def create_app(config=None):
+    fake = FakeTelegram(config)
+    app = web.Application(client_max_size=50 * 1024 * 1024)
+    app['fake'] = fake
+    app.router.add_get('/stats', fake.stats)
+    app.router.add_post('/config', fake.set_config)
+    app.router.add_post('/updates', fake.add_update)
+    app.router.add_post('/reset', fake.reset_state)
+    app.router.add_get('/file/bot{token}/{path:.*}', fake.download)
+    app.router.add_route('*', '/bot{token}/{method}', fake.handle)
+    return app
+
+
+def parse_ids(value):
+    return {int(item) for item in value.split(',') if item.strip()} if value else set()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Soxta Telegram Bot API serveri")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help="javob kechikishi (ms)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="tasodifiy qo'shimcha kechikish (ms)")
+    parser.add_argument('--rate-limit', type=int, default=0, help="soniyasiga so'rovlar limiti (oshsa 429)")
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--error-429-ratio', type=float, default=0.0, help="tasodifiy 429 ulushi (0..1)")
+    parser.add_argument('--blocked-ratio', type=float, default=0.0, help="botni bloklaganlar ulushi (0..1)")
+    parser.add_argument('--blocked', default='', help="botni bloklagan chat_id lar (vergul bilan)")
+    parser.add_argument('--non-members', default='', help="kanalga a'zo bo'lmagan user_id lar (vergul bilan)")
+    args = parser.parse_args()
+
+    config = Config(
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_limit=args.rate_limit,
+        retry_after=args.retry_after,
+        error_429_ratio=args.error_429_ratio,
+        blocked_ratio=args.blocked_ratio,
+        blocked=parse_ids(args.blocked),
+        non_members=parse_ids(args.non_members),
+    )
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    web.run_app(create_app(config), host=args.host, port=args.port)
@@ -3,23 +3,33 @@
 import { useState, useEffect, useRef } from "react";
 import { useParams, useRouter } from "next/navigation";
 import { motion, AnimatePresence } from "framer-motion";
-import { Megaphone, Send, ArrowLeft, CheckCircle2, AlertCircle, Loader2, Users, Target, Activity, Image as ImageIcon, File as FileIcon, Trash2, History, Clock, Edit3, X, Zap } from "lucide-react";
+import { Megaphone, Send, ArrowLeft, CheckCircle2, AlertCircle, Loader2, Users, Target, Activity, Image as ImageIcon, File as FileIcon, Trash2, History, Clock, Edit3, X, Zap, Undo2 } from "lucide-react";
 import api from "@/lib/api";
 import { toast } from "react-hot-toast";
 
 interface BroadcastStatus {
      id: number;
      message: string;
-     status: 'pending' | 'processing' | 'completed' | 'failed';
+     status: 'scheduled' | 'pending' | 'processing' | 'completed' | 'failed';
      total_users: number;
      success_count: number;
      fail_count: number;
      target_roles: string[];
+     scheduled_at: string | null;
      has_image: boolean;
      has_file: boolean;
+     recall_status: 'pending' | 'processing' | 'completed' | 'failed' | null;
+     recall_success_count: number;
+     recall_fail_count: number;
      created_at: string;
 }
 
+const SEGMENTS = [
+     { id: 'has_tests', label: 'Test yaratganlar' },
+     { id: 'has_balance', label: 'Balansi borlar' },
+     { id: 'reachable_only', label: 'Botni bloklamaganlar' },
+];
+
 const ROLES = [
      { id: 'all', label: 'Barchaga' },
      { id: 'teacher', label: 'O\'qituvchilar' },
@@ -37,6 +47,9 @@ export default function AdminBroadcast() {
      const [targetRoles, setTargetRoles] = useState<string[]>(['all']);
      const [image, setImage] = useState<File | null>(null);
      const [file, setFile] = useState<File | null>(null);
+     const [segment, setSegment] = useState<Record<string, boolean>>({});
+     const [activeDays, setActiveDays] = useState("");
+     const [scheduledAt, setScheduledAt] = useState("");
 
      // UI & Data State
      const [submitting, setSubmitting] = useState(false);
@@ -52,6 +65,40 @@ export default function AdminBroadcast() {
           return () => clearInterval(historyPoller);
      }, [userId]);
 
+     // Yuborilayotgan xabarlar progressini real vaqtda kuzatish (Server-Sent Events)
+     const streams = useRef<Record<number, EventSource>>({});
+
+     useEffect(() => {
+          history
+               .filter(item => (item.status === 'pending' || item.status === 'processing') && !streams.current[item.id])
+               .forEach(item => {
+                    const source = new EventSource(`${api.defaults.baseURL}/admin/broadcast/${item.id}/stream/?telegram_id=${userId}`);
+                    const close = () => {
+                         source.close();
+                         delete streams.current[item.id];
+                    };
+                    source.onmessage = (event) => {
+                         const data = JSON.parse(event.data);
+                         setHistory(prev => prev.map(h => h.id === item.id ? {
+                              ...h,
+                              status: data.status,
+                              total_users: data.total,
+                              success_count: data.sent,
+                              fail_count: data.failed
+                         } : h));
+                         if (data.status === 'completed' || data.status === 'failed') close();
+                    };
+                    // Server oqimni qisqa oynadan keyin yopadi - brauzer o'zi qayta ulanadi,
+                    // faqat ulanish butunlay yopilganda kuzatishni to'xtatamiz
+                    source.onerror = () => {
+                         if (source.readyState === EventSource.CLOSED) close();
+                    };
+                    streams.current[item.id] = source;
+               });
+     }, [history, userId]);
+
+     useEffect(() => () => Object.values(streams.current).forEach(source => source.close()), []);
+
      const fetchHistory = async () => {
           try {
                const res = await api.get("/admin/broadcast/history/", {
@@ -112,7 +159,8 @@ export default function AdminBroadcast() {
                     });
                     fetchHistory();
                } catch (err: any) {
-                    toast.error("Tahrirlashda xatolik yuz berdi");
+                    // 409 - xabar hali yuborilmoqda yoki boshqa tahrir/qaytarib olish ketmoqda
+                    toast.error(err.response?.data?.error || "Tahrirlashda xatolik yuz berdi");
                     setSubmitting(false);
                }
                return;
@@ -122,6 +170,8 @@ export default function AdminBroadcast() {
           const formData = new FormData();
           formData.append('message', message);
           formData.append('target_roles', JSON.stringify(targetRoles));
+          formData.append('segment', JSON.stringify({ ...segment, ...(activeDays ? { active_days: Number(activeDays) } : {}) }));
+          if (scheduledAt) formData.append('scheduled_at', new Date(scheduledAt).toISOString());
           if (image) formData.append('image', image);
           if (file) formData.append('file', file);
 
@@ -131,8 +181,11 @@ export default function AdminBroadcast() {
                setImage(null);
                setFile(null);
                setTargetRoles(['all']);
+               setSegment({});
+               setActiveDays("");
+               setScheduledAt("");
                setSubmitting(false);
-               toast.success("Xabar yuborish boshlandi (fonda)!");
+               toast.success(scheduledAt ? "Xabar rejalashtirildi!" : "Xabar yuborish boshlandi (fonda)!");
 
                await api.post("/admin/broadcast/", formData, {
                     headers: {
@@ -160,6 +213,19 @@ export default function AdminBroadcast() {
           }
      };
 
+     const handleRecall = async (id: number) => {
+          if (!confirm("Xabar barcha foydalanuvchilar chatidan o'chirilsinmi?")) return;
+          try {
+               await api.post(`/admin/broadcast/${id}/recall/`, {}, {
+                    headers: { 'X-Telegram-Id': String(userId) }
+               });
+               toast.success("Qaytarib olish boshlandi");
+               fetchHistory();
+          } catch (err: any) {
+               toast.error(err.response?.data?.error || "Xatolik");
+          }
+     };
+
      const startEdit = (item: BroadcastStatus) => {
           setEditMode(item.id);
           setMessage(item.message);
@@ -217,6 +283,39 @@ export default function AdminBroadcast() {
                                              </div>
                                         </div>
 
+                                        {!editMode && (
+                                             <div className="space-y-4">
+                                                  <label className="block text-[10px] font-black text-slate-400 uppercase tracking-[0.2em]">Segment</label>
+                                                  <div className="flex flex-wrap gap-2">
+                                                       {SEGMENTS.map((item) => (
+                                                            <button
+                                                                 key={item.id}
+                                                                 onClick={() => setSegment(prev => ({ ...prev, [item.id]: !prev[item.id] }))}
+                                                                 className={`px-4 py-2 rounded-2xl font-black text-xs transition-all ${segment[item.id] ? 'bg-primary text-white shadow-lg shadow-primary/30' : 'bg-slate-100 text-slate-400 hover:bg-slate-200'}`}
+                                                            >
+                                                                 {item.label}
+                                                            </button>
+                                                       ))}
+                                                  </div>
+                                                  <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
+                                                       <input
+                                                            type="number"
+                                                            min={1}
+                                                            value={activeDays}
+                                                            onChange={(e) => setActiveDays(e.target.value)}
+                                                            placeholder="Oxirgi N kunda faol"
+                                                            className="w-full p-4 rounded-2xl border-2 border-slate-50 bg-slate-50 focus:bg-white focus:border-primary outline-none transition-all font-bold text-xs text-slate-700"
+                                                       />
+                                                       <input
+                                                            type="datetime-local"
+                                                            value={scheduledAt}
+                                                            onChange={(e) => setScheduledAt(e.target.value)}
+                                                            className="w-full p-4 rounded-2xl border-2 border-slate-50 bg-slate-50 focus:bg-white focus:border-primary outline-none transition-all font-bold text-xs text-slate-700"
+                                                       />
+                                                  </div>
+                                             </div>
+                                        )}
+
                                         <div>
                                              <label className="block text-[10px] font-black text-slate-400 mb-3 uppercase tracking-[0.2em]">Xabar mazmuni</label>
                                              <textarea
@@ -259,7 +358,7 @@ export default function AdminBroadcast() {
                                                   }`}
                                         >
                                              {submitting ? <Loader2 className="animate-spin" size={28} /> : (editMode ? <CheckCircle2 size={28} /> : <Zap size={28} />)}
-                                             {submitting ? "Ishlanmoqda..." : (editMode ? "Saqlash va Fondan yangilash" : "Darhol yuborish")}
+                                             {submitting ? "Ishlanmoqda..." : (editMode ? "Saqlash va Fondan yangilash" : (scheduledAt ? "Rejalashtirish" : "Darhol yuborish"))}
                                         </button>
                                    </div>
                               </div>
@@ -297,12 +396,15 @@ export default function AdminBroadcast() {
                                                             <div className="flex gap-2">
                                                                  <span className={`text-[9px] font-black uppercase px-2.5 py-1 rounded-full ${item.status === 'completed' ? 'bg-emerald-100 text-emerald-600' :
                                                                       item.status === 'processing' ? 'bg-primary/20 text-primary animate-pulse' :
+                                                                      item.status === 'scheduled' ? 'bg-violet-100 text-violet-600' :
                                                                            'bg-amber-100 text-amber-600'
                                                                       }`}>
                                                                       {item.status}
                                                                  </span>
+                                                                 {item.status === 'scheduled' && item.scheduled_at && <span className="bg-violet-50 text-violet-600 text-[9px] font-black uppercase px-2.5 py-1 rounded-full flex items-center gap-1"><Clock size={10} /> {new Date(item.scheduled_at).toLocaleString()}</span>}
                                                                  {item.has_image && <span className="bg-indigo-100 text-indigo-600 text-[9px] font-black uppercase px-2.5 py-1 rounded-full flex items-center gap-1"><ImageIcon size={10} /> Image</span>}
                                                                  {item.has_file && <span className="bg-sky-100 text-sky-600 text-[9px] font-black uppercase px-2.5 py-1 rounded-full flex items-center gap-1"><FileIcon size={10} /> File</span>}
+                                                                 {item.recall_status && <span className="bg-rose-100 text-rose-600 text-[9px] font-black uppercase px-2.5 py-1 rounded-full flex items-center gap-1"><Undo2 size={10} /> {item.recall_status === 'completed' ? `${item.recall_success_count} o'chirildi` : 'Qaytarilmoqda'}</span>}
                                                             </div>
                                                             <span className="text-[10px] font-bold text-slate-300">{new Date(item.created_at).toLocaleTimeString()}</span>
                                                        </div>
@@ -329,6 +431,9 @@ export default function AdminBroadcast() {
                                                             <button onClick={() => startEdit(item)} className="p-3 bg-white text-amber-500 shadow-xl rounded-2xl hover:bg-amber-500 hover:text-white transition-all border border-amber-50">
                                                                  <Edit3 size={18} />
                                                             </button>
+                                                            <button onClick={() => handleRecall(item.id)} title="Qaytarib olish" className="p-3 bg-white text-slate-500 shadow-xl rounded-2xl hover:bg-slate-700 hover:text-white transition-all border border-slate-50">
+                                                                 <Undo2 size={18} />
+                                                            </button>
                                                             <button onClick={() => handleDelete(item.id)} className="p-3 bg-white text-rose-500 shadow-xl rounded-2xl hover:bg-rose-500 hover:text-white transition-all border border-rose-50">
                                                                  <Trash2 size={18} />
                                                             </button>
@@ -29,6 +29,7 @@ export default function CreateTestPage() {
      const [subject, setSubject] = useState(SUBJECTS[0]);
      const [expiresAt, setExpiresAt] = useState("");
      const [submissionMode, setSubmissionMode] = useState("single");
+     const [notifyMode, setNotifyMode] = useState("digest");
      const [subType, setSubType] = useState<string | null>(null);
 
      // Questions state refined for parts and alternatives
@@ -155,6 +156,7 @@ export default function CreateTestPage() {
                               setExpiresAt(localISOTime);
                          }
                          setSubmissionMode(test.submission_mode || "single");
+                         setNotifyMode(test.notify_mode || "digest");
 
                          // Map existing questions to our state
                          const existingQs = test.questions || [];
@@ -537,6 +539,7 @@ export default function CreateTestPage() {
                     subject,
                     sub_type: subType,
                     submission_mode: submissionMode,
+                    notify_mode: notifyMode,
                     expires_at: expiresAt ? new Date(expiresAt).toISOString() : null,
                     questions: questions.filter(q => {
                          if (q.question_type === 'choice') return q.correct_answer !== "";
@@ -817,6 +820,19 @@ export default function CreateTestPage() {
                                                   </select>
                                                   <ChevronDown size={20} className="absolute right-5 top-1/2 -translate-y-1/2 text-slate-400 pointer-events-none" />
                                              </div>
+                                             <label className="text-sm font-bold text-slate-500 ml-1 uppercase tracking-wider">Natijalar haqida xabar</label>
+                                             <div className="relative">
+                                                  <select
+                                                       className="select-premium"
+                                                       value={notifyMode}
+                                                       onChange={(e) => setNotifyMode(e.target.value)}
+                                                  >
+                                                       <option value="digest">📥 Jamlab yuborish (har daqiqada)</option>
+                                                       <option value="each">🔔 Har bir natija haqida</option>
+                                                       <option value="off">🔕 Xabar yubormaslik</option>
+                                                  </select>
+                                                  <ChevronDown size={20} className="absolute right-5 top-1/2 -translate-y-1/2 text-slate-400 pointer-events-none" />
+                                             </div>
                                              <div className="space-y-3">
                                                   <label className="text-sm font-bold text-slate-500 ml-1 uppercase tracking-wider flex items-center gap-2">
                                                        <Clock size={16} className="text-amber-500" /> Test Tugash Vaqti (Ixtiyoriy)
@@ -100,7 +100,10 @@ export default function TestDetailPage() {
           try {
                const [testRes, subRes] = await Promise.all([
                     api.get(`/tests/${id}/`),
-                    api.get(`/submissions/test/${id}/`)
+                    api.get(`/submissions/test/${id}/`, {
+                         // Jadval uchun kerakli ustunlar; javoblar tahlil ochilganda alohida yuklanadi
+                         params: { fields: 'id,student_telegram_id,student_name,attempt_number,correct_count,wrong_count,score,scaled_score,grade,submitted_at' }
+                    })
                ]);
                setTest(testRes.data);
                setSubmissions(subRes.data);
@@ -214,9 +217,15 @@ export default function TestDetailPage() {
           }
      };
 
-     const openAnalysis = (submission: any) => {
-          setSelectedSubmission(submission);
-          setIsAnalysisOpen(true);
+     const openAnalysis = async (submission: any) => {
+          // Ro'yxatda javoblar yo'q - to'liq natija faqat tahlil ochilganda yuklanadi
+          try {
+               const response = await api.get(`/submissions/${submission.id}/`);
+               setSelectedSubmission({ ...submission, ...response.data });
+               setIsAnalysisOpen(true);
+          } catch (err) {
+               toast.error("Natijani yuklashda xatolik!");
+          }
      };
 
      if (loading) return (
@@ -33,6 +33,8 @@ export default function SubmitTestPage() {
      const [focusedInput, setFocusedInput] = useState<{ qIndex: number; pIndex: number; isPoints?: boolean } | null>(null);
      const [keyboardVisible, setKeyboardVisible] = useState(false);
      const inputRefs = useRef<{ [key: string]: HTMLInputElement | null }>({});
+     // Idempotency-Key: tarmoq xatosidan keyin qayta yuborishda bir xil kalit - natija ikki marta yozilmaydi
+     const submitKeyRef = useRef<string | null>(null);
 
      // Scroll focused input into view when keyboard opens
      useEffect(() => {
@@ -261,6 +263,16 @@ export default function SubmitTestPage() {
           }, 0);
      }, [focusedInput]);
 
+     const waitForIntake = async (receiptId: string) => {
+          for (let i = 0; i < 60; i++) {
+               await new Promise(r => setTimeout(r, 2000));
+               const { data } = await api.get(`/submissions/intake/${receiptId}/`);
+               if (data.status === 'done') return data.submission;
+               if (data.status === 'rejected') throw { response: { data: { detail: data.error } } };
+          }
+          return null;
+     };
+
      const handleSubmit = async () => {
           const unanswered = answers.filter((a, idx) => {
                const q = test.questions[idx];
@@ -297,11 +309,29 @@ export default function SubmitTestPage() {
                          return acc;
                     }, {})
                };
-               const response = await api.post("/submissions/", payload);
-               setResult(response.data);
+               if (!submitKeyRef.current) {
+                    submitKeyRef.current = typeof crypto !== 'undefined' && crypto.randomUUID
+                         ? crypto.randomUUID()
+                         : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+               }
+               const response = await api.post("/submissions/", payload, {
+                    headers: { "Idempotency-Key": submitKeyRef.current }
+               });
+               submitKeyRef.current = null;
+               // 202 - javoblar navbatga qabul qilindi, natija tayyor bo'lguncha holat so'raladi
+               const submission = response.status === 202
+                    ? await waitForIntake(response.data.receipt_id)
+                    : response.data;
+               if (!submission) {
+                    toast.success("Javoblaringiz qabul qilindi! Natija tez orada tayyor bo'ladi.");
+                    return;
+               }
+               setResult(submission);
                window.scrollTo({ top: 0, behavior: 'smooth' });
                toast.success("Javoblar muvaffaqiyatli yuborildi!");
           } catch (err: any) {
+               // Server so'rovni rad etgan bo'lsa keyingi urinish yangi so'rov hisoblanadi
+               if (err.response && err.response.status < 500) submitKeyRef.current = null;
                let errorMsg = "Xatolik yuz berdi!";
 
                if (err.response?.data) {